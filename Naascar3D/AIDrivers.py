@@ -0,0 +1,129 @@
+import numpy as np
+
+from VehicleState import VehicleState
+
+
+class AIDrivers:
+    '''
+    Pure pursuit drivers for any number of cars, all evaluated at once in NumPy. keys() takes the cars' positions,
+    directions and speeds as arrays and returns (left, right, up, down) as boolean arrays: the inputs of
+    VehicleBatch.update, or per car the tuple VehicleState.update takes (see drive()).
+
+    Each car looks ahead along the track's racing line (or centre line, racing_line=False) by a distance that grows
+    with its speed and steers for that point: pure pursuit asks for the curvature 2 * side / distance^2 through it,
+    and since steering is a key that is either down or not, the car turns while that is more than STEER_DEADBAND of
+    the curvature it can turn at. Speeds are planned once per track: the fastest the car can take the curvature at
+    each point of the line (see GRIP), lowered before turns so braking reaches it in time. Cars hold the throttle below the plan for a little way ahead and brake above it.
+    A car off the track has no point on the line to look for: it steers for the next tile of the track's flow field
+    instead, at RECOVERY_SPEED, until it is back on.
+    '''
+    LOOKAHEAD_TIME = 0.4          # seconds of driving to look ahead
+    MIN_LOOKAHEAD = 6.0
+    MAX_LOOKAHEAD = 24.0
+    STEER_DEADBAND = 0.5          # of the curvature the car can turn at
+    GRIP = 1.3                    # line curvature the plan allows over what the car turns at: looking ahead cuts inside
+                                  # the line's sharpest points. The fastest laps on tracks 1, 2 and 0 that touch no wall
+    BRAKING = VehicleState.ACCELERATION * 2
+    REACTION_TIME = 0.1           # seconds ahead to read the speed plan
+    BRAKE_MARGIN = 1.0
+    RECOVERY_SPEED = 16.0
+
+    def __init__(self, track, racing_line=True):
+        self.progress = track.progress_index
+        self.flow_field = track.flow_field
+        if racing_line:
+            self.line = track.racing_line
+            self.line_distance = lambda centre: self.line.from_centre(centre)
+        else:
+            self.line = track.centreline
+            self.line_distance = lambda centre: np.asarray(centre) % self.line.length
+        self.speed_plan = self.plan_speeds()
+
+    @staticmethod
+    def turn_curvature(speed):
+        ''' Curvature (1 / radius) a car turns at when holding a steering key at speed (VehicleState.compute_steer_factor) '''
+        v = np.abs(speed)
+        ratio = np.minimum(v / VehicleState.MAX_SPEED, 1.0) ** VehicleState.STEER_RESPONSE_EXP
+        factor = VehicleState.STEER_MIN_FACTOR + ratio * (VehicleState.STEER_MAX_FACTOR - VehicleState.STEER_MIN_FACTOR)
+        return np.where(v > VehicleState.STEER_MIN_SPEED, VehicleState.TURN_SPEED * factor / np.maximum(v, 1e-9), 0.0)
+
+    def plan_speeds(self):
+        ''' Target speed at every point of the line (closed like the line's arrays) '''
+        line = self.line
+        curvature = np.abs(line.curvature) if hasattr(line, "curvature") else self.centreline_curvature()
+        # fastest speed each curvature can be taken at, from a table of speeds
+        speeds = np.linspace(0.5, VehicleState.MAX_SPEED, 280)
+        reach = self.turn_curvature(speeds) * self.GRIP
+        fits = reach[None, :] >= curvature[:, None]
+        limit = np.where(fits.any(axis=1), speeds[np.where(fits, np.arange(len(speeds)), 0).max(axis=1)], speeds[0])
+
+        # then back from every turn, as fast as braking can still slow down for it: twice round for the lap's wrap
+        plan = limit.copy()
+        step_squared = 2 * self.BRAKING * line.step
+        count = len(plan) - 1
+        for i in list(range(count - 1, -1, -1)) * 2:
+            after = plan[i + 1] if i + 1 < count else plan[0]
+            plan[i] = min(plan[i], (after * after + step_squared) ** 0.5)
+        plan[count] = plan[0]
+        return plan
+
+    def centreline_curvature(self):
+        ''' Centreline has no curvature array, it is how fast its heading turns '''
+        line = self.line
+        heading = np.unwrap(np.arctan2(line.tangent_z, line.tangent_x))
+        return np.abs(np.gradient(heading, line.step))
+
+    def sample(self, distances, name):
+        ''' Per-point array name of the line (or the speed plan) at line distances, linear between points '''
+        line = self.line
+        values = self.speed_plan if name == "speed_plan" else getattr(line, name)
+        position = (np.asarray(distances) % line.length) / line.step
+        i = np.minimum(position.astype(np.int64), len(values) - 2)
+        return values[i] + (values[i + 1] - values[i]) * (position - i)
+
+    def locate(self, x, z, last=None):
+        ''' Line distance level with each car, keeping last where a car is off the track '''
+        centre = self.progress.distances(x, z)
+        off_track = np.isnan(centre)
+        distance = self.line_distance(np.nan_to_num(centre) + self.progress.finish)
+        return np.where(off_track, 0.0 if last is None else last, distance)
+
+    def keys(self, x, z, dir_x, dir_z, speed, distance=None):
+        '''
+        (left, right, up, down) boolean arrays for cars at (x, z) facing (dir_x, dir_z) at speed. distance is the
+        line distance level with each car if the caller already knows it (see locate), e.g. from the last frame.
+        '''
+        if distance is None:
+            distance = self.locate(x, z)
+        speed = np.asarray(speed, dtype=np.float64)
+        lookahead = np.clip(np.abs(speed) * self.LOOKAHEAD_TIME, self.MIN_LOOKAHEAD, self.MAX_LOOKAHEAD)
+        target_x = self.sample(distance + lookahead, "x")
+        target_z = self.sample(distance + lookahead, "z")
+        off_track = ~self.flow_field.on_track(x, z)
+        if off_track.any():
+            waypoint_x, waypoint_z = self.flow_field.waypoints(x, z)
+            target_x = np.where(off_track, waypoint_x, target_x)
+            target_z = np.where(off_track, waypoint_z, target_z)
+
+        to_x, to_z = target_x - x, target_z - z
+        side = dir_x * to_z - dir_z * to_x # > 0: the target is to the right, the way turn_right turns
+        ahead = dir_x * to_x + dir_z * to_z
+        wanted = 2 * side / np.maximum(to_x * to_x + to_z * to_z, 1e-9) # pure pursuit curvature, > 0 to the right
+        steer = (np.abs(wanted) > self.turn_curvature(speed) * self.STEER_DEADBAND) | (ahead < 0.0)
+        right = steer & (side > 0.0)
+        left = steer & ~right
+
+        target_speed = self.sample(distance + np.maximum(speed, 0.0) * self.REACTION_TIME, "speed_plan")
+        target_speed = np.where(off_track, self.RECOVERY_SPEED, target_speed)
+        up = speed < target_speed
+        down = speed > target_speed + self.BRAKE_MARGIN
+        return left, right, up, down
+
+    def drive(self, vehicles):
+        ''' keys() for a list of VehicleStates, as one (left, right, up, down) tuple per car '''
+        x = np.array([vehicle.position.x for vehicle in vehicles])
+        z = np.array([vehicle.position.z for vehicle in vehicles])
+        dir_x = np.array([vehicle.direction.x for vehicle in vehicles])
+        dir_z = np.array([vehicle.direction.z for vehicle in vehicles])
+        speed = np.array([vehicle.speed for vehicle in vehicles])
+        return [tuple(bool(k) for k in keys) for keys in zip(*self.keys(x, z, dir_x, dir_z, speed))]
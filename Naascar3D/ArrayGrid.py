@@ -0,0 +1,193 @@
+from random import Random, randint
+import numpy as np
+
+from Geometry import Point, Coordinate
+from BitGrid import BitGrid
+from Grid import Grid, Cell
+from LoopGrower import LoopGrower
+
+
+class ArrayCell(Cell):
+    '''
+    Thin view of one track cell of an ArrayGrid. It has the same attributes as a Cell, but reads and writes them
+    straight from the grid's arrays, so views can be created and dropped freely.
+    '''
+    def __init__(self, grid, n):
+        self.grid = grid
+        self.n = n
+
+    @property
+    def x(self):
+        return int(self.grid.xs[self.n])
+
+    @property
+    def y(self):
+        return int(self.grid.ys[self.n])
+
+    @property
+    def key(self):
+        return (self.x, self.y)
+
+    @property
+    def type(self):
+        return BitGrid.TYPES[self.grid.types[self.n]]
+
+    @type.setter
+    def type(self, type):
+        self.grid.types[self.n] = BitGrid.TYPE_CODES[type]
+
+    @property
+    def direction(self):
+        return Coordinate(*BitGrid.DIRECTIONS[self.grid.directions[self.n]])
+
+    @direction.setter
+    def direction(self, direction):
+        self.grid.directions[self.n] = BitGrid.DIRECTIONS.index((direction.x, direction.y))
+
+    @property
+    def powerup(self):
+        return BitGrid.POWERUPS[self.grid.powerups[self.n]]
+
+    @powerup.setter
+    def powerup(self, powerup):
+        self.grid.powerups[self.n] = BitGrid.POWERUP_CODES[powerup]
+
+    @property
+    def next(self):
+        return ArrayCell(self.grid, int(self.grid.next[self.n]))
+
+    @property
+    def real_center(self):
+        return Point(*self.grid.real_center[self.n])
+
+    @real_center.setter
+    def real_center(self, point):
+        self.grid.real_center[self.n] = (point.x, point.y, point.z)
+
+    @property
+    def real_enter(self):
+        return Point(*self.grid.real_enter[self.n])
+
+    @real_enter.setter
+    def real_enter(self, point):
+        self.grid.real_enter[self.n] = (point.x, point.y, point.z)
+
+    @property
+    def real_exit(self):
+        return Point(*self.grid.real_exit[self.n])
+
+    @real_exit.setter
+    def real_exit(self, point):
+        self.grid.real_exit[self.n] = (point.x, point.y, point.z)
+
+    def __repr__(self):
+        return f"ArrayCell({self.x}, {self.y})"
+
+
+class ArrayGrid(Grid):
+    '''
+    Grid for large worlds (64x64, 256x256, ...). Only the cells of the track are stored, as NumPy arrays in
+    driving order (index 0 is the start cell), so memory and per-frame work grow with the track length instead
+    of the grid area. get_cell() returns ArrayCell views for track cells and a plain empty Cell anywhere else.
+    '''
+    def __init__(self, settings = {"size":64, "min_length":100, "max_length":200, "seed":None}):
+        self.size = settings["size"]
+        self.min_length = settings["min_length"]
+        self.max_length = settings["max_length"]
+        self.backend = "bitboard"
+        self.algorithm = settings.get("algorithm", "dfs")
+
+        self.seed = settings.get("seed")
+        if self.seed is None:
+            self.seed = randint(0, 2**31 - 1)
+        self.random = Random(self.seed)
+
+        self.clear()
+
+    def clear(self):
+        self.set_track([], [], [], [], [])
+
+    def set_track(self, xs, ys, types, directions, powerups):
+        ''' Replaces the track with the given cells, listed in driving order starting with the start cell '''
+        length = len(xs)
+        self.xs = np.array(xs, dtype=np.int32)
+        self.ys = np.array(ys, dtype=np.int32)
+        self.types = np.array(types, dtype=np.uint8)
+        self.directions = np.array(directions, dtype=np.uint8)
+        self.powerups = np.array(powerups, dtype=np.uint8)
+        self.next = (np.arange(length, dtype=np.int32) + 1) % max(length, 1)
+        self.real_center = np.zeros((length, 3))
+        self.real_enter = np.zeros((length, 3))
+        self.real_exit = np.zeros((length, 3))
+
+        # (y * size + x) -> index along the track, only for cells on the track
+        self.index_of = {int(y) * self.size + int(x): n for n, (x, y) in enumerate(zip(xs, ys))}
+        self.start = ArrayCell(self, 0) if length else None
+        self.length = max(length, 1)
+
+    def get_cell(self, pos):
+        if pos.x < 0 or pos.x >= self.size or pos.y < 0 or pos.y >= self.size:
+            return None
+        n = self.index_of.get(pos.y * self.size + pos.x)
+        if n is None:
+            return Cell(pos.x, pos.y)
+        return ArrayCell(self, n)
+
+    def get_type(self, x, y):
+        if x < 0 or x >= self.size or y < 0 or y >= self.size:
+            return BitGrid.XX
+        n = self.index_of.get(y * self.size + x)
+        if n is None:
+            return BitGrid.XX
+        return int(self.types[n])
+
+    def chain(self):
+        return [ArrayCell(self, n) for n in range(len(self.xs))]
+
+    def generate_random_track(self):
+        self.check_length_range()
+        self.random.seed(self.seed)
+        if self.algorithm == "grow":
+            self.load_layout(LoopGrower(self.size, self.min_length, self.max_length, self.random).generate_track())
+            print(f"Generated {self.length} cell track on a {self.size}x{self.size} grid")
+            return
+
+        # The BitGrid is only needed while searching, afterwards only the track's cells are kept
+        bitboard = BitGrid(self.size, self.min_length, self.max_length, self.random)
+        self.search_bitboard(bitboard)
+        self.load_bitboard(bitboard)
+        print(f"Generated {self.length} cell track on a {self.size}x{self.size} grid")
+
+    def load_bitboard(self, bitboard):
+        indices = bitboard.chain()
+        self.set_track(
+            [bitboard.xs[i] for i in indices],
+            [bitboard.ys[i] for i in indices],
+            [bitboard.types[i] for i in indices],
+            [bitboard.directions[i] for i in indices],
+            [bitboard.powerups[i] for i in indices]
+        )
+
+    def load_preset(self, data):
+        print("Loading preset")
+        self.load_layout(data)
+
+    def load_layout(self, data):
+        xs, ys, types, directions, powerups = [], [], [], [], []
+        prev_direction = data["direction"]
+        pos = data["start"]
+        for type in data["layout"]:
+            direction = self.get_next_direction(type[:2], prev_direction)
+            xs.append(pos.x)
+            ys.append(pos.y)
+            types.append(BitGrid.TYPE_CODES[type[:2]])
+            directions.append(BitGrid.DIRECTIONS.index((direction.x, direction.y)))
+            powerups.append(BitGrid.POWERUP_CODES[type[2] if len(type) == 3 else None])
+            pos += direction
+            prev_direction = direction
+        self.set_track(xs, ys, types, directions, powerups)
+
+    def __str__(self):
+        if self.size > 16:
+            return f"ArrayGrid({self.size}x{self.size}, {self.length} cell track starting at ({self.start.x}, {self.start.y}))"
+        return super().__str__()
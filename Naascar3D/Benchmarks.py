@@ -0,0 +1,679 @@
+import contextlib
+import io
+import math
+import multiprocessing
+import random
+import time
+import tracemalloc
+import numpy as np
+
+from AIDrivers import AIDrivers
+from ArrayGrid import ArrayGrid
+from Centreline import Centreline
+from Geometry import Coordinate, Point, Vector
+from CarCollisions import collide_cars, sweep_and_prune
+from FlowField import FlowField
+from GhostState import GhostState
+from Grid import Grid
+from LapCounter import BatchLapCounter, LapCounter
+from Physics3D import Physics3D
+from RaceEnv import RaceEnv, VectorRaceEnv
+from PickupsState import PickupEntity, PickupsState
+from SpatialHash import SpatialHash
+from TileSDF import TileSDF
+from TrackLayout import TrackLayout
+from TrackProgress import TrackProgress
+from VehicleBatch import VehicleBatch
+from VehicleState import VehicleState
+
+# Run from the Naascar3D folder:  python Benchmarks.py
+
+
+# ------------------------------------------ Track generation ------------------------------------------
+def _time_generation(algorithm, min_length, max_length, seed, queue, size=8):
+    grid = Grid(settings = {"size": size, "min_length": min_length, "max_length": max_length, "seed": seed, "algorithm": "grow" if algorithm == "grow" else "dfs"})
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if algorithm == "dfs":
+            grid.set_random_start()
+            grid.dfs(grid.start.next, grid.start.direction, 1)
+        else:
+            grid.generate_random_track()
+    queue.put(time.perf_counter() - start)
+
+def time_generation(algorithm, min_length, max_length, seed, timeout, size=8):
+    ''' Times one generation in a separate process, so a gridlocked search can be killed after `timeout` seconds '''
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_time_generation, args=(algorithm, min_length, max_length, seed, queue, size))
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        return None
+    return queue.get()
+
+def benchmark_track_generation(lengths=((6, 10), (12, 24), (16, 24), (24, 32), (32, 48)), runs=5, timeout=10.0):
+    print("---------------------------------- Track generation (8x8) ----------------------------------")
+    print(f"{'min':>4} {'max':>4} | {'dfs avg':>10} {'timeouts':>9} | {'pruned avg':>10} {'pruned max':>10}")
+    for min_length, max_length in lengths:
+        dfs_times = []
+        pruned_times = []
+        for seed in range(runs):
+            dfs_times.append(time_generation("dfs", min_length, max_length, seed, timeout))
+            pruned_times.append(time_generation("pruned", min_length, max_length, seed, timeout))
+
+        finished = [t for t in dfs_times if t is not None]
+        dfs_avg = f"{sum(finished) / len(finished) * 1000:8.1f}ms" if finished else "       -  "
+        pruned_avg = sum(pruned_times) / len(pruned_times) * 1000
+        print(f"{min_length:>4} {max_length:>4} | {dfs_avg} {runs - len(finished):>9} | {pruned_avg:8.2f}ms {max(pruned_times) * 1000:8.2f}ms")
+    print(f"(dfs runs longer than {timeout}s count as timeouts and are left out of the average)")
+
+def benchmark_track_algorithms(cases=((8, 24, 32), (8, 48, 63), (16, 96, 128), (16, 200, 255), (32, 400, 512), (32, 800, 1023)), runs=3, timeout=5.0):
+    ''' Pruned DFS against LoopGrower, from half full grids up to tracks through (nearly) every cell '''
+    print("------------------------------- Track algorithms: dfs vs grow -------------------------------")
+    print(f"{'size':>5} {'min':>5} {'max':>5} | {'dfs avg':>10} {'timeouts':>9} | {'grow avg':>10} {'grow max':>10}")
+    for size, min_length, max_length in cases:
+        dfs_times = []
+        grow_times = []
+        for seed in range(runs):
+            dfs_times.append(time_generation("pruned", min_length, max_length, seed, timeout, size))
+            grow_times.append(time_generation("grow", min_length, max_length, seed, timeout, size))
+
+        finished = [t for t in dfs_times if t is not None]
+        dfs_avg = f"{sum(finished) / len(finished) * 1000:8.1f}ms" if finished else "       -  "
+        grow_avg = sum(grow_times) / len(grow_times) * 1000
+        print(f"{size:>5} {min_length:>5} {max_length:>5} | {dfs_avg} {runs - len(finished):>9} | {grow_avg:8.2f}ms {max(grow_times) * 1000:8.2f}ms")
+    print(f"(dfs runs longer than {timeout}s count as timeouts and are left out of the average)")
+
+
+# ------------------------------------------ Grid backends ------------------------------------------
+def _count_candidates(grid, obj):
+    ''' Runs one generation while counting can_close_from calls, i.e. placements that reach the full check '''
+    count = [0]
+    can_close_from = obj.can_close_from
+    def counted(*args):
+        count[0] += 1
+        return can_close_from(*args)
+    obj.can_close_from = counted
+    grid.generate_random_track()
+    del obj.can_close_from
+    return count[0]
+
+def benchmark_grid_backends(lengths=((12, 24), (24, 40), (40, 56)), runs=20):
+    ''' Both backends make the same random choices, so for a given seed they evaluate exactly the same placements '''
+    print("------------------------------- Grid backends: cells vs bitboard -------------------------------")
+    print(f"{'min':>4} {'max':>4} | {'candidates':>10} | {'cells/s':>10} {'bitboard/s':>10} | {'speedup':>7}")
+    for min_length, max_length in lengths:
+        rates = {}
+        candidates = 0
+        for backend in ("cells", "bitboard"):
+            elapsed = 0.0
+            candidates = 0
+            for seed in range(runs):
+                settings = {"size": 8, "min_length": min_length, "max_length": max_length, "backend": backend, "seed": seed}
+                with contextlib.redirect_stdout(io.StringIO()):
+                    grid = Grid(settings)
+                    candidates += _count_candidates(grid, grid if backend == "cells" else grid.bitboard)
+
+                    grid = Grid(settings)
+                    start = time.perf_counter()
+                    grid.generate_random_track()
+                    elapsed += time.perf_counter() - start
+            rates[backend] = candidates / elapsed
+        print(f"{min_length:>4} {max_length:>4} | {candidates:>10} | {rates['cells']:>10.0f} {rates['bitboard']:>10.0f} | {rates['bitboard'] / rates['cells']:>6.1f}x")
+
+    # Tile type lookups as done by Physics3D every frame
+    grid = Grid()
+    with contextlib.redirect_stdout(io.StringIO()):
+        grid.generate_random_track()
+    lookups = 200000
+    tiles = [(random.randint(0, 7), random.randint(0, 7)) for _ in range(lookups)]
+    start = time.perf_counter()
+    for x, y in tiles:
+        grid.get_cell(Coordinate(x, y)).type
+    cells_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for x, y in tiles:
+        grid.bitboard.get_type(x, y)
+    bitboard_time = time.perf_counter() - start
+    print(f"tile lookups/s: cells {lookups / cells_time:.0f}, bitboard {lookups / bitboard_time:.0f} ({cells_time / bitboard_time:.1f}x)")
+
+
+# ------------------------------------------ Grid storage ------------------------------------------
+def _load_grid(grid_class, size, min_length, max_length):
+    ''' Everything TrackLayout.__init__ does with the grid: build it, generate, set real world coordinates, list the tiles to draw, measure the centre line, index progress, lay the flow field, compile collision tables '''
+    grid = grid_class(settings = {"size": size, "min_length": min_length, "max_length": max_length, "seed": 1})
+    with contextlib.redirect_stdout(io.StringIO()):
+        grid.generate_random_track()
+    track = TrackLayout.__new__(TrackLayout) # a grid of the given class instead of a generated or cached one
+    track.Grid = grid
+    track.tile_size = 32.0
+    track.set_cells_real_coords()
+    track.track_tiles = [(cell.x, cell.y, cell.type) for cell in grid.chain()]
+    track.centreline = Centreline(grid.chain(), track.tile_size)
+    track.grid_size = size
+    track.progress_index = TrackProgress(track)
+    track.flow_field = FlowField(track)
+    track.tile_sdf = TileSDF(track.tile_size, TrackLayout.TILE_WALLS)
+    track.compile_collision_table()
+    return track
+
+def benchmark_grid_storage(sizes=((8, 12, 24), (64, 100, 200), (256, 200, 400))):
+    print("--------------------------------- Grid storage: cells vs arrays ---------------------------------")
+    print(f"{'size':>5} {'length':>7} | {'storage':>7} | {'startup':>9} {'memory':>9} {'peak':>9} | {'tiles drawn':>11}")
+    for size, min_length, max_length in sizes:
+        for name, grid_class in (("cells", Grid), ("arrays", ArrayGrid)):
+            start = time.perf_counter()
+            track = _load_grid(grid_class, size, min_length, max_length)
+            startup = time.perf_counter() - start
+            del track
+
+            tracemalloc.start()
+            track = _load_grid(grid_class, size, min_length, max_length)
+            memory, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            # The old Track.draw visited all size*size tiles every frame
+            print(f"{size:>5} {track.Grid.length:>7} | {name:>7} | {startup * 1000:7.1f}ms {memory / 1024:7.0f}KB {peak / 1024:7.0f}KB | {len(track.track_tiles):>11}")
+            del track
+
+
+
+# ------------------------------------------ Collision ------------------------------------------
+class _Car:
+    ''' Just the parts of VehicleState that Physics3D uses '''
+    MAX_SPEED = 70.0
+    MIN_SPEED = -20.0
+
+    def __init__(self):
+        self.position = Point(0, 0, 0)
+        self.direction = Vector(1, 0, 0)
+        self.hitbox_size = 2.0
+        self.speed = 50.0
+
+def _enforce_track_bounds_by_type(physics):
+    ''' Physics3D.enforce_track_bounds before the collision tables: Coordinate lookup, bounds and string dispatch per call '''
+    physics.update_current_tile()
+    cell = physics.track.get_cell(Coordinate(physics.curr_tile[0], physics.curr_tile[1]))
+    if cell is None or cell.type == "XX":
+        return
+    tile_min_x = cell.x * physics.track.tile_size
+    tile_min_y = cell.y * physics.track.tile_size
+    tile_max_x = (cell.x + 1) * physics.track.tile_size
+    tile_max_y = (cell.y + 1) * physics.track.tile_size
+    car_x, car_y = physics.vehicle.position.z, physics.vehicle.position.x
+    hitbox = physics.vehicle.hitbox_size
+    if cell.type in ("h0", "h1"):
+        if car_y - hitbox < tile_min_y: physics.collide(0, 1)
+        elif car_y + hitbox > tile_max_y: physics.collide(0, -1)
+    elif cell.type in ("v0", "v1"):
+        if car_x - hitbox < tile_min_x: physics.collide(1, 0)
+        elif car_x + hitbox > tile_max_x: physics.collide(-1, 0)
+    elif cell.type == "d0":
+        if car_x - hitbox < tile_min_x: physics.collide(1, 0)
+        elif car_y + hitbox > tile_max_y: physics.collide(0, -1)
+    elif cell.type == "d1":
+        if car_x + hitbox > tile_max_x: physics.collide(-1, 0)
+        elif car_y + hitbox > tile_max_y: physics.collide(0, -1)
+    elif cell.type == "d2":
+        if car_x + hitbox > tile_max_x: physics.collide(-1, 0)
+        elif car_y - hitbox < tile_min_y: physics.collide(0, 1)
+    elif cell.type == "d3":
+        if car_x - hitbox < tile_min_x: physics.collide(1, 0)
+        elif car_y - hitbox < tile_min_y: physics.collide(0, 1)
+
+def _enforce_track_bounds_by_table(physics):
+    ''' Physics3D.enforce_track_bounds with the collision tables only: the walls of the tile the car ended up on, one bounce '''
+    physics.update_current_tile()
+    walls = physics.tile_walls(*physics.curr_tile)
+    if walls is None:
+        return
+    car_x, car_y = physics.vehicle.position.z, physics.vehicle.position.x
+    hitbox = physics.vehicle.hitbox_size
+    for nx, ny, d in walls:
+        if nx * car_x + ny * car_y - d < hitbox:
+            physics.collide(nx, ny)
+            return
+
+def _enforce_track_bounds_swept(physics):
+    ''' The hitbox swept tile by tile (tiles_crossed) over every step, also the ones that stay in one tile '''
+    position = physics.vehicle.position
+    x0, y0, x1, y1 = physics.last_x, physics.last_y, position.z, position.x
+    for tile_x, tile_y, t_enter, t_exit in physics.tiles_crossed(x0, y0, x1, y1):
+        walls = physics.tile_walls(tile_x, tile_y)
+        if walls is None:
+            break
+        hit = physics.first_wall(walls, x0, y0, x1, y1, t_enter, t_exit)
+        if hit is not None:
+            time_of_impact, nx, ny = hit
+            position.z, position.x = x0 + (x1 - x0) * time_of_impact, y0 + (y1 - y0) * time_of_impact
+            physics.collide(nx, ny)
+            break
+    physics.last_x, physics.last_y = position.z, position.x
+    physics.update_current_tile()
+
+def _enforce_track_bounds_by_distance(physics):
+    ''' Only the distance field lookup of Physics3D.enforce_track_bounds, walls and inner corners in one read '''
+    position = physics.vehicle.position
+    hit = physics.nearest_obstacle(position.z, position.x, physics.vehicle.hitbox_size)
+    if hit is not None and hit[0] < physics.vehicle.hitbox_size:
+        physics.collide(hit[1], hit[2])
+
+def benchmark_collision(checks=200000, step=50.0 / 60, rounds=3):
+    '''
+    Wall checks for one step of `step` units in a random direction, ending at random points on the track's tiles (about
+    a quarter of them touch a wall, a few cross into the next tile): the type dispatch and the tables check only where
+    the car ends up, the sweep follows the whole move, the distance field is the lookup alone and enforce is the whole
+    of Physics3D.enforce_track_bounds, as the game runs it every step. The best of `rounds` runs of each, taken in turn.
+    '''
+    print("--------------------- Collision: type dispatch vs tables vs sweep vs distance field vs enforce_track_bounds ---------------------")
+    track = _load_grid(Grid, 8, 12, 24)
+    car = _Car()
+    physics = Physics3D(track, car)
+    rng = random.Random(0)
+    tiles = [(cell.x, cell.y) for cell in track.Grid.chain()]
+    steps = []
+    for _ in range(checks):
+        x, y = rng.choice(tiles)
+        grid_x, grid_y = (x + rng.random()) * track.tile_size, (y + rng.random()) * track.tile_size
+        angle = rng.random() * 2 * math.pi
+        last_x, last_y = grid_x - math.cos(angle) * step, grid_y - math.sin(angle) * step
+        last_tile = (int(last_x // track.tile_size), int(last_y // track.tile_size))
+        steps.append((last_x, last_y, last_tile, physics.tile_row(*last_tile), grid_x, grid_y))
+
+    results = {}
+    for _ in range(rounds):
+        for name, enforce in (("type dispatch", _enforce_track_bounds_by_type), ("tables", _enforce_track_bounds_by_table), ("swept", _enforce_track_bounds_swept),
+                              ("distance field", _enforce_track_bounds_by_distance), ("enforce", Physics3D.enforce_track_bounds)):
+            collisions = 0
+            start = time.perf_counter()
+            for last_x, last_y, last_tile, last_row, grid_x, grid_y in steps:
+                physics.last_x, physics.last_y, physics.curr_tile, physics.curr_row = last_x, last_y, last_tile, last_row # where the previous step ended
+                car.position.z, car.position.x = grid_x, grid_y
+                car.direction.x, car.direction.z = 1.0, 0.0
+                car.speed = 50.0
+                enforce(physics)
+                collisions += car.position.z != grid_x or car.position.x != grid_y
+            rate = checks / (time.perf_counter() - start)
+            results[name] = (max(rate, results.get(name, (0.0,))[0]), collisions)
+    for name, (rate, collisions) in results.items():
+        print(f"{name:>15}: {rate:10.0f} checks/s ({collisions} collisions)")
+    base = results["type dispatch"][0]
+    print("speedup over type dispatch: " + ", ".join(f"{results[name][0] / base:.1f}x {name}" for name in ("tables", "swept", "distance field", "enforce")))
+
+
+
+# ------------------------------------------ Vehicle batch ------------------------------------------
+def _spawn_cars(track, count, rng):
+    ''' (position, direction, speed) of `count` cars at random spots on the track '''
+    tiles = [(cell.x, cell.y) for cell in track.Grid.chain()]
+    cars = []
+    for _ in range(count):
+        x, y = rng.choice(tiles)
+        angle = rng.random() * 2 * math.pi
+        position = Point((y + rng.random()) * track.tile_size, 0, (x + rng.random()) * track.tile_size)
+        cars.append((position, Vector(math.cos(angle), 0, math.sin(angle)), rng.uniform(0, VehicleState.MAX_SPEED)))
+    return cars
+
+def benchmark_vehicle_batch(counts=(1, 100, 10000), seconds=1.0, delta_time=1/60):
+    ''' Cars stepped per second (drive + walls) by Vehicle/Physics3D one at a time and by VehicleBatch '''
+    print("------------------------------- Vehicles: Vehicle vs VehicleBatch -------------------------------")
+    print(f"{'cars':>6} | {'Vehicle cars/s':>14} | {'batch cars/s':>14} | {'speedup':>7}")
+    track = _load_grid(Grid, 8, 12, 24)
+    for count in counts:
+        rng = random.Random(count)
+        cars = _spawn_cars(track, count, rng)
+        keys = [[rng.random() < 0.5 for _ in range(count)] for _ in range(4)]
+
+        vehicles = []
+        for position, direction, speed in cars:
+            vehicle = VehicleState({"position": position.copy(), "direction": direction.copy(), "hitbox_size": 2.0, "speed": speed})
+            vehicles.append((vehicle, Physics3D(track, vehicle)))
+        inputs = [(keys[0][i], keys[1][i], keys[2][i], keys[3][i]) for i in range(count)]
+        steps = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            for (vehicle, physics), steering_input in zip(vehicles, inputs):
+                vehicle.update(delta_time, steering_input)
+                physics.enforce_track_bounds()
+            steps += 1
+        single_rate = steps * count / (time.perf_counter() - start)
+
+        batch = VehicleBatch(count)
+        batch.set_track(track)
+        for i, (position, direction, speed) in enumerate(cars):
+            batch.place(i, position, direction, speed)
+        left, right, up, down = (np.array(k) for k in keys)
+        steps = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            batch.step(delta_time, left, right, up, down)
+            steps += 1
+        batch_rate = steps * count / (time.perf_counter() - start)
+        print(f"{count:>6} | {single_rate:>14.0f} | {batch_rate:>14.0f} | {batch_rate / single_rate:>6.2f}x")
+
+
+
+# ------------------------------------------ Pickups ------------------------------------------
+class _Driver(_Car):
+    ''' _Car that counts the pickups it gets '''
+    collected = 0
+
+    def boost(self):
+        self.collected += 1
+
+def _update_pickups_linear(pickups, delta_time):
+    ''' PickupsState.update before the spatial hash: every pickup every step, with a sqrt distance '''
+    for p in pickups.pickups:
+        if p.timeout == 0.0:
+            if p.position.distance(pickups.vehicle.position) < (pickups.vehicle.hitbox_size + p.scale) / 2.0:
+                pickups.apply_pickup_effect(p)
+                p.timeout = 10.0
+        else:
+            p.timeout -= delta_time
+            if p.timeout < 0:
+                p.timeout = 0.0
+
+def _make_pickups(spots, tile_size):
+    ''' Pickups at the given spots, without a track '''
+    pickups = PickupsState.__new__(PickupsState)
+    pickups.vehicle = _Driver()
+    pickups.time = 0.0
+    pickups.pickups = []
+    pickups.active = SpatialHash(tile_size)
+    pickups.respawning = []
+    for spot in spots:
+        pickups.add_pickup(PickupEntity(type="speed_boost", position=spot.copy()))
+    return pickups
+
+def benchmark_pickups(counts=(10, 1000, 10000), grid_size=64, steps=2000, delta_time=1/60):
+    ''' PickupsState.update for a car driving along a row of a big grid with pickups all over it: every pickup vs the spatial hash '''
+    print("------------------------------- Pickups: every pickup vs spatial hash -------------------------------")
+    print(f"{'pickups':>8} | {'linear steps/s':>14} | {'hash steps/s':>14} | {'speedup':>7} | {'collected':>9}")
+    tile_size = 32.0
+    row = (grid_size // 2 + 0.5) * tile_size
+    for count in counts:
+        rng = random.Random(count)
+        spots = [Point((rng.randrange(grid_size) + 0.5) * tile_size, 1.5, (rng.randrange(grid_size) + 0.5) * tile_size) for _ in range(count)]
+        results = []
+        for update in (_update_pickups_linear, PickupsState.update):
+            pickups = _make_pickups(spots, tile_size)
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                for step in range(steps):
+                    pickups.vehicle.position = Point(row, 1.5, (step * 1.2) % (grid_size * tile_size))
+                    update(pickups, delta_time)
+                elapsed = time.perf_counter() - start
+            results.append((steps / elapsed, pickups.vehicle.collected))
+        (linear, linear_collected), (hashed, hashed_collected) = results
+        print(f"{count:>8} | {linear:>14.0f} | {hashed:>14.0f} | {hashed / linear:>6.1f}x | {linear_collected:>4} {hashed_collected:>4}")
+
+
+
+# ------------------------------------------ Car collisions ------------------------------------------
+def _all_pairs(x, z, radius):
+    ''' Overlapping pairs from the full N x N distance matrix '''
+    touching = np.triu(np.hypot(x[:, None] - x[None, :], z[:, None] - z[None, :]) < 2.0 * radius, 1)
+    return np.nonzero(touching)
+
+def benchmark_car_collisions(counts=(10, 100, 1000), runs=5):
+    '''
+    One car-to-car collision pass for cars spread over a 16x16 track: every pair in Python with
+    CarCollisions.collide_cars, the pairs from an N x N distance matrix, the pairs by sort and sweep,
+    and VehicleBatch.collide_cars (sort and sweep plus the response)
+    '''
+    print("------------------------------- Car collisions: pairwise vs sort and sweep -------------------------------")
+    print(f"{'cars':>5} {'pairs':>6} | {'python N^2':>10} | {'numpy N^2':>10} | {'sweep':>10} | {'batch pass':>10}")
+    track = _load_grid(Grid, 16, 96, 128)
+    for count in counts:
+        cars = _spawn_cars(track, count, random.Random(count))
+        batch = VehicleBatch(count, car_collisions=True)
+        for i, (position, direction, speed) in enumerate(cars):
+            batch.place(i, position, direction, speed)
+        x, z = batch.x.copy(), batch.z.copy()
+
+        times = {"python": 0.0, "numpy": 0.0, "sweep": 0.0, "batch": 0.0}
+        for _ in range(runs):
+            bodies = []
+            for position, direction, speed in cars:
+                body = _Car()
+                body.position, body.direction, body.speed = position.copy(), direction.copy(), speed
+                bodies.append(body)
+            start = time.perf_counter()
+            for i in range(count):
+                for j in range(i + 1, count):
+                    collide_cars(bodies[i], bodies[j])
+            times["python"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            pairs = len(_all_pairs(x, z, batch.hitbox_size)[0])
+            times["numpy"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            swept = len(sweep_and_prune(x, z, batch.hitbox_size)[0])
+            times["sweep"] += time.perf_counter() - start
+
+            batch.x[:], batch.z[:] = x, z
+            start = time.perf_counter()
+            batch.collide_cars()
+            times["batch"] += time.perf_counter() - start
+        assert swept == pairs
+        print(f"{count:>5} {pairs:>6} | " + " | ".join(f"{times[name] / runs * 1000:8.3f}ms" for name in ("python", "numpy", "sweep", "batch")))
+
+
+
+# ------------------------------------------ Ghost ------------------------------------------
+class _ChordGhost:
+    ''' The ghost before Track.centreline: per tile Bezier parameter t advanced by speed over an approximate (chord) length '''
+    def __init__(self, track, speed):
+        self.speed = speed
+        self.cell = track.Grid.start
+        self.t = 0.0
+        self.setup_segment()
+
+    def setup_segment(self):
+        self.p0, self.p1, self.p2 = self.cell.real_enter.copy(), self.cell.real_center.copy(), self.cell.real_exit.copy()
+        self.seg_len = max(0.0001, self.p0.distance(self.p1) + self.p1.distance(self.p2))
+
+    def update(self, dt):
+        self.t += self.speed * dt / self.seg_len
+        while self.t >= 1.0:
+            self.t -= 1.0
+            self.cell = self.cell.next
+            self.setup_segment()
+        t = self.t
+        u = 1.0 - t
+        self.pos = (u*u) * self.p0 + (2 * u * t) * self.p1 + (t*t) * self.p2
+        d = (2 * u) * (self.p1 - self.p0) + (2 * t) * (self.p2 - self.p1)
+        mag = math.hypot(d.x, d.z)
+        self.direction = Vector(d.x / mag, 0.0, d.z / mag)
+
+def benchmark_ghost(steps=100000, delta_time=1/60, speed=20.0):
+    ''' Ghost updates per second, and how steady its speed is, following the centre line by chord length vs by arc length '''
+    print("------------------------------- Ghost: chord length vs arc length table -------------------------------")
+    print(f"{'ghost':>6} | {'updates/s':>10} | {'speed min':>9} {'max':>6} | {'peak':>9}")
+    track_settings = {"track_id": 1, "grid_size": 8, "tile_size": 32.0, "road_width": 16.0, "min_length": 12, "max_length": 24, "track_algorithm": "dfs", "seed": 1}
+    with contextlib.redirect_stdout(io.StringIO()):
+        track = TrackLayout(track_settings)
+    start_settings = lambda: {"position": track.Grid.start.real_center.copy(), "direction": Vector(0, 0, 1), "speed": speed, "hitbox_size": 2}
+    for name, ghost in (("chord", _ChordGhost(track, speed)), ("arc", GhostState(track, start_settings()))):
+        ghost.update(delta_time)
+        speeds = []
+        previous = (ghost.pos.x, ghost.pos.z)
+        for _ in range(int(track.centreline.length / speed / delta_time)): # one lap
+            ghost.update(delta_time)
+            speeds.append(math.hypot(ghost.pos.x - previous[0], ghost.pos.z - previous[1]) / delta_time)
+            previous = (ghost.pos.x, ghost.pos.z)
+
+        start = time.perf_counter()
+        for _ in range(steps):
+            ghost.update(delta_time)
+        rate = steps / (time.perf_counter() - start)
+
+        tracemalloc.start()
+        for _ in range(1000):
+            ghost.update(delta_time)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:>6} | {rate:>10.0f} | {min(speeds):>9.2f} {max(speeds):>6.2f} | {peak:>7}B")
+
+
+
+# ------------------------------------------ Track progress ------------------------------------------
+class _Position:
+    def __init__(self):
+        self.position = Point(0.0, 0.0, 0.0)
+
+def benchmark_track_progress(sizes=((8, 12, 24), (64, 100, 200), (256, 200, 400)), steps=20000, cars=10000):
+    ''' LapCounter.update for one car going round, and BatchLapCounter for many, on short and long tracks: the cost should not grow with the track '''
+    print("------------------------------- Track progress: cost vs track length -------------------------------")
+    print(f"{'size':>5} {'length':>7} | {'1 car updates/s':>15} | {f'{cars} cars updates/s':>20}")
+    for size, min_length, max_length in sizes:
+        track = _load_grid(ArrayGrid, size, min_length, max_length)
+        centreline = track.centreline
+        car = _Position()
+        laps = LapCounter(track, car, total_laps=10**9)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for step in range(steps):
+                car.position.x, car.position.z, _, _ = centreline.at(step * 0.5) # a lap every so many steps, all tiles visited
+                laps.update(step / 60)
+        single = steps / (time.perf_counter() - start)
+
+        rng = np.random.default_rng(size)
+        distances = rng.uniform(0.0, centreline.length, cars)
+        batch = BatchLapCounter(track, *centreline.sample(distances)[:2], total_laps=10**9)
+        start = time.perf_counter()
+        for step in range(100):
+            x, z, _, _ = centreline.sample(distances + step * 0.5)
+            batch.update(x, z, step / 60)
+            batch.order()
+        many = 100 / (time.perf_counter() - start)
+        print(f"{size:>5} {track.Grid.length:>7} | {single:>15.0f} | {many:>20.0f}")
+
+
+
+# ------------------------------------------ Flow field ------------------------------------------
+def _nearest_track_tile(track, x, z):
+    ''' What finding the way back takes without a flow field: the nearest track tile to world (x, z), over the whole chain '''
+    grid_x, grid_y = z // track.tile_size, x // track.tile_size
+    return min(track.Grid.chain(), key=lambda cell: abs(cell.x - grid_x) + abs(cell.y - grid_y))
+
+def benchmark_flow_field(sizes=((8, 12, 24), (64, 100, 200), (256, 200, 400)), queries=20000, cars=10000):
+    ''' Building the flow field once, then the way back from anywhere on the grid: one lookup vs searching the track, one car and many '''
+    print("------------------------------- Flow field: lookup vs searching the track -------------------------------")
+    print(f"{'size':>5} {'length':>7} | {'build':>9} | {'lookups/s':>10} {'searches/s':>10} | {f'{cars} cars us':>13}")
+    for size, min_length, max_length in sizes:
+        track = _load_grid(ArrayGrid, size, min_length, max_length)
+        start = time.perf_counter()
+        flow_field = FlowField(track)
+        build = time.perf_counter() - start
+
+        rng = np.random.default_rng(size)
+        x, z = rng.uniform(0.0, size * track.tile_size, (2, queries))
+        start = time.perf_counter()
+        for i in range(queries):
+            flow_field.direction(x[i], z[i])
+        lookups = queries / (time.perf_counter() - start)
+
+        searches = min(queries, 200)
+        start = time.perf_counter()
+        for i in range(searches):
+            _nearest_track_tile(track, x[i], z[i])
+        searched = searches / (time.perf_counter() - start)
+
+        x, z = rng.uniform(0.0, size * track.tile_size, (2, cars))
+        start = time.perf_counter()
+        for _ in range(100):
+            flow_field.waypoints(x, z)
+        batch = (time.perf_counter() - start) / 100
+        print(f"{size:>5} {track.Grid.length:>7} | {build * 1000:7.1f}ms | {lookups:>10.0f} {searched:>10.0f} | {batch * 1e6:>13.0f}")
+
+
+
+# ------------------------------------------ AI drivers ------------------------------------------
+def benchmark_ai_drivers(counts=(1, 50, 500), seconds=30.0, delta_time=1/60):
+    ''' AIDrivers.keys for a field of VehicleBatch cars spread round the track, all at once vs one call per car, and the laps they drive '''
+    print("------------------------------- AI drivers: batched vs one car at a time -------------------------------")
+    laps_header = f"laps in {seconds:g}s"
+    print(f"{'cars':>5} | {'batched us/frame':>16} | {'per car us/frame':>16} | {laps_header} | {'wall hits/car':>13}")
+    track_settings = {"track_id": 1, "grid_size": 8, "tile_size": 32.0, "road_width": 16.0, "min_length": 12, "max_length": 24, "track_algorithm": "dfs", "seed": 1}
+    with contextlib.redirect_stdout(io.StringIO()):
+        track = TrackLayout(track_settings)
+    drivers = AIDrivers(track)
+    line = track.racing_line
+    for count in counts:
+        cars = VehicleBatch(count)
+        cars.set_track(track)
+        starts = np.arange(count) * line.length / count
+        x, z, dir_x, dir_z = line.sample(starts)
+        cars.x, cars.z, cars.dir_x, cars.dir_z = x, z, dir_x, dir_z
+        laps = BatchLapCounter(track, cars.x, cars.z, total_laps=10**9)
+        steps = round(seconds / delta_time)
+        distance = drivers.locate(cars.x, cars.z)
+        hits = 0
+        controller = 0.0
+        for step in range(steps):
+            start = time.perf_counter()
+            distance = drivers.locate(cars.x, cars.z, distance)
+            keys = drivers.keys(cars.x, cars.z, cars.dir_x, cars.dir_z, cars.speed, distance)
+            controller += time.perf_counter() - start
+            before = cars.speed.copy()
+            cars.step(delta_time, *keys)
+            hits += np.count_nonzero(cars.speed < before - VehicleState.ACCELERATION * 2 * delta_time - 1e-9) # slowed by more than braking
+            laps.update(cars.x, cars.z, step * delta_time)
+
+        start = time.perf_counter()
+        for i in range(count):
+            drivers.keys(cars.x[i:i + 1], cars.z[i:i + 1], cars.dir_x[i:i + 1], cars.dir_z[i:i + 1], cars.speed[i:i + 1])
+        one_by_one = time.perf_counter() - start
+        print(f"{count:>5} | {controller / steps * 1e6:>16.0f} | {one_by_one * 1e6:>16.0f} | {laps.furthest.mean() / laps.progress.length:>{len(laps_header)}.2f} | {hits / count:>13.1f}")
+
+
+
+# ------------------------------------------ RL environment ------------------------------------------
+def benchmark_race_env(count=16, seconds=2.0):
+    ''' Environment steps per second with random actions: one RaceEnv, then count of them in this process and in subprocesses '''
+    print("------------------------------- RaceEnv: in process vs subprocesses -------------------------------")
+    track_settings = {"track_id": 1, "grid_size": 8, "tile_size": 32.0, "road_width": 16.0, "min_length": 12, "max_length": 24, "track_algorithm": "dfs", "seed": 1}
+    rng = np.random.default_rng(0)
+    env = RaceEnv(track_settings)
+    env.reset()
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        _, _, terminated, truncated, _ = env.step(int(rng.integers(env.action_count)))
+        if terminated or truncated:
+            env.reset()
+        steps += 1
+    print(f"{'1 env':>22}: {steps / (time.perf_counter() - start):8.0f} steps/s")
+
+    cores = multiprocessing.cpu_count()
+    for workers in sorted({0, min(cores, count)}):
+        envs = VectorRaceEnv(track_settings, count, workers=workers)
+        envs.reset()
+        steps = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            envs.step(rng.integers(envs.action_count, size=count))
+            steps += count
+        rate = steps / (time.perf_counter() - start)
+        envs.close()
+        print(f"{f'{count} envs, {workers} workers':>22}: {rate:8.0f} steps/s")
+
+
+if __name__ == "__main__":
+    benchmark_track_generation()
+    benchmark_track_algorithms()
+    benchmark_grid_backends()
+    benchmark_grid_storage()
+    benchmark_collision()
+    benchmark_vehicle_batch()
+    benchmark_pickups()
+    benchmark_car_collisions()
+    benchmark_ghost()
+    benchmark_track_progress()
+    benchmark_flow_field()
+    benchmark_ai_drivers()
+    benchmark_race_env()
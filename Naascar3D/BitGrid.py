@@ -0,0 +1,241 @@
+import sys
+from random import Random
+
+
+class BitGrid:
+    '''
+    Integer bitmask version of the Grid, used for track generation and tile lookups.
+
+    Cell (x,y) is bit number (y * size + x) of every mask. Python ints have no width limit, so the same
+    code works for grids larger than 8x8. Directions, tile types and powerups are small integer codes:
+    direction:
+        0 = north, 1 = east, 2 = south, 3 = west (same order as Grid.DIRECTIONS)
+    type:
+        index into TYPES
+    powerup:
+        index into POWERUPS
+    '''
+    DIRECTIONS = ((0, 1), (1, 0), (0, -1), (-1, 0))  # N, E, S, W
+    NORTH, EAST, SOUTH, WEST = 0, 1, 2, 3
+
+    TYPES = ("XX", "v0", "h0", "v1", "h1", "d0", "d1", "d2", "d3")
+    XX, V0, H0, V1, H1, D0, D1, D2, D3 = range(9)
+    TYPE_CODES = {name: code for code, name in enumerate(TYPES)}
+    REVERSE = -1
+
+    POWERUPS = (None, "b", "s", "d")
+    POWERUP_CODES = {name: code for code, name in enumerate(POWERUPS)}
+
+    # Grid.TRACK_TYPE_FOR_DIRECTIONAL_CHANGE as TURN_TYPE[old_direction][new_direction]
+    TURN_TYPE = (
+        (V0, D0, REVERSE, D1),   # heading north
+        (D2, H0, D1, REVERSE),   # heading east
+        (REVERSE, D3, V0, D2),   # heading south
+        (D3, REVERSE, D0, H0),   # heading west
+    )
+
+    def __init__(self, size=8, min_length=10, max_length=16, random=None):
+        self.size = size
+        self.random = random if random is not None else Random()
+        self.min_length = min_length
+        self.max_length = max_length
+        self.cell_count = size * size
+
+        self.full_mask = (1 << self.cell_count) - 1
+        first_column = 0
+        last_column = 0
+        for y in range(size):
+            first_column |= 1 << (y * size)
+            last_column |= 1 << (y * size + size - 1)
+        self.not_first_column = self.full_mask & ~first_column
+        self.not_last_column = self.full_mask & ~last_column
+
+        # Precomputed per cell: coordinates and neighbour index in each direction (-1 when off the grid)
+        self.xs = [i % size for i in range(self.cell_count)]
+        self.ys = [i // size for i in range(self.cell_count)]
+        self.neighbours = []
+        for i in range(self.cell_count):
+            indices = []
+            for dx, dy in self.DIRECTIONS:
+                nx, ny = self.xs[i] + dx, self.ys[i] + dy
+                if 0 <= nx < size and 0 <= ny < size:
+                    indices.append(ny * size + nx)
+                else:
+                    indices.append(-1)
+            self.neighbours.append(tuple(indices))
+        # Neighbour masks are only kept for small grids, on a 256x256 grid they would take 65536 * 8KB
+        self.neighbour_masks = [self.neighbour_mask(i) for i in range(self.cell_count)] if self.cell_count <= 1024 else None
+
+        self.clear()
+
+    def clear(self):
+        self.occupied = 0
+        self.types = bytearray(self.cell_count)
+        self.directions = bytearray(self.cell_count)
+        self.powerups = bytearray(self.cell_count)
+        self.start = -1
+        self.end = -1
+        self.length = 1
+
+    def index(self, x, y):
+        return y * self.size + x
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.size and 0 <= y < self.size
+
+    def is_empty(self, i):
+        return not (self.occupied >> i) & 1
+
+    def get_type(self, x, y):
+        ''' Tile type code at (x,y), XX when (x,y) is off the grid '''
+        if 0 <= x < self.size and 0 <= y < self.size:
+            return self.types[y * self.size + x]
+        return self.XX
+
+    def neighbour_mask(self, i):
+        mask = 0
+        for j in self.neighbours[i]:
+            if j >= 0:
+                mask |= 1 << j
+        return mask
+
+    def next_index(self, i):
+        return self.neighbours[i][self.directions[i]]
+
+    def set_start(self, x, y, direction):
+        self.start = self.index(x, y)
+        self.end = self.neighbours[self.start][(direction + 2) % 4]  # cell right behind the start closes the loop
+        self.types[self.start] = self.V1 if direction in (self.NORTH, self.SOUTH) else self.H1
+        self.directions[self.start] = direction
+        self.occupied |= 1 << self.start
+
+    # ------------------------------------------ Generation ------------------------------------------
+    def generate_track(self, x, y, direction):
+        '''
+        Generates a track starting at (x,y) facing `direction`, using the same pruned search as Grid.pruned_dfs.
+        Returns False if no track of a valid length exists from this start.
+        '''
+        self.clear()
+        self.set_start(x, y, direction)
+        first = self.neighbours[self.start][direction]
+        if first < 0 or self.end < 0:
+            return False
+        # The search recurses once per track cell
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), self.max_length + 100))
+        return self.pruned_dfs(first, direction, 1)
+
+    def pruned_dfs(self, i, old_direction, length):
+        self.occupied |= 1 << i
+        turn_types = self.TURN_TYPE[old_direction]
+        neighbours = self.neighbours[i]
+
+        directions = [self.NORTH, self.EAST, self.SOUTH, self.WEST]
+        self.random.shuffle(directions)  # make genereration random
+
+        for new_direction in directions:
+            j = neighbours[new_direction]
+            if j == self.start:
+                if new_direction == self.directions[self.start] and length >= self.min_length and length <= self.max_length:
+                    self.types[i] = turn_types[new_direction]
+                    self.directions[i] = new_direction
+                    self.length += 1
+                    return True
+                continue
+
+            if j < 0 or (self.occupied >> j) & 1:
+                continue
+
+            self.types[i] = turn_types[new_direction]
+            self.directions[i] = new_direction
+            if self.can_close_from(j, length + 1) and self.pruned_dfs(j, new_direction, length + 1):
+                self.length += 1
+                self.assign_random_powerup(i)
+                return True
+
+        self.types[i] = self.XX
+        self.directions[i] = 0
+        self.occupied &= ~(1 << i)
+        return False
+
+    def can_close_from(self, i, length):
+        ''' Checks if a track whose length-th cell is i can still reach the end cell within the length limits '''
+        end = self.end
+        if i == end:
+            return length >= self.min_length and length <= self.max_length
+
+        distance = abs(self.xs[i] - self.xs[end]) + abs(self.ys[i] - self.ys[end])
+        shortest = max(self.min_length, length + distance)
+        if (shortest - length - distance) % 2 == 1:
+            shortest += 1
+        if shortest > self.max_length:
+            return False
+
+        return self.region_reaches(i, end, shortest - length + 1)
+
+    def region_reaches(self, i, end, cells_needed):
+        ''' 
+        Flood fills the empty cells connected to cell i, stopping as soon as the region contains the end cell
+        and at least `cells_needed` cells, so on big mostly empty grids it does not fill the whole grid
+        '''
+        empty = self.full_mask & ~self.occupied
+        end_bit = 1 << end
+        size = self.size
+        region = 1 << i
+        while True:
+            grown = region | ((region << 1) & self.not_first_column) | ((region >> 1) & self.not_last_column) \
+                           | (region << size) | (region >> size)
+            grown &= empty
+            if grown & end_bit and grown.bit_count() >= cells_needed:
+                return True
+            if grown == region:
+                return False
+            region = grown
+
+    def flood_fill(self, i):
+        ''' Mask of every empty cell connected to cell i '''
+        empty = self.full_mask & ~self.occupied
+        size = self.size
+        region = 1 << i
+        while True:
+            grown = region | ((region << 1) & self.not_first_column) | ((region >> 1) & self.not_last_column) \
+                           | (region << size) | (region >> size)
+            grown &= empty
+            if grown == region:
+                return region
+            region = grown
+
+    def assign_random_powerup(self, i):
+        if self.types[i] in (self.V0, self.H0):
+            num = self.random.randint(0, 10)
+            if num < 3:
+                self.powerups[i] = self.POWERUP_CODES["b"]
+            elif num == 3:
+                self.powerups[i] = self.POWERUP_CODES["s"]
+            elif num == 9:
+                self.powerups[i] = self.POWERUP_CODES["d"]
+
+    # ------------------------------------------ Conversion ------------------------------------------
+    def load_grid(self, grid):
+        ''' Copies the track from a Grid of Cells into the bitmasks '''
+        self.clear()
+        start = grid.get_start()
+        self.start = self.index(start.x, start.y)
+        self.end = -1
+        self.length = grid.length
+        for cell in grid.cells.values():
+            if cell.type == "XX":
+                continue
+            i = self.index(cell.x, cell.y)
+            self.occupied |= 1 << i
+            self.types[i] = self.TYPE_CODES[cell.type]
+            self.directions[i] = self.DIRECTIONS.index((cell.direction.x, cell.direction.y))
+            self.powerups[i] = self.POWERUP_CODES[cell.powerup]
+
+    def chain(self):
+        ''' Cell indices of the track in driving order, starting with the start cell '''
+        indices = [self.start]
+        i = self.next_index(self.start)
+        while i != self.start:
+            indices.append(i)
+            i = self.next_index(i)
+        return indices
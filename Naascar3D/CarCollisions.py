@@ -0,0 +1,112 @@
+import math
+
+import numpy as np
+
+# Cars are circles of radius hitbox_size in the ground plane (world x,z), the same hitbox Physics3D keeps off the walls.
+# Equal masses and fully elastic along the contact normal, like Physics3D.collide's reflection off a wall; the energy
+# loss comes from the same speed-loss rule collide applies to hard, head-on hits.
+RESTITUTION = 1.0
+HARD_HIT_SPEED = 0.6 # fraction of MAX_SPEED above which a hit costs speed, as in Physics3D.collide
+HARD_HIT_IMPACT = 0.15
+
+
+def speed_loss(speed, impact, max_speed, min_speed):
+    ''' Physics3D.collide's speed loss: 12% plus up to 18% more the more head-on the hit (impact = |direction . normal|) '''
+    if speed > HARD_HIT_SPEED * max_speed and impact > HARD_HIT_IMPACT:
+        return max(min_speed, speed * (1.0 - (0.12 + 0.18 * impact)))
+    return speed
+
+
+def overlapping(car, other):
+    ''' Whether the hitboxes of two cars (anything with position and hitbox_size, like Vehicle) overlap '''
+    dx = car.position.x - other.position.x
+    dz = car.position.z - other.position.z
+    reach = car.hitbox_size + other.hitbox_size
+    return dx*dx + dz*dz < reach * reach
+
+
+def collide_cars(car, other, other_fixed=False):
+    '''
+    Separates two cars whose hitboxes overlap and exchanges the approaching part of their velocities along the
+    line between them. Cars have position (Point), direction (unit Vector in x,z), speed and hitbox_size, like
+    Vehicle. With other_fixed the other car is not moved or slowed, for cars that follow a set path (Ghost).
+    Returns whether they touched.
+    '''
+    if not overlapping(car, other):
+        return False
+
+    dx = car.position.x - other.position.x
+    dz = car.position.z - other.position.z
+    reach = car.hitbox_size + other.hitbox_size
+    distance = math.sqrt(dx*dx + dz*dz)
+    if distance > 0.0:
+        nx, nz = dx / distance, dz / distance
+    else:
+        nx, nz = -car.direction.x, -car.direction.z # right on top of each other, back the car off
+
+    # push apart until the hitboxes just touch
+    overlap = reach - distance
+    share = 1.0 if other_fixed else 0.5
+    car.position.x += nx * overlap * share
+    car.position.z += nz * overlap * share
+    if not other_fixed:
+        other.position.x -= nx * overlap * share
+        other.position.z -= nz * overlap * share
+
+    approach = (car.direction.x * car.speed - other.direction.x * other.speed) * nx \
+             + (car.direction.z * car.speed - other.direction.z * other.speed) * nz
+    if approach >= 0.0:
+        return True # already moving apart
+
+    impulse = (1.0 + RESTITUTION) * approach * share
+    _apply_impulse(car, -impulse * nx, -impulse * nz, nx, nz)
+    if not other_fixed:
+        _apply_impulse(other, impulse * nx, impulse * nz, nx, nz)
+    return True
+
+
+def _apply_impulse(car, dvx, dvz, nx, nz):
+    ''' Adds (dvx, dvz) to the car's velocity, keeping it facing the same way as far as it can, then applies the speed loss '''
+    direction = car.direction
+    impact = abs(direction.x * nx + direction.z * nz)
+    vx = direction.x * car.speed + dvx
+    vz = direction.z * car.speed + dvz
+    speed = math.hypot(vx, vz)
+    if speed == 0.0:
+        car.speed = 0.0
+        return
+    if vx * direction.x + vz * direction.z < 0.0:
+        speed = -speed # pushed backwards: keep facing forward and roll back
+    direction.x, direction.z = vx / speed, vz / speed
+    car.speed = speed_loss(speed, impact, car.MAX_SPEED, car.MIN_SPEED)
+
+
+def sweep_and_prune(x, z, radius):
+    '''
+    Pairs (i, j arrays) of circles of the given radius that overlap, by sort and sweep: positions are sorted along
+    whichever of x and z they are spread over more, and each car is only compared with the ones following it in
+    that order until they are further apart than 2 * radius along it. Runs in O(N log N + N * K), K being the most
+    cars within 2 * radius of each other along the axis, instead of O(N^2).
+    '''
+    count = len(x)
+    if count < 2:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    axis, other_axis = (x, z) if np.ptp(x) >= np.ptp(z) else (z, x)
+    order = np.argsort(axis, kind="stable")
+    along = axis[order]
+    across = other_axis[order]
+    reach = 2.0 * radius
+
+    first, second = [], []
+    for k in range(1, count):
+        gap = along[k:] - along[:-k]
+        candidates = np.flatnonzero(gap < reach)
+        if len(candidates) == 0:
+            break # sorted, so cars k or more apart in the order are even further apart
+        side = across[candidates + k] - across[candidates]
+        touching = candidates[gap[candidates] ** 2 + side ** 2 < reach * reach]
+        first.append(order[touching])
+        second.append(order[touching + k])
+    if not first:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    return np.concatenate(first), np.concatenate(second)
@@ -0,0 +1,84 @@
+import math
+
+import numpy as np
+
+
+class Centreline:
+    '''
+    The middle of the road as one closed curve, parameterised by distance along it (arc length) from the start
+    line. Each tile adds a quadratic Bezier from the middle of the edge it is entered through, over its centre, to
+    the middle of the edge it is left through: a straight line on straights and a near quarter circle in turns.
+    The curves are sampled densely, measured, and resampled every STEP world units into NumPy arrays, so
+    position and tangent at a distance are one index and a lerp (at), and the distance of a point on the track
+    only searches the samples of its own tile (distance_at).
+
+    Points are world (x, z) like the cars': the tile of a point is (z // tile_size, x // tile_size) in grid (x,y).
+    '''
+    SAMPLES_PER_TILE = 64
+    STEP = 0.25
+
+    def __init__(self, cells, tile_size):
+        ''' cells: the track's cells in driving order from the start (Grid.chain()), with real_center set '''
+        self.tile_size = tile_size
+        centres = np.array([(cell.real_center.x, cell.real_center.z) for cell in cells])
+        p0 = (np.roll(centres, 1, axis=0) + centres) * 0.5 # edge shared with the previous tile
+        p1 = centres
+        p2 = (centres + np.roll(centres, -1, axis=0)) * 0.5 # edge shared with the next tile
+
+        t = (np.arange(self.SAMPLES_PER_TILE) / self.SAMPLES_PER_TILE)[None, :, None]
+        u = 1.0 - t
+        points = u * u * p0[:, None] + 2 * u * t * p1[:, None] + t * t * p2[:, None]
+        tangents = 2 * u * (p1 - p0)[:, None] + 2 * t * (p2 - p1)[:, None]
+        points = np.vstack([points.reshape(-1, 2), p0[:1]]) # closed: ends where it started
+        tangents = np.vstack([tangents.reshape(-1, 2), tangents[0, :1]])
+
+        dense = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(points, axis=0).T))])
+        self.length = float(dense[-1])
+        self.tile_distances = dense[::self.SAMPLES_PER_TILE] # where each tile starts, and the lap length at the end
+
+        samples = math.ceil(self.length / self.STEP)
+        self.step = self.length / samples
+        distances = np.arange(samples + 1) * self.step
+        self.x = np.interp(distances, dense, points[:, 0])
+        self.z = np.interp(distances, dense, points[:, 1])
+        tangent_x = np.interp(distances, dense, tangents[:, 0])
+        tangent_z = np.interp(distances, dense, tangents[:, 1])
+        norm = np.hypot(tangent_x, tangent_z)
+        self.tangent_x = tangent_x / norm
+        self.tangent_z = tangent_z / norm
+
+        self.tile_index = {(cell.x, cell.y): i for i, cell in enumerate(cells)}
+
+    def at(self, distance):
+        ''' (x, z, tangent x, tangent z) at distance along the track, wrapping around the lap '''
+        position = (distance % self.length) / self.step
+        i = min(int(position), len(self.x) - 2) # the division can round up to the end
+        f = position - i
+        x, z, tx, tz = self.x, self.z, self.tangent_x, self.tangent_z
+        return (x[i] + (x[i + 1] - x[i]) * f, z[i] + (z[i + 1] - z[i]) * f,
+                tx[i] + (tx[i + 1] - tx[i]) * f, tz[i] + (tz[i + 1] - tz[i]) * f)
+
+    def sample(self, distances):
+        ''' at() for an array of distances, as four arrays '''
+        position = (np.asarray(distances) % self.length) / self.step
+        i = np.minimum(position.astype(np.int64), len(self.x) - 2)
+        f = position - i
+        return tuple(a[i] + (a[i + 1] - a[i]) * f for a in (self.x, self.z, self.tangent_x, self.tangent_z))
+
+    def tile_of(self, x, z):
+        ''' Index of the track tile under world (x, z) in driving order, or None off the track '''
+        return self.tile_index.get((int(z // self.tile_size), int(x // self.tile_size)))
+
+    def distance_at(self, x, z):
+        ''' Distance along the track of the centre line point nearest to world (x, z), or None off the track '''
+        tile = self.tile_of(x, z)
+        if tile is None:
+            return None
+        first = int(self.tile_distances[tile] / self.step)
+        last = min(int(self.tile_distances[tile + 1] / self.step) + 1, len(self.x) - 1)
+        dx = self.x[first:last + 1] - x
+        dz = self.z[first:last + 1] - z
+        i = first + int(np.argmin(dx * dx + dz * dz))
+        # slide along the tangent there for the part between two samples
+        along = (x - self.x[i]) * self.tangent_x[i] + (z - self.z[i]) * self.tangent_z[i]
+        return (i * self.step + min(max(along, -self.step), self.step)) % self.length
@@ -0,0 +1,90 @@
+from collections import deque
+
+import numpy as np
+
+from Geometry import Vector
+
+
+class FlowField:
+    '''
+    Which way to go from every tile of the grid, on the track or off it, to get back on course: a track tile points
+    the way the track leaves it (to the next cell in the Cell.next chain), any other tile one step along the
+    shortest way (4-connected, by breadth first search from every track tile at once) to the nearest track tile,
+    ties going to the track tile first in the chain. Built once per track; every query is one lookup by tile ID
+    (y * grid_size + x, like TrackLayout's collision tables), for AI drivers that end up off the road (AIDrivers)
+    and for putting a car back on the track (recovery).
+
+    Arrays per tile ID: step_x, step_y (the step in grid (x,y)), distance (tiles to the track, 0 on it) and target
+    (tile ID of the track tile the way leads to).
+    '''
+    NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+    def __init__(self, track):
+        self.track = track
+        self.grid_size = size = track.grid_size
+        self.tile_size = track.tile_size
+        step_x, step_y = [0] * (size * size), [0] * (size * size)
+        distance, target = [-1] * (size * size), [-1] * (size * size)
+        self.cells = {}
+
+        queue = deque()
+        for cell in track.Grid.chain():
+            tile_id = cell.y * size + cell.x
+            step_x[tile_id], step_y[tile_id] = cell.direction.x, cell.direction.y
+            distance[tile_id], target[tile_id] = 0, tile_id
+            self.cells[tile_id] = cell
+            queue.append(tile_id)
+
+        while queue:
+            tile_id = queue.popleft()
+            x, y = tile_id % size, tile_id // size
+            for dx, dy in self.NEIGHBOURS:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < size and 0 <= ny < size and distance[ny * size + nx] < 0:
+                    neighbour = ny * size + nx
+                    step_x[neighbour], step_y[neighbour] = -dx, -dy # back the way the search came
+                    distance[neighbour], target[neighbour] = distance[tile_id] + 1, target[tile_id]
+                    queue.append(neighbour)
+
+        self.step_x = np.array(step_x, dtype=np.int8)
+        self.step_y = np.array(step_y, dtype=np.int8)
+        self.distance = np.array(distance, dtype=np.int32)
+        self.target = np.array(target, dtype=np.int32)
+
+    def tile_id(self, x, z):
+        ''' ID of the tile under world (x, z), clamped onto the grid '''
+        grid_x = min(max(int(z // self.tile_size), 0), self.grid_size - 1)
+        grid_y = min(max(int(x // self.tile_size), 0), self.grid_size - 1)
+        return grid_y * self.grid_size + grid_x
+
+    def direction(self, x, z):
+        ''' World (x, z) unit step to take from world (x, z): note the swap, the car's x is the grid's y '''
+        tile_id = self.tile_id(x, z)
+        return int(self.step_y[tile_id]), int(self.step_x[tile_id])
+
+    def directions(self, x, z):
+        ''' direction() for arrays of positions, as two arrays '''
+        grid_x = np.clip((np.asarray(z) // self.tile_size).astype(np.int64), 0, self.grid_size - 1)
+        grid_y = np.clip((np.asarray(x) // self.tile_size).astype(np.int64), 0, self.grid_size - 1)
+        tile_id = grid_y * self.grid_size + grid_x
+        return self.step_y[tile_id].astype(np.float64), self.step_x[tile_id].astype(np.float64)
+
+    def waypoints(self, x, z):
+        ''' World (x, z) of the centre of the tile one step along the way from world (x, z), for arrays of positions '''
+        grid_x = np.clip((np.asarray(z) // self.tile_size).astype(np.int64), 0, self.grid_size - 1)
+        grid_y = np.clip((np.asarray(x) // self.tile_size).astype(np.int64), 0, self.grid_size - 1)
+        tile_id = grid_y * self.grid_size + grid_x
+        return ((grid_y + self.step_y[tile_id] + 0.5) * self.tile_size,
+                (grid_x + self.step_x[tile_id] + 0.5) * self.tile_size)
+
+    def on_track(self, x, z):
+        ''' Whether world (x, z) is on a track tile, for arrays of positions '''
+        grid_x, grid_y = np.asarray(z) // self.tile_size, np.asarray(x) // self.tile_size
+        inside = (grid_x >= 0) & (grid_x < self.grid_size) & (grid_y >= 0) & (grid_y < self.grid_size)
+        tile_id = np.where(inside, grid_y * self.grid_size + grid_x, 0).astype(np.int64)
+        return inside & (self.distance[tile_id] == 0)
+
+    def recovery(self, x, z):
+        ''' Where to put a car at world (x, z) back on the track: the centre of the track tile its way leads to, facing along the track '''
+        cell = self.cells[int(self.target[self.tile_id(x, z)])]
+        return cell.real_center.copy(), Vector(cell.direction.y, 0, cell.direction.x)
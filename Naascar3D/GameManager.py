@@ -8,68 +8,145 @@ from pygame.locals import *
 
 from Shaders import *
 from Matrices import *
+from random import randint, seed
+
 from Camera import Camera
-from UI import UI
+from GhostLap import GhostLap, LapRecorder
+from InputLog import InputLog, InputRecorder, Replay, MAX_FRAME_MS
+from UI import UI, LoadingScreen
 from Pickups import Pickups
 from LapCounter import LapCounter
-from Physics3D import *
+from Simulation import Simulation
 from Vehicle import *
 from VehicleGhost import *
 from Track import *
+from TrackCache import TrackCache
+from TrackGenerator import TrackGenerator
+from RacingLine import RacingLine
 
 class GameManager:
     ASPECT_X = 800
     ASPECT_Y = 600
     CAMERA_DISTANCE = 16.0
     CAMERA_HEIGHT = 5
-    TRACK_NUMBER = 0 # CAN CHANGE THIS TO TEST OTHER TRACKS: 0, 1, 2, 3 - 0 is auto generated, rest are pre-designed
+    TRACK_NUMBER = 0 # CAN CHANGE THIS TO TEST OTHER TRACKS: 0, 1, 2, 3, 4 - 0 is auto generated, 4 is from TRACK_LIBRARY, rest are pre-designed
     GRID_SIZE = 8
+    GRID_STORAGE = "cells" # "cells" or "arrays", arrays only store the track's own cells (use for grids of 64x64 and up)
     SQUARE_SIZE = 32.0
     ROAD_WIDTH = 16.0
     SIDELINE_WIDTH = 8.0 #(SQUARE_SIZE - ROAD_WIDTH) / 2
     MINIMUM_TRACK_LENGTH = 16
     MAXIMUM_TRACK_LENGTH = 24 #Could take a while to load lmao
+    GRID_BACKEND = "bitboard" # "bitboard" or "cells", see Grid.generate_random_track
+    TRACK_ALGORITHM = "dfs" # "dfs" or "grow", grow is much faster for tracks that fill most of the grid (see LoopGrower)
+    TRACK_SEED = None # None picks a new random track every launch, any int always gives the same track (cached in tracks/)
+    TRACK_LIBRARY = "tracks/library.ntl" # built with TrackLibrary.py or TrackCatalogue.py
+    LIBRARY_ENTRY = 0
+    GENERATION_TIME_BUDGET = 10.0 # seconds to wait for a generated track before falling back
+    FALLBACK_TRACK_NUMBER = 1 # used when not even a shorter generated track was found in time
+    TICK_RATE = 60 # simulation steps per second, independent of the frame rate
+    MAX_STEPS_PER_FRAME = 5 # after a longer hitch the simulation slows down instead of jumping ahead
+    CAR_COLLISIONS = True # the player's car bounces off the ghost instead of driving through it
+    BEST_LAP_GHOST = True # the ghost drives the best lap on this track, once there is one (kept in ghosts/)
 
     def __init__(self, view_settings = {"aspect_x": ASPECT_X, "aspect_y": ASPECT_Y, "viewport": (0,0,ASPECT_X,ASPECT_Y)}, game_settings = {"track_number": TRACK_NUMBER, "min_len": MINIMUM_TRACK_LENGTH, "max_len":MAXIMUM_TRACK_LENGTH}):
         self.view_settings = view_settings
 
-        pygame.init() 
-        pygame.display.set_mode((self.view_settings["aspect_x"], self.view_settings["aspect_y"]), pygame.OPENGL|pygame.DOUBLEBUF)
-        self.Shader = Shader3D(use_stadium_lights=True)
-        self.Shader.use()
-        self.UI_Shader = Shader3D(use_stadium_lights=False)
-
-        self.Track = Track(self.Shader, settings = {
+        track_settings = {
             "track_id": game_settings["track_number"], 
-            "grid_size": self.GRID_SIZE, 
+            "grid_size": game_settings.get("grid_size", self.GRID_SIZE), 
             "tile_size": self.SQUARE_SIZE, 
             "road_width": self.ROAD_WIDTH, 
             "sideline_width": self.SIDELINE_WIDTH,
             "min_length": game_settings["min_len"],
-            "max_length": game_settings["max_len"]
-        })
-        
-        starting_position = self.Track.start_coordinates()
-        start_dir_x = self.Track.Grid.start.direction.x
-        start_dir_y = self.Track.Grid.start.direction.y
-
-        self.Vehicle = Vehicle( settings = {
-            "position": starting_position, 
-            "direction": Vector(start_dir_y,0,start_dir_x), 
-            "hitbox_size": 2.0,
-            "speed": 0
-        })
+            "max_length": game_settings["max_len"],
+            "grid_backend": game_settings.get("grid_backend", self.GRID_BACKEND),
+            "track_algorithm": game_settings.get("track_algorithm", self.TRACK_ALGORITHM),
+            "seed": game_settings.get("seed", self.TRACK_SEED),
+            "library": game_settings.get("library", self.TRACK_LIBRARY),
+            "library_entry": game_settings.get("library_entry", self.LIBRARY_ENTRY),
+            "grid_storage": game_settings.get("grid_storage", self.GRID_STORAGE)
+        }
+        race_settings = {
+            "tick_rate": game_settings.get("tick_rate", self.TICK_RATE),
+            "max_steps_per_frame": game_settings.get("max_steps_per_frame", self.MAX_STEPS_PER_FRAME),
+            "car_collisions": game_settings.get("car_collisions", self.CAR_COLLISIONS),
+            "total_laps": 3
+        }
+
+        # Play an input log (see InputLog.py) instead of the keyboard: its settings and track replace these
+        replay_log = InputLog(game_settings["replay"]) if game_settings.get("replay") else None
+        preset = None
+        racing_line = None
+        cache_track = track_settings["seed"] is not None # a random seed's track is never loaded again
+        if replay_log is not None:
+            race_settings = {name: replay_log.settings[name] for name in race_settings}
+            track_settings = dict(replay_log.settings["track_settings"], track_id=0)
+            preset = replay_log.preset()
+            racing_line = replay_log.racing_line() # the one the ghost followed, not whatever racing_lines/ has now
+        elif track_settings["seed"] is None:
+            track_settings["seed"] = randint(0, 2**31 - 1)
+        seed(track_settings["seed"]) # the global random module too, so a replay draws the same numbers
+
+        # Generate the track (and its racing line) in the background while the window, shaders and meshes are set up
+        generator = None
+        if preset is None and track_settings["track_id"] == 0 and not TrackCache().track_exists(track_settings["seed"], track_settings["grid_size"], track_settings["min_length"], track_settings["max_length"], track_settings["track_algorithm"]):
+            generator = TrackGenerator(track_settings, game_settings.get("time_budget", self.GENERATION_TIME_BUDGET), cache=cache_track)
+            generator.start()
+
+        pygame.init() 
+        pygame.display.set_mode((self.view_settings["aspect_x"], self.view_settings["aspect_y"]), pygame.OPENGL|pygame.DOUBLEBUF)
+        self.UI_Shader = Shader3D(use_stadium_lights=False)
+        loading_screen = LoadingScreen(self.UI_Shader, view_settings)
+        self.show_loading(loading_screen, generator)
+
+        self.Shader = Shader3D(use_stadium_lights=True)
+        self.show_loading(loading_screen, generator)
+        MeshLoader.preload_meshes()
+
+        if generator is not None:
+            while not generator.poll():
+                pygame.event.pump()
+                self.show_loading(loading_screen, generator)
+                pygame.time.wait(15)
+            preset = generator.result()
+            racing_line = generator.racing_line
+            if preset is None:
+                print(f"Loading track {self.FALLBACK_TRACK_NUMBER} instead")
+                track_settings["track_id"] = self.FALLBACK_TRACK_NUMBER
+
+        self.Shader.use()
+        self.Track = Track(self.Shader, track_settings, preset)
+        if track_settings["track_id"] == 0:
+            self.Track.cache_racing_line = cache_track
+        if racing_line is not None and preset is not None:
+            self.Track.racing_line = RacingLine.decode(racing_line, self.Track.centreline)
         
-        self.Ghost = Ghost( self.Track, settings = {
-            "position": starting_position, 
-            "direction" : Vector(start_dir_y,0,start_dir_x),
-            "hitbox_size": 2.0,
-            "speed" : 20
-        })
-
-        self.Physics = Physics3D(self.Track, self.Vehicle)
+        self.Vehicle = Vehicle(settings = Simulation.start_settings(self.Track, speed=0))
+        self.Ghost = Ghost(self.Track, settings = Simulation.start_settings(self.Track, speed=20))
         self.Pickups = Pickups(self.Track, self.Vehicle)
-        self.LapCounter = LapCounter(self.Track, self.Vehicle, total_laps=3)
+        self.LapCounter = LapCounter(self.Track, self.Vehicle, total_laps=race_settings["total_laps"])
+        self.Simulation = Simulation(self.Track, self.Vehicle, self.Ghost, self.Pickups, self.LapCounter,
+                                     race_settings["car_collisions"], race_settings["tick_rate"], race_settings["max_steps_per_frame"])
+
+        # The ghost drives the best lap so far, and a faster lap replaces it
+        ghost_lap = None
+        if replay_log is not None:
+            ghost_lap = replay_log.ghost_lap()
+        elif game_settings.get("best_lap_ghost", self.BEST_LAP_GHOST):
+            ghost_lap = GhostLap.load_best(self.Track)
+            self.Simulation.lap_recorder = LapRecorder(self.Track, self.Vehicle, self.LapCounter)
+        if ghost_lap is not None:
+            self.Ghost.play_lap(ghost_lap)
+
+        # Record every frame's time and keys, to replay the game exactly with InputLog.py
+        self.recorder = None
+        if game_settings.get("record"):
+            self.recorder = InputRecorder(game_settings["record"], self.Simulation, dict(race_settings, track_settings=track_settings, seed=track_settings["seed"]))
+        self.replay = None
+        if replay_log is not None:
+            self.replay = Replay(replay_log, self.Simulation)
+            self.replay.seek_time(game_settings.get("replay_start", 0.0)) # from the nearest keyframe, see InputLog
 
         # 3D Camera
         self.projection_matrix = ProjectionMatrix()
@@ -83,6 +160,8 @@ class GameManager:
         self.clock = pygame.time.Clock()
         self.clock.tick()
 
+        self.alpha = 1.0 # how far rendering is between the previous and the current simulation step
+
         self.LEFT_key_down = False
         self.RIGHT_key_down = False
         self.UP_key_down = False
@@ -92,14 +171,33 @@ class GameManager:
         self.ARROW_LEFT_down = False
         self.ARROW_RIGHT_down = False
 
+    def show_loading(self, loading_screen, generator):
+        loading_screen.draw(generator.progress() if generator is not None else 1.0)
+        pygame.display.flip()
+
+    def key_state(self):
+        ''' Keys held down, in InputLog.KEYS order '''
+        return (self.LEFT_key_down, self.RIGHT_key_down, self.UP_key_down, self.DOWN_key_down,
+                self.ARROW_LEFT_down, self.ARROW_RIGHT_down, self.ARROW_UP_down, self.ARROW_DOWN_down)
+
+    def set_key_state(self, keys):
+        (self.LEFT_key_down, self.RIGHT_key_down, self.UP_key_down, self.DOWN_key_down,
+         self.ARROW_LEFT_down, self.ARROW_RIGHT_down, self.ARROW_UP_down, self.ARROW_DOWN_down) = keys
+
     def update(self):
-        delta_time = self.clock.tick() / 1000.0
-        self.Vehicle.update(delta_time, (self.LEFT_key_down, self.RIGHT_key_down, self.UP_key_down, self.DOWN_key_down))
-        self.Ghost.update(delta_time)
-        self.Camera.update((self.ARROW_LEFT_down, self.ARROW_RIGHT_down, self.ARROW_UP_down, self.ARROW_DOWN_down), delta_time)
-        self.Physics.enforce_track_bounds()
-        self.Pickups.update(delta_time)
-        self.LapCounter.update()
+        if self.replay is not None:
+            frame_ms, keys = self.replay.log.frames[self.replay.frame]
+            self.replay.frame += 1
+            self.set_key_state(keys)
+            self.clock.tick(1000.0 / max(frame_ms, 1)) # wait until the recorded frame time has passed
+        else:
+            frame_ms = min(self.clock.tick(), MAX_FRAME_MS) # whole milliseconds, so recorded frames replay exactly
+        if self.recorder is not None:
+            self.recorder.record(frame_ms, self.key_state())
+
+        frame_time = frame_ms / 1000.0
+        self.alpha = self.Simulation.advance(frame_time, self.key_state()[:4])
+        self.Camera.update((self.ARROW_LEFT_down, self.ARROW_RIGHT_down, self.ARROW_UP_down, self.ARROW_DOWN_down), frame_time)
 
     def display(self):
         GL.glEnable(GL.GL_DEPTH_TEST)
@@ -108,17 +206,18 @@ class GameManager:
         GL.glViewport(*self.view_settings["viewport"])
 
         self.Shader.use()
-        self.Camera.update_pos(self.Vehicle.position, self.Vehicle.direction, self.Vehicle.speed)
+        vehicle_position = self.Vehicle.interpolated_position(self.alpha)
+        self.Camera.update_pos(vehicle_position, self.Vehicle.interpolated_direction(self.alpha), self.Vehicle.speed)
         self.Shader.set_camera_position(self.Camera.eye)
 
-        underglow_pos = Point(self.Vehicle.position.x, 0.2, self.Vehicle.position.z)
+        underglow_pos = Point(vehicle_position.x, 0.2, vehicle_position.z)
         self.Track.set_stadium_lighting(underglow_pos, 20.0)  # Very high intensity but short range
 
         # 3D scene
         self.Track.draw()
         self.Pickups.draw()
-        self.Vehicle.draw(self.Shader)
-        self.Ghost.draw(self.Shader)
+        self.Vehicle.draw(self.Shader, alpha=self.alpha)
+        self.Ghost.draw(self.Shader, alpha=self.alpha)
 
         # 2D UI
         self.UI.draw()
@@ -128,6 +227,8 @@ class GameManager:
     def program_loop(self):
         exiting = False
         while not exiting:
+            if self.replay is not None and self.replay.finished():
+                break
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -177,6 +278,12 @@ class GameManager:
             self.display()
 
         #OUT OF GAME LOOP
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.replay is not None:
+            print(f"Replayed {self.replay.frame} of {len(self.replay.log)} frames")
+            if self.replay.finished():
+                print("Final state matches the recording bit for bit" if self.replay.matches() else "Final state DIFFERS from the recording")
         pygame.quit()
 
     def debug_positional_prints(self):
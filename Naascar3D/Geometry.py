@@ -0,0 +1,122 @@
+from math import sqrt, cos, sin
+
+# Plain math types shared by the simulation and the renderer, kept free of OpenGL so the simulation can run headless
+
+class Coordinate:
+    def __init__(self, x=0, y=0):
+        self.x = x
+        self.y = y
+
+    def __add__(self, other):
+        return Coordinate(self.x + other.x, self.y + other.y)
+
+    def __sub__(self, other):
+        return Coordinate(self.x - other.x, self.y - other.y)
+
+    def __mul__(self, n):
+        return Coordinate(self.x * n, self.y * n)
+
+    def __rmul__(self, n):
+        return Coordinate(self.x * n, self.y * n)
+
+    def __eq__(self, other):
+        if isinstance(other, Coordinate):
+            return self.x == other.x and self.y == other.y
+        return False
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+    def __repr__(self):
+        return f"Coordinate({self.x}, {self.y})"
+    
+    def copy(self):
+        return Coordinate(self.x, self.y)
+
+
+class Point:
+    def __init__(self, x, y, z):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def __add__(self, other):
+        return Point(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return Vector(self.x - other.x, self.y - other.y, self.z - other.z)
+    
+    def __mul__(self, x):
+        return Point(self.x * x, self.y * x, self.z * x)
+    
+    def __rmul__(self, x):
+        return Point(self.x * x, self.y * x, self.z * x)
+    
+    def distance(self, other):
+        return sqrt((self.x - other.x)**2 + (self.y - other.y)**2 + (self.z - other.z)**2)
+    
+    def copy(self):
+        return Point(self.x, self.y, self.z)
+
+class Vector:
+    def __init__(self, x, y, z):
+        self.x = x
+        self.y = y
+        self.z = z
+    
+    def __add__(self, other):
+        return Vector(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return Vector(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, scalar):
+        return Vector(self.x * scalar, self.y * scalar, self.z * scalar)
+    
+    def __len__(self):
+        return sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+    
+    def __neg__(self):
+        return Vector(-self.x, -self.y, -self.z)
+    
+    def __mul__(self, x):
+        return Vector(self.x * x, self.y * x, self.z * x)
+    
+    def __rmul__(self, x):
+        return Vector(self.x * x, self.y * x, self.z * x)
+    
+    def copy(self):
+        return Vector(self.x, self.y, self.z)
+    
+    def rotate_y(self, angle):
+        c = cos(angle)
+        s = sin(angle)
+        new_x = c * self.x - s * self.z
+        new_z = s * self.x + c * self.z
+        return Vector(new_x, self.y, new_z)
+
+    def rotate_x(self, angle):
+        c = cos(angle)
+        s = sin(angle)
+        new_y = c * self.y - s * self.z
+        new_z = s * self.y + c * self.z
+        return Vector(self.x, new_y, new_z)
+
+    def rotate_z(self, angle):
+        c = cos(angle)
+        s = sin(angle)
+        new_x = c * self.x - s * self.y
+        new_y = s * self.x + c * self.y
+        return Vector(new_x, new_y, self.z)
+    
+    def normalize(self):
+        length = self.__len__()
+        self.x /= length
+        self.y /= length
+        self.z /= length
+
+    def dot(self, other):
+        return self.x * other.x + self.y * other.y + self.z * other.z
+
+    def cross(self, other):
+        return Vector(self.y*other.z - self.z*other.y, self.z*other.x - self.x*other.z, self.x*other.y - self.y*other.x)
@@ -0,0 +1,181 @@
+import math
+import os
+import struct
+
+import numpy as np
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+
+class GhostLap:
+    '''
+    One lap of a car as position (world x,z) and yaw sampled SAMPLE_RATE times per second from the moment it
+    crossed the finish line, for the ghost to drive (see GhostState.play_lap). Positions are kept quantised to
+    POSITION_STEP and yaw to YAW_STEPS per turn in small integer arrays, about 10 bytes per sample, and
+    sample() interpolates between the two samples around a time in O(1). After the last sample the lap runs
+    back to the first, so it loops.
+
+    File layout (little endian):
+        header:  magic "NGHO", version (u8), sample rate (u16), position step (f64), yaw steps (u16),
+                 lap time (f64), sample count (u32)
+        samples: x, z and yaw of each sample minus the one before (the first minus 0), as zigzag varints
+    '''
+    MAGIC = b"NGHO"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBHdHdI")
+    SAMPLE_RATE = 20
+    POSITION_STEP = 1.0 / 16.0
+    YAW_STEPS = 4096
+    DIRECTORY = "ghosts"
+
+    def __init__(self, x, z, yaw, lap_time, sample_rate=SAMPLE_RATE, position_step=POSITION_STEP, yaw_steps=YAW_STEPS):
+        ''' x, z and yaw are the quantised integer samples, see record() for quantising world values '''
+        self.x = np.asarray(x, dtype=np.int32)
+        self.z = np.asarray(z, dtype=np.int32)
+        self.yaw = np.asarray(yaw, dtype=np.int16)
+        self.lap_time = lap_time
+        self.sample_rate = sample_rate
+        self.position_step = position_step
+        self.yaw_steps = yaw_steps
+
+    @classmethod
+    def record(cls, positions, yaws, lap_time):
+        ''' A lap from world (x, z) positions and yaws in radians, sampled at SAMPLE_RATE '''
+        x = [round(px / cls.POSITION_STEP) for px, _ in positions]
+        z = [round(pz / cls.POSITION_STEP) for _, pz in positions]
+        half = cls.YAW_STEPS // 2
+        yaw = [(round(a / (2 * math.pi) * cls.YAW_STEPS) + half) % cls.YAW_STEPS - half for a in yaws] # -half..half-1 fits an int16
+        return cls(x, z, yaw, lap_time)
+
+    def __len__(self):
+        return len(self.x)
+
+    def sample(self, time):
+        ''' (x, z, yaw, speed) at time seconds into the lap (looping), linear between samples '''
+        count = len(self.x)
+        time %= self.lap_time
+        position = time * self.sample_rate
+        i = min(int(position), count - 1)
+        j = i + 1 if i + 1 < count else 0
+        # the last sample runs back to the first over what is left of the lap
+        span = 1.0 if j else max(self.lap_time * self.sample_rate - i, 1e-9)
+        f = min((position - i) / span, 1.0)
+
+        x0, z0, x1, z1 = int(self.x[i]), int(self.z[i]), int(self.x[j]), int(self.z[j])
+        step = self.position_step
+        x = (x0 + (x1 - x0) * f) * step
+        z = (z0 + (z1 - z0) * f) * step
+        turn = (int(self.yaw[j]) - int(self.yaw[i]) + self.yaw_steps // 2) % self.yaw_steps - self.yaw_steps // 2 # the short way round
+        yaw = (int(self.yaw[i]) + turn * f) * (2 * math.pi / self.yaw_steps)
+        speed = math.hypot(x1 - x0, z1 - z0) * step * self.sample_rate / span
+        return x, z, yaw, speed
+
+    # -------------------------------------------- Files --------------------------------------------
+    def encode(self):
+        out = bytearray(self.HEADER.pack(self.MAGIC, self.VERSION, self.sample_rate, self.position_step, self.yaw_steps, self.lap_time, len(self.x)))
+        previous = (0, 0, 0)
+        for sample in zip(self.x.tolist(), self.z.tolist(), self.yaw.tolist()):
+            for value, before in zip(sample, previous):
+                value = _zigzag(value - before)
+                while value >= 0x80:
+                    out.append(value & 0x7F | 0x80)
+                    value >>= 7
+                out.append(value)
+            previous = sample
+        return bytes(out)
+
+    @classmethod
+    def decode(cls, data):
+        magic, version, sample_rate, position_step, yaw_steps, lap_time, count = cls.HEADER.unpack_from(data, 0)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"Not a version {cls.VERSION} ghost lap")
+        deltas = []
+        value = shift = 0
+        for byte in data[cls.HEADER.size:]:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                deltas.append(_unzigzag(value))
+                value = shift = 0
+        if len(deltas) != count * 3:
+            raise ValueError(f"Ghost lap has {len(deltas) // 3} samples, its header says {count}")
+        samples = np.cumsum(np.array(deltas, dtype=np.int64).reshape(count, 3), axis=0)
+        return cls(samples[:, 0], samples[:, 1], samples[:, 2], lap_time, sample_rate, position_step, yaw_steps)
+
+    @classmethod
+    def filepath(cls, track):
+        return os.path.join(cls.DIRECTORY, f"best_{track.track_hash()}.ngho")
+
+    @classmethod
+    def load_best(cls, track):
+        ''' The best lap stored for this track, or None '''
+        filepath = cls.filepath(track)
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath, 'rb') as f:
+            return cls.decode(f.read())
+
+    def save_best(self, track):
+        os.makedirs(self.DIRECTORY, exist_ok=True)
+        filepath = self.filepath(track)
+        data = self.encode()
+        with open(filepath, 'wb') as f:
+            f.write(data)
+        print(f"Saved best lap ({self.lap_time:.2f}s, {len(data)} bytes): {filepath}")
+
+
+class LapRecorder:
+    '''
+    Samples the car at GhostLap.SAMPLE_RATE during every lap and, when LapCounter counts one that is faster than
+    the best lap stored for the track, saves it as the new best (see GhostLap). Call update() after every
+    simulation step, with the simulation time at the end of it.
+    '''
+    def __init__(self, track, vehicle, lap_counter):
+        self.track = track
+        self.vehicle = vehicle
+        self.lap_counter = lap_counter
+        best = GhostLap.load_best(track)
+        self.best_time = best.lap_time if best is not None else math.inf
+
+        self.laps_counted = lap_counter.lap_counter
+        self.lap_start = 0.0
+        self.previous = (0.0, self.vehicle_sample()) # time and sample of the last step
+        self.positions = [self.previous[1][:2]]
+        self.yaws = [self.previous[1][2]]
+
+    def vehicle_sample(self):
+        position, direction = self.vehicle.position, self.vehicle.direction
+        return (position.x, position.z, math.atan2(direction.x, direction.z))
+
+    def update(self, time):
+        # samples fall between steps, they are interpolated from the steps on either side
+        previous_time, (px, pz, pyaw) = self.previous
+        x, z, yaw = sample = self.vehicle_sample()
+        turn = (yaw - pyaw + math.pi) % (2 * math.pi) - math.pi
+        next_sample = self.lap_start + len(self.positions) / GhostLap.SAMPLE_RATE
+        while next_sample <= time:
+            f = (next_sample - previous_time) / (time - previous_time)
+            self.positions.append((px + (x - px) * f, pz + (z - pz) * f))
+            self.yaws.append(pyaw + turn * f)
+            next_sample = self.lap_start + len(self.positions) / GhostLap.SAMPLE_RATE
+        self.previous = (time, sample)
+
+        if self.lap_counter.lap_counter != self.laps_counted:
+            self.laps_counted = self.lap_counter.lap_counter
+            self.finish_lap(time)
+
+    def finish_lap(self, time):
+        lap_time = time - self.lap_start
+        if lap_time < self.best_time and len(self.positions) > 1:
+            lap = GhostLap.record(self.positions, self.yaws, lap_time)
+            lap.save_best(self.track)
+            self.best_time = lap_time
+        x, z, yaw = self.previous[1]
+        self.lap_start = time
+        self.positions = [(x, z)]
+        self.yaws = [yaw]
@@ -0,0 +1,80 @@
+from itertools import islice
+from math import cos, sin
+from Geometry import Point, Vector
+
+class GhostState:
+    '''
+    The ghost car as the simulation sees it: it follows the track's racing line (Track.racing_line) at a set
+    speed, or the centre line with settings["racing_line"] False (which costs nothing to build), or drives a
+    recorded lap (play_lap). No OpenGL, so it can be stepped headless (see Simulation.py);
+    Ghost adds the car's mesh and drawing.
+    '''
+    def __init__(self, track, settings = {"position" : Point(0,0,0), "direction" : Vector(1,0,0), "speed" : 5, "hitbox_size" : 2}):
+        self.pos =         settings["position"]
+        self.direction =   settings["direction"]
+        self.speed =       settings["speed"]
+        self.hitbox_size = settings["hitbox_size"]
+        
+        self.Track = track
+
+        # Distance along the line, from level with where the ghost was placed
+        centre = self.Track.centreline.distance_at(self.pos.x, self.pos.z) or 0.0
+        if settings.get("racing_line", True):
+            self.line = self.Track.racing_line
+            self.distance = float(self.line.from_centre(centre))
+        else:
+            self.line = self.Track.centreline
+            self.distance = centre
+
+        self.lap = None # a GhostLap to drive instead of the racing line
+        self.lap_time = 0.0
+
+        # State before the last simulation step, drawing interpolates from here to the current state
+        self.prev_pos = self.pos.copy()
+        self.prev_direction = self.direction.copy()
+
+    @property
+    def position(self):
+        ''' Same name as Vehicle's, for code that handles both (CarCollisions) '''
+        return self.pos
+
+    def play_lap(self, lap):
+        ''' Drives the GhostLap lap (looping) from its start instead of following the racing line '''
+        self.lap = lap
+        self.lap_time = 0.0
+        self._follow_lap()
+        self.prev_pos = self.pos.copy()
+        self.prev_direction = self.direction.copy()
+
+    def _follow_lap(self):
+        x, z, yaw, self.speed = self.lap.sample(self.lap_time)
+        self.pos = Point(x, self.pos.y, z)
+        self.direction = Vector(sin(yaw), 0.0, cos(yaw))
+
+    def update(self, dt):
+        if self.lap is not None:
+            self.lap_time += dt
+            self._follow_lap()
+            return
+
+        # Constant speed along the line: distance is arc length, so no per-tile segments or chord estimates
+        self.distance = (self.distance + self.speed * dt) % self.line.length
+        # In place, save_state() keeps copies of the last step for drawing
+        self.pos.x, self.pos.z, self.direction.x, self.direction.z = self.line.at(self.distance)
+        self.direction.y = 0.0
+
+    def snapshot(self):
+        ''' Everything that carries over from one step to the next, as numbers (see Simulation.snapshot) '''
+        p, d, pp, pd = self.pos, self.direction, self.prev_pos, self.prev_direction
+        return [p.x, p.y, p.z, d.x, d.y, d.z, pp.x, pp.y, pp.z, pd.x, pd.y, pd.z,
+                self.distance, self.speed, self.lap_time]
+
+    def restore(self, values):
+        ''' Takes back a snapshot() from the iterator values '''
+        self.pos, self.direction = Point(*islice(values, 3)), Vector(*islice(values, 3))
+        self.prev_pos, self.prev_direction = Point(*islice(values, 3)), Vector(*islice(values, 3))
+        self.distance, self.speed, self.lap_time = next(values), next(values), next(values)
+
+    def save_state(self):
+        self.prev_pos = self.pos.copy()
+        self.prev_direction = self.direction.copy()
@@ -1,6 +1,8 @@
 
-from random import choice, randint, shuffle
-from Base3DObjects import Point, Coordinate
+from random import Random, randint
+from Geometry import Point, Coordinate
+from BitGrid import BitGrid
+from LoopGrower import LoopGrower
 
 
 class Cell:
@@ -85,6 +87,8 @@ class Cell:
         
 
 class Grid:
+    DIRECTIONS = (Coordinate(0,1), Coordinate(1,0), Coordinate(0,-1), Coordinate(-1,0))  # N, E, S, W
+
     TRACK_TYPE_FOR_DIRECTIONAL_CHANGE = {
         (Coordinate( 1, 0), Coordinate( 1, 0)): 'h0',
         (Coordinate( 1, 0), Coordinate( 0, 1)): 'd2',
@@ -107,17 +111,38 @@ class Grid:
         (Coordinate( 0,-1), Coordinate( 0, 1)): 'x'
     }
 
-    def __init__(self, settings = {"size":8, "min_length":10, "max_length":16}):
+    def __init__(self, settings = {"size":8, "min_length":10, "max_length":16, "backend":"bitboard", "algorithm":"dfs", "seed":None}):
         self.size = settings["size"]
         self.start = None
         self.min_length = settings["min_length"]
         self.max_length = settings["max_length"]
+        self.backend = settings.get("backend", "bitboard") # "bitboard" or "cells", which one generate_random_track searches with
+        self.algorithm = settings.get("algorithm", "dfs") # "dfs" searches for a loop, "grow" builds one (see LoopGrower)
+
+        # All randomness comes from this generator, so the same seed, size and lengths always give the same track
+        self.seed = settings.get("seed")
+        if self.seed is None:
+            self.seed = randint(0, 2**31 - 1)
+        self.random = Random(self.seed)
         self.length = 1
         self.cells = {}
         for x in range(self.size):
             for y in range(self.size):
                 self.cells[Coordinate(x,y)] = Cell(x, y)
 
+        # Integer bitmask copy of the finished track, for fast tile lookups (see BitGrid)
+        self.bitboard = BitGrid(self.size, self.min_length, self.max_length, self.random)
+
+    def clear(self):
+        ''' Resets every cell to an empty tile so a new track can be generated on the same grid '''
+        for cell in self.cells.values():
+            cell.type = "XX"
+            cell.next = None
+            cell.direction = Coordinate()
+            cell.powerup = None
+        self.start = None
+        self.length = 1
+
     def get_cell(self, pos):
         try:
             return self.cells[pos]
@@ -126,28 +151,48 @@ class Grid:
     
     def get_start(self):
         return self.start
+
+    def get_type(self, x, y):
+        ''' Tile type code (see BitGrid.TYPES) at (x,y), without allocating a Coordinate '''
+        return self.bitboard.get_type(x, y)
+
+    def chain(self):
+        ''' Cells of the track in driving order, starting with the start cell '''
+        cells = [self.start]
+        cell = self.start.next
+        while cell is not self.start:
+            cells.append(cell)
+            cell = cell.next
+        return cells
     
     def set_random_start(self):
-        x = randint(0, self.size - 1)
-        y = randint(0, self.size - 1)
+        x, y, direction = self.pick_random_start()
+        self.start = self.get_cell(Coordinate(x, y))
+        self.start.direction = direction
+        self.start.type = "v1" if self.start.direction == Coordinate(0,1) else "h1"
+        self.start.next = self.get_cell(self.start.get_next_pos())
+
+    def pick_random_start(self):
+        x = self.random.randint(0, self.size - 1)
+        y = self.random.randint(0, self.size - 1)
 
         # Prevent corners
         if (x == 0 and (y == 0 or y == self.size - 1)):
             x += 1
         elif (y == 0 and (x == 0 or x == self.size - 1)):
             y += 1
+        elif (x == self.size - 1 and y == self.size - 1):
+            x -= 1
 
-        self.start = self.get_cell(Coordinate(x, y))
         # Determine valid tile types based on position
         if   x == 0 or x == self.size - 1: # Left or right edge
-            self.start.direction = Coordinate(0,1)  # Facing North
+            direction = Coordinate(0,1)  # Facing North
         elif y == 0 or y == self.size - 1: # Top or bottom edge  
-            self.start.direction = Coordinate(1,0)  # Facing East
+            direction = Coordinate(1,0)  # Facing East
         else:  # Interior
-            self.start.direction = choice( [Coordinate(1,0), Coordinate(0,1)] )  # Randomly choose North or East
+            direction = self.random.choice( [Coordinate(1,0), Coordinate(0,1)] )  # Randomly choose North or East
         
-        self.start.type = "v1" if self.start.direction == Coordinate(0,1) else "h1"
-        self.start.next = self.get_cell(self.start.get_next_pos())
+        return x, y, direction
     
     def bounds_check(self, position):
         return position.x >= 0 and position.x < self.size and position.y >= 0 and position.y < self.size
@@ -164,13 +209,139 @@ class Grid:
         return False
     
     def generate_random_track(self):
-        self.set_random_start()
-        self.dfs(self.start.next, self.start.direction, 1)
+        self.check_length_range()
+        self.random.seed(self.seed)
+        if self.algorithm == "grow":
+            self.clear()
+            self.load_layout(LoopGrower(self.size, self.min_length, self.max_length, self.random).generate_track())
+        elif self.backend == "bitboard":
+            self.search_bitboard(self.bitboard)
+            self.load_bitboard(self.bitboard)
+        else:
+            while True:
+                self.clear()
+                self.set_random_start()
+                if self.pruned_dfs(self.start.next, self.start.direction, 1):
+                    break
+                # Exhausted every layout from this start, try another one
+            self.bitboard.load_grid(self)
         print(self)
+
+    def search_bitboard(self, bitboard):
+        while True:
+            x, y, direction = self.pick_random_start()
+            if bitboard.generate_track(x, y, self.DIRECTIONS.index(direction)):
+                return
+            # Exhausted every layout from this start, try another one
+
+    def load_bitboard(self, bitboard):
+        ''' Rebuilds the Cell chain from a track generated on a BitGrid '''
+        self.clear()
+        indices = bitboard.chain()
+        cells = [self.cells[Coordinate(bitboard.xs[i], bitboard.ys[i])] for i in indices]
+        for n, i in enumerate(indices):
+            cell = cells[n]
+            cell.type = bitboard.TYPES[bitboard.types[i]]
+            cell.direction = self.DIRECTIONS[bitboard.directions[i]].copy()
+            cell.powerup = bitboard.POWERUPS[bitboard.powerups[i]]
+            cell.next = cells[(n + 1) % len(cells)]
+        self.start = cells[0]
+        self.length = bitboard.length
+
+    def check_length_range(self):
+        ''' 
+        A closed loop on a grid always has an even number of cells, so the length of the chain after the start
+        (which is what min_length and max_length measure) has to be odd.
+        '''
+        max_length = min(self.max_length, self.size * self.size - 1)
+        lowest = max(3, self.min_length if self.min_length % 2 == 1 else self.min_length + 1) # smallest loop is 2x2
+        if lowest > max_length:
+            raise ValueError(f"No closed track of length {self.min_length}-{self.max_length} fits a {self.size}x{self.size} grid")
+
+    def pruned_dfs(self, cell, old_direction, length):
+        '''
+        Same search as dfs(), but a branch is abandoned as soon as it can no longer close the loop:
+            - the cell before the start must still be reachable within max_length (manhattan distance + parity)
+            - the empty region ahead must still connect to that cell and be large enough to reach min_length
+        '''
+        directions = list(self.DIRECTIONS)
+        self.random.shuffle(directions)  # make genereration random
+
+        for new_direction in directions:
+            next_x = cell.x + new_direction.x
+            next_y = cell.y + new_direction.y
+
+            if next_x == self.start.x and next_y == self.start.y:
+                if new_direction == self.start.direction and length >= self.min_length and length <= self.max_length:
+                    self.set_cell_direction(cell, old_direction, new_direction)
+                    self.length += 1
+                    return True
+                continue
+
+            next_cell = self.cells.get(Coordinate(next_x, next_y))
+            if next_cell is None or next_cell.type != "XX":
+                continue
+
+            self.set_cell_direction(cell, old_direction, new_direction)
+            if self.can_close_from(next_cell, length + 1) and self.pruned_dfs(next_cell, new_direction, length + 1):
+                self.length += 1
+                self.assign_random_powerup(cell)
+                return True
+
+            cell.direction = Coordinate()
+            cell.type = "XX"
+            cell.next = None
+
+        return False
+
+    def set_cell_direction(self, cell, old_direction, new_direction):
+        cell.type = self.TRACK_TYPE_FOR_DIRECTIONAL_CHANGE[(old_direction, new_direction)]
+        cell.direction = new_direction
+        cell.next = self.get_cell(cell.get_next_pos())
+
+    def can_close_from(self, cell, length):
+        '''
+        Checks if a track whose length-th cell is `cell` can still be closed into a valid loop.
+        The loop can only close through the cell right behind the start, so everything is measured against that cell.
+        '''
+        end_x = self.start.x - self.start.direction.x
+        end_y = self.start.y - self.start.direction.y
+        if cell.x == end_x and cell.y == end_y:
+            return length >= self.min_length and length <= self.max_length
+
+        # Shortest possible closing length, rounded up to the parity every path to the end cell shares
+        distance = abs(cell.x - end_x) + abs(cell.y - end_y)
+        shortest = max(self.min_length, length + distance)
+        if (shortest - length - distance) % 2 == 1:
+            shortest += 1
+        if shortest > self.max_length:
+            return False
+
+        # Flood fill the empty cells reachable from here
+        reached_end = False
+        region = 1
+        visited = {(cell.x, cell.y)}
+        stack = [(cell.x, cell.y)]
+        while stack:
+            x, y = stack.pop()
+            for direction in self.DIRECTIONS:
+                nx, ny = x + direction.x, y + direction.y
+                if (nx, ny) in visited or nx < 0 or nx >= self.size or ny < 0 or ny >= self.size:
+                    continue
+                if self.cells[Coordinate(nx, ny)].type != "XX":
+                    continue
+                if nx == end_x and ny == end_y:
+                    reached_end = True
+                visited.add((nx, ny))
+                region += 1
+                stack.append((nx, ny))
+
+        # The cells between here and the end (both included) all need to fit in the region
+        return reached_end and region >= shortest - length + 1
     
     def dfs(self, cell, old_direction, length):
         directions = [ Coordinate(0,1), Coordinate(1,0), Coordinate(0,-1), Coordinate(-1,0) ]  # N, E, S, W
-        shuffle(directions)  # make genereration random
+        self.random.shuffle(directions)  # make genereration random
 
         if length <= self.max_length:
             for new_direction in directions:
@@ -206,6 +377,10 @@ class Grid:
         
     def load_preset(self, data):
         print("Loading preset")
+        self.load_layout(data)
+        print(self)
+
+    def load_layout(self, data):
         layout = data["layout"]
         prev_direction = data["direction"]
         pos = data["start"]
@@ -222,8 +397,17 @@ class Grid:
 
             prev_direction = cell.direction.copy()
             cell = cell.next
-            self.length += 1
-            print(self)
+        self.length = len(layout) # same count generate_random_track ends with, the layout already includes the start
+        self.bitboard.load_grid(self)
+
+    def to_preset(self):
+        ''' The current track in the same compact form load_preset() reads '''
+        layout = []
+        cell = self.start
+        for _ in range(self.length):
+            layout.append(cell.type + (cell.powerup or ""))
+            cell = cell.next
+        return {"start": Coordinate(self.start.x, self.start.y), "direction": self.start.direction.copy(), "layout": layout}
     
     def get_next_direction(self, type, prev_direction):
         if type == "h0" or type == "v0" or type == "h1" or type == "v1" :
@@ -236,7 +420,7 @@ class Grid:
 
     def assign_random_powerup(self, cell):
         if cell.type in ["v0", "h0"]:
-            num = randint(0, 10)
+            num = self.random.randint(0, 10)
             if num < 3:
                 cell.powerup = "b"
             elif num == 3:
@@ -252,12 +436,13 @@ class Grid:
                 node = self.get_cell(Coordinate(x,self.size - 1 - y))
                 output[y].append(str(node))
 
-        
-        ret = "  ──────────────────────────────────────────────\n"
+        label_width = len(str(self.size - 1))
+        border = " " * (label_width + 1) + "─" * (6 * self.size - 2) + "\n"
+        ret = border
         for n in range(self.size):
-            ret += f"{self.size - 1 - n} "
+            ret += f"{self.size - 1 - n:>{label_width}} "
             ret += "│" + " , ".join(output[n]) + "│\n"
 
-        ret += "  ──────────────────────────────────────────────\n"
-        ret += "   0     1     2     3     4     5     6     7\n"
+        ret += border
+        ret += " " * (label_width + 2) + "".join(f"{x:<6}" for x in range(self.size)).rstrip() + "\n"
         return ret
@@ -0,0 +1,284 @@
+import argparse
+import base64
+import bisect
+import contextlib
+import io
+import json
+import os
+import random
+import struct
+import time
+
+from Geometry import Coordinate
+from GhostLap import GhostLap
+from RacingLine import RacingLine
+from Simulation import DRIVERS, Simulation
+from TrackLayout import TrackLayout
+
+# Keys in the order of their bits in a frame's key byte: the car's (left, right, up, down), then the camera's arrows
+KEYS = ("left", "right", "up", "down", "arrow_left", "arrow_right", "arrow_up", "arrow_down")
+MAX_FRAME_MS = 0xFFFF
+KEYFRAME_INTERVAL = 600 # frames between snapshots of the whole race, about 10 seconds at 60 fps
+
+
+def encode_keys(keys):
+    code = 0
+    for bit, down in enumerate(keys):
+        if down:
+            code |= 1 << bit
+    return code
+
+def decode_keys(code):
+    return tuple(bool(code >> bit & 1) for bit in range(len(KEYS)))
+
+def vehicle_state(vehicle):
+    ''' The car's state as the bytes the log ends with: position, direction, speed and power-up timers as doubles '''
+    position, direction = vehicle.position, vehicle.direction
+    return InputLog.VEHICLE.pack(position.x, position.y, position.z, direction.x, direction.y, direction.z,
+                                 vehicle.speed, vehicle.disabled, vehicle.slowed, vehicle.boosted)
+
+
+class InputLog:
+    '''
+    Everything needed to play one game again exactly: the settings it was started with, including the track
+    layout and the racing line the ghost followed (so a replay does not depend on tracks/, racing_lines/ or
+    generation time, and a line optimised again differently cannot change the race), and the time and keys of each
+    frame. Frame times are whole milliseconds, as pygame's Clock.tick() gives them, so they replay to the same
+    bits. Every keyframe_interval frames there is a snapshot of the whole race (Simulation.snapshot), so a
+    Replay can jump anywhere by playing at most that many frames. The log ends with the car's final state,
+    which a replay must match bit for bit.
+
+    File layout (little endian):
+        header:    magic "NINP", version (u8), settings length (u32), settings as JSON
+        frames:    frame time in ms (u16), keys (u8, one bit per key in KEYS order)
+        keyframes: frame it was taken before (u32), snapshot length (u32), snapshot
+        footer:    frame count (u32), keyframe count (u32), final vehicle state (10 f64, see vehicle_state), magic "NEND"
+    '''
+    MAGIC = b"NINP"
+    END_MAGIC = b"NEND"
+    VERSION = 7
+    HEADER = struct.Struct("<4sBI")
+    FRAME = struct.Struct("<HB")
+    KEYFRAME = struct.Struct("<II")
+    VEHICLE = struct.Struct("<10d")
+    FOOTER = struct.Struct(f"<II{VEHICLE.size}s4s")
+
+    def __init__(self, filepath):
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"Input log not found: {filepath}")
+
+        with open(filepath, 'rb') as f:
+            data = f.read()
+        magic, version, settings_size = self.HEADER.unpack_from(data, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"Not a version {self.VERSION} input log: {filepath}")
+        self.settings = json.loads(data[self.HEADER.size:self.HEADER.size + settings_size])
+
+        count, keyframe_count, self.final_state, end = self.FOOTER.unpack_from(data, len(data) - self.FOOTER.size)
+        if end != self.END_MAGIC:
+            raise ValueError(f"Input log {filepath} was not closed, the game probably crashed while recording")
+        offset = self.HEADER.size + settings_size
+        self.frames = [(ms, decode_keys(code)) for ms, code in self.FRAME.iter_unpack(data[offset:offset + count * self.FRAME.size])]
+        offset += count * self.FRAME.size
+
+        self.keyframes = [] # (frame, snapshot) in frame order
+        for _ in range(keyframe_count):
+            frame, size = self.KEYFRAME.unpack_from(data, offset)
+            offset += self.KEYFRAME.size
+            self.keyframes.append((frame, data[offset:offset + size]))
+            offset += size
+        self.frame_ends = [] # ms from the start to the end of each frame, for seeking by time
+        elapsed = 0
+        for ms, _ in self.frames:
+            elapsed += ms
+            self.frame_ends.append(elapsed)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def preset(self):
+        ''' The recorded track, ready for Grid.load_preset '''
+        preset = self.settings["preset"]
+        return {"start": Coordinate(*preset["start"]), "direction": Coordinate(*preset["direction"]), "layout": preset["layout"]}
+
+    def ghost_lap(self):
+        ''' The lap the ghost drove in the recording, or None if it followed the centre line '''
+        encoded = self.settings.get("ghost_lap")
+        return GhostLap.decode(base64.b64decode(encoded)) if encoded else None
+
+    def racing_line(self):
+        ''' The racing line the ghost followed in the recording (RacingLine.encode), or None if it did not follow one '''
+        encoded = self.settings.get("racing_line")
+        return base64.b64decode(encoded) if encoded else None
+
+    def duration(self):
+        return self.frame_ends[-1] / 1000.0 if self.frames else 0.0
+
+    def frame_at(self, seconds):
+        ''' The frame being played at seconds into the recording '''
+        return min(bisect.bisect_right(self.frame_ends, seconds * 1000.0), len(self.frames))
+
+
+class InputRecorder:
+    '''
+    Writes an InputLog of a Simulation while a game runs: record() every frame before it is simulated, close() at
+    the end. settings are the ones start_race() needs: track_settings, tick_rate, max_steps_per_frame,
+    car_collisions, total_laps and seed. Keyframes are kept in memory until close(), they go after the frames.
+    '''
+    def __init__(self, filepath, simulation, settings, keyframe_interval=KEYFRAME_INTERVAL):
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        preset = simulation.track.Grid.to_preset()
+        settings = dict(settings, preset={
+            "start": [preset["start"].x, preset["start"].y],
+            "direction": [preset["direction"].x, preset["direction"].y],
+            "layout": preset["layout"]
+        })
+        if simulation.ghost.lap is not None: # the best lap may be beaten and replaced before the log is replayed
+            settings["ghost_lap"] = base64.b64encode(simulation.ghost.lap.encode()).decode()
+        elif simulation.ghost.line is not simulation.track.centreline:
+            settings["racing_line"] = base64.b64encode(simulation.ghost.line.encode()).decode()
+        encoded = json.dumps(settings).encode()
+
+        self.filepath = filepath
+        self.file = open(filepath, 'wb')
+        self.file.write(InputLog.HEADER.pack(InputLog.MAGIC, InputLog.VERSION, len(encoded)))
+        self.file.write(encoded)
+        self.simulation = simulation
+        self.keyframe_interval = keyframe_interval
+        self.keyframes = []
+        self.count = 0
+
+    def record(self, frame_ms, keys):
+        if self.count % self.keyframe_interval == 0:
+            self.keyframes.append((self.count, self.simulation.snapshot()))
+        self.file.write(InputLog.FRAME.pack(frame_ms, encode_keys(keys)))
+        self.count += 1
+
+    def close(self):
+        for frame, snapshot in self.keyframes:
+            self.file.write(InputLog.KEYFRAME.pack(frame, len(snapshot)))
+            self.file.write(snapshot)
+        self.file.write(InputLog.FOOTER.pack(self.count, len(self.keyframes), vehicle_state(self.simulation.vehicle), InputLog.END_MAGIC))
+        self.file.close()
+        print(f"Recorded {self.count} frames: {self.filepath}")
+
+
+def start_race(log):
+    ''' A headless Simulation set up like the recorded game, with the global random module seeded the same way '''
+    settings = log.settings
+    random.seed(settings["seed"])
+    track_settings = dict(settings["track_settings"], track_id=0) # the layout comes from the log, see InputLog
+    ghost_lap, racing_line = log.ghost_lap(), log.racing_line()
+    with contextlib.redirect_stdout(io.StringIO()):
+        track = TrackLayout(track_settings, log.preset())
+        if racing_line is not None: # raises ValueError if it does not fit the track
+            track.racing_line = RacingLine.decode(racing_line, track.centreline)
+        simulation = Simulation.on_track(track, settings["total_laps"], settings["car_collisions"], settings["tick_rate"],
+                                         settings["max_steps_per_frame"], ghost_racing_line=ghost_lap is None)
+    if ghost_lap is not None:
+        simulation.ghost.play_lap(ghost_lap)
+    return simulation
+
+class Replay:
+    '''
+    An InputLog played into a Simulation, by default a headless one from start_race(). seek() jumps to any frame
+    by restoring the last keyframe before it and playing on from there, so it costs at most keyframe_interval
+    frames however long the recording is.
+    '''
+    def __init__(self, log, simulation=None):
+        self.log = log
+        self.simulation = simulation if simulation is not None else start_race(log)
+        self.keyframe_frames = [frame for frame, _ in log.keyframes]
+        self.frame = 0 # next frame to play
+
+    def finished(self):
+        return self.frame == len(self.log.frames)
+
+    def play(self, count=1, realtime=False):
+        ''' Plays the next count frames, as fast as possible or with realtime at the recorded frame times '''
+        next_frame = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for frame_ms, keys in self.log.frames[self.frame:self.frame + count]:
+                self.simulation.advance(frame_ms / 1000.0, keys[:4])
+                self.frame += 1
+                if realtime:
+                    next_frame += frame_ms / 1000.0
+                    time.sleep(max(0.0, next_frame - time.perf_counter()))
+
+    def seek(self, frame):
+        ''' Gets to just before frame: from the last keyframe before it, unless playing on from here is shorter '''
+        frame = max(0, min(frame, len(self.log.frames)))
+        i = bisect.bisect_right(self.keyframe_frames, frame) - 1
+        if i >= 0 and not self.keyframe_frames[i] <= self.frame <= frame:
+            keyframe, snapshot = self.log.keyframes[i]
+            self.simulation.restore(snapshot)
+            self.frame = keyframe
+        elif frame < self.frame: # no keyframe before it, start over
+            self.simulation = start_race(self.log)
+            self.frame = 0
+        self.play(frame - self.frame)
+
+    def seek_time(self, seconds):
+        self.seek(self.log.frame_at(seconds))
+
+    def matches(self):
+        ''' Whether the car is exactly in the recorded final state, once the whole log has been played '''
+        return self.finished() and vehicle_state(self.simulation.vehicle) == self.log.final_state
+
+def replay(log, realtime=False, start=0.0):
+    '''
+    Plays the log without rendering from start seconds in, as fast as possible or with realtime at the recorded
+    frame times, and returns the Simulation and whether the car ended up in exactly the recorded state.
+    '''
+    player = Replay(log)
+    player.seek_time(start)
+    player.play(len(log.frames), realtime)
+    return player.simulation, player.matches()
+
+def record_driver(filepath, track_settings, driver, seconds, frame_ms=16, total_laps=3, car_collisions=True, tick_rate=60, max_steps_per_frame=5):
+    ''' Records a scripted driver (see Simulation.DRIVERS) headless, frame_ms per frame, as if it had been played '''
+    random.seed(track_settings["seed"])
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulation = Simulation.headless(track_settings, None, total_laps, car_collisions, tick_rate, max_steps_per_frame)
+        recorder = InputRecorder(filepath, simulation, {
+            "track_settings": track_settings, "tick_rate": tick_rate, "max_steps_per_frame": max_steps_per_frame,
+            "car_collisions": car_collisions, "total_laps": total_laps, "seed": track_settings["seed"]
+        })
+        for _ in range(round(seconds * 1000 / frame_ms)):
+            keys = driver(simulation)
+            recorder.record(frame_ms, keys + (False,) * 4)
+            simulation.advance(frame_ms / 1000.0, keys)
+        recorder.close()
+    print(f"Recorded {recorder.count} frames ({seconds:.0f}s) of a scripted driver: {filepath}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay an input log (record one with game_settings['record'] or --driver) and check it ends in the recorded state")
+    parser.add_argument("filepath", nargs="?", default="replays/last.ninp")
+    parser.add_argument("--realtime", action="store_true", help="play at the recorded frame times instead of as fast as possible")
+    parser.add_argument("--render", action="store_true", help="play it in the game window, at the recorded speed")
+    parser.add_argument("--start", default="0", help="seconds or minutes:seconds into the recording to start from")
+    parser.add_argument("--driver", choices=sorted(DRIVERS), help="record a scripted driver to filepath first")
+    parser.add_argument("--seconds", type=float, default=60.0, help="seconds to record with --driver")
+    parser.add_argument("--seed", type=int, default=1, help="track seed with --driver")
+    args = parser.parse_args()
+    minutes, _, seconds = args.start.rpartition(":")
+    start_seconds = int(minutes or 0) * 60 + float(seconds)
+
+    if args.driver:
+        track_settings = {"track_id": 0, "grid_size": 8, "tile_size": 32.0, "road_width": 16.0, "min_length": 12, "max_length": 24, "track_algorithm": "dfs", "seed": args.seed}
+        record_driver(args.filepath, track_settings, DRIVERS[args.driver](args.seed), args.seconds)
+
+    if args.render:
+        from GameManager import GameManager
+        GameManager(game_settings={"track_number": 0, "min_len": 0, "max_len": 0, "replay": args.filepath, "replay_start": start_seconds}).start()
+    else:
+        log = InputLog(args.filepath)
+        start = time.perf_counter()
+        simulation, matches = replay(log, args.realtime, start_seconds)
+        wall = time.perf_counter() - start
+        print(f"Replayed {log.duration() - min(start_seconds, log.duration()):.1f}s of {log.duration():.1f}s ({len(log)} frames, {len(log.keyframes)} keyframes) "
+              f"in {wall:.2f}s, lap {simulation.lap_counter.lap_counter}/{simulation.lap_counter.total_laps}")
+        print("Final state matches the recording bit for bit" if matches else "Final state DIFFERS from the recording")
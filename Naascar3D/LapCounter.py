@@ -1,79 +1,133 @@
+import math
+
+import numpy as np
 
-from inspect import stack
-from Base3DObjects import Point
 
 class LapCounter:
-    CHECKPOINT_WIDTH = 5.0
+    '''
+    Laps, sector times and a wrong-way flag for one car, from where it is along the lap (Track.progress_index).
+    race_distance adds up every step's move along the track, forwards or back, from the finish line at the start
+    of the race: a lap counts when the car gets a lap length further than ever before, so backing over the line
+    and crossing it again counts nothing twice, and cutting across the grid counts nothing at all. The lap is split
+    into SECTORS equal sectors, timed in sector_times (the current lap's, the rest are from the lap before).
+    wrong_way is set while the car drives back more than WRONG_WAY_DISTANCE behind the furthest it has been.
+    Call update(time) after each simulation step; nothing in it depends on the length of the track.
+    '''
+    SECTORS = 3
+    WRONG_WAY_DISTANCE = 8.0
 
     def __init__(self, track, vehicle, total_laps = 3):
         self.track = track
         self.vehicle = vehicle
-        
-        self.half_tile = track.half_tile
-        tile_size = track.tile_size
-
-        direction = self.track.Grid.start.direction
-        self.start_direction = Point(direction.y, 0, direction.x)
         self.total_laps = total_laps
-        self.horizontal = (self.track.Grid.start.type == "h1")
-        self.finish_line_pos = self.track.Grid.start.real_center
-        self.checkpoint_1_pos = self.track.Grid.start.real_exit
-        self.checkpoint_2_pos = self.track.Grid.start.real_enter
+        self.progress = track.progress_index
+        self.sector_length = self.progress.length / self.SECTORS
 
-        self.finish_line =  { "pos": self.finish_line_pos }
-        self.checkpoint_1 = { "pos": self.checkpoint_1_pos, "passed": False }
-        self.checkpoint_2 = { "pos": self.checkpoint_2_pos, "passed": False }
+        distance = self.progress.distance(vehicle.position.x, vehicle.position.z) or 0.0
+        self.lap_distance = distance # where the car is along the lap, 0 to progress.length
+        self.race_distance = distance if distance < self.progress.length / 2 else distance - self.progress.length # behind the line is < 0
+        self.furthest = self.race_distance
+        self.sectors_passed = 0
+        self.sector_start = 0.0 # time the current sector was started
+        self.sector_times = [0.0] * self.SECTORS
+        self.wrong_way = False
+        self.finish_time = math.inf
 
         self.lap_counter = 0
 
-    def update(self):
-        if self.lap_counter == 3:
+    def update(self, time):
+        if self.lap_counter >= self.total_laps:
+            return
+
+        distance = self.progress.distance(self.vehicle.position.x, self.vehicle.position.z)
+        if distance is None:
             return
-        
-        if self.is_in_zone(self.finish_line["pos"]):
-            self.trigger_finish_line()
-        elif self.is_in_zone(self.checkpoint_1["pos"]):
-            self.trigger_checkpoint_1()
-        elif self.is_in_zone(self.checkpoint_2["pos"]):
-            self.trigger_checkpoint_2()
-
-    def is_in_zone(self, checkpoint_pos):
-        """ Check if vehicle is in square zone around checkpoint Point"""
-        if self.horizontal:
-            return  (checkpoint_pos.x - self.half_tile <= self.vehicle.position.x <= checkpoint_pos.x + self.half_tile) and \
-                    (checkpoint_pos.z - self.CHECKPOINT_WIDTH <= self.vehicle.position.z <= checkpoint_pos.z + self.CHECKPOINT_WIDTH)
-        else:
-            return  (checkpoint_pos.x - self.CHECKPOINT_WIDTH <= self.vehicle.position.x <= checkpoint_pos.x + self.CHECKPOINT_WIDTH) and \
-                    (checkpoint_pos.z - self.half_tile <= self.vehicle.position.z <= checkpoint_pos.z + self.half_tile)
-
-    def trigger_checkpoint_1(self):
-        if not self.checkpoint_1["passed"]:
-            if not self.checkpoint_2["passed"]:
-                self.checkpoint_1["passed"] = True
-            else:
-                self.checkpoint_1["passed"] = True
-                self.checkpoint_2["passed"] = False
-
-    def trigger_checkpoint_2(self):
-        if not self.checkpoint_2["passed"]:
-            if self.checkpoint_1["passed"]:
-                self.checkpoint_2["passed"] = True
-            else:
-                self.checkpoint_2["passed"] = True
-                self.checkpoint_1["passed"] = False
-
-    def trigger_finish_line(self):
-        if self.checkpoint_1["passed"] and self.checkpoint_2["passed"]:
-            self.checkpoint_1["passed"] = False
-            self.checkpoint_2["passed"] = False
-            self.increment_lap()
-        else:
-            self.checkpoint_1["passed"] = False
-            self.checkpoint_2["passed"] = False
-    
-    def increment_lap(self):
+        half = self.progress.length / 2
+        moved = (distance - self.lap_distance + half) % self.progress.length - half # the short way round, over the line too
+        self.lap_distance = distance
+        self.race_distance += moved
+
+        if moved < 0.0 and self.furthest - self.race_distance > self.WRONG_WAY_DISTANCE:
+            self.wrong_way = True
+        elif moved > 0.0:
+            self.wrong_way = False
+
+        if self.race_distance > self.furthest:
+            self.furthest = self.race_distance
+            while self.furthest >= (self.sectors_passed + 1) * self.sector_length:
+                self.complete_sector(time)
+
+    def complete_sector(self, time):
+        sector = self.sectors_passed % self.SECTORS
+        self.sector_times[sector] = time - self.sector_start
+        self.sector_start = time
+        self.sectors_passed += 1
+        if sector == self.SECTORS - 1:
+            self.increment_lap(time)
+
+    def increment_lap(self, time):
         self.lap_counter += 1
-        self.finish_line["passed"] = True
-        print(f"Lap {self.lap_counter}/{self.total_laps} completed!")
+        print(f"Lap {self.lap_counter}/{self.total_laps} completed! {sum(self.sector_times):.2f}s "
+              f"({', '.join(f'{t:.2f}' for t in self.sector_times)})")
         if self.lap_counter >= self.total_laps:
-            print("All laps completed!")
\ No newline at end of file
+            self.finish_time = time
+            print("All laps completed!")
+
+    def snapshot(self):
+        ''' Everything that carries over from one step to the next, as numbers (see Simulation.snapshot) '''
+        return [self.lap_counter, self.lap_distance, self.race_distance, self.furthest, self.sectors_passed,
+                self.sector_start, self.wrong_way, self.finish_time, *self.sector_times]
+
+    def restore(self, values):
+        ''' Takes back a snapshot() from the iterator values '''
+        self.lap_counter = int(next(values))
+        self.lap_distance, self.race_distance, self.furthest = next(values), next(values), next(values)
+        self.sectors_passed = int(next(values))
+        self.sector_start = next(values)
+        self.wrong_way = bool(next(values))
+        self.finish_time = next(values)
+        self.sector_times = [next(values) for _ in range(self.SECTORS)]
+
+
+def race_order(lap_counters):
+    ''' Indices of lap_counters from first to last place: finished cars by finish time, then the rest by race distance '''
+    return sorted(range(len(lap_counters)), key=lambda i: (lap_counters[i].finish_time, -lap_counters[i].race_distance))
+
+
+class BatchLapCounter:
+    '''
+    LapCounter for the N cars of a VehicleBatch, in arrays: laps, race distance, furthest and wrong way per car,
+    all updated at once from the cars' x and z (no sector times). order() ranks them like race_order.
+    '''
+    def __init__(self, track, x, z, total_laps = 3):
+        self.total_laps = total_laps
+        self.progress = track.progress_index
+        length = self.progress.length
+
+        distance = np.nan_to_num(self.progress.distances(x, z))
+        self.lap_distance = distance
+        self.race_distance = np.where(distance < length / 2, distance, distance - length)
+        self.furthest = self.race_distance.copy()
+        self.laps = np.zeros(len(distance), dtype=np.int64)
+        self.wrong_way = np.zeros(len(distance), dtype=bool)
+        self.finish_time = np.full(len(distance), np.inf)
+
+    def update(self, x, z, time):
+        length = self.progress.length
+        distance = self.progress.distances(x, z)
+        racing = ~np.isnan(distance) & (self.laps < self.total_laps)
+        distance = np.where(racing, distance, self.lap_distance)
+        moved = (distance - self.lap_distance + length / 2) % length - length / 2
+        self.lap_distance = distance
+        self.race_distance += moved
+
+        self.wrong_way = np.where(moved < 0.0, self.wrong_way | (self.furthest - self.race_distance > LapCounter.WRONG_WAY_DISTANCE),
+                                  self.wrong_way & (moved == 0.0))
+        self.furthest = np.maximum(self.furthest, self.race_distance)
+        laps = np.minimum(np.floor(self.furthest / length).astype(np.int64), self.total_laps)
+        self.finish_time[(laps >= self.total_laps) & (self.laps < self.total_laps)] = time
+        self.laps = laps
+
+    def order(self):
+        ''' Car indices from first to last place '''
+        return np.lexsort((-self.race_distance, self.finish_time))
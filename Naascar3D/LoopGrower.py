@@ -0,0 +1,277 @@
+from random import Random
+
+from Geometry import Coordinate
+
+
+class LoopGrower:
+    '''
+    Builds a closed track by local moves on a loop instead of searching for one, so the time it takes grows
+    linearly with the track length no matter how full the grid gets.
+
+    The loop is a doubly linked list over cell indices (y * size + x) with three moves:
+        bump:    a→b becomes a→p→q→b, with p and q the empty cells beside the edge a→b (+2 cells)
+        unbump:  the reverse of a bump (-2 cells)
+        flip:    a corner a→b→c is moved to the empty fourth cell of its 2x2 square (same length)
+    Short loops grow from a 2x2 square, long ones shrink from a serpentine cycle that fills the whole grid.
+    Flips are mixed in so neither ends up looking like its starting shape.
+    '''
+    DIRECTIONS = ((0, 1), (1, 0), (0, -1), (-1, 0)) # N, E, S, W, same order as Grid.DIRECTIONS
+    # (incoming direction, outgoing direction) -> tile, matches Grid.TRACK_TYPE_FOR_DIRECTIONAL_CHANGE
+    TURN_TYPES = {
+        (1, 0): "d2", (1, 2): "d1",
+        (3, 0): "d3", (3, 2): "d0",
+        (0, 1): "d0", (0, 3): "d1",
+        (2, 1): "d3", (2, 3): "d2"
+    }
+    MOVES_PER_CELL = 20 # attempts per cell of the target before a loop counts as stuck and is started over
+
+    def __init__(self, size, min_length, max_length, random=None):
+        self.size = size
+        self.min_length = min_length
+        self.max_length = max_length
+        self.random = random or Random()
+
+        # A loop needs an even number of cells and at least one straight for the start (smallest is 2x3)
+        self.capacity = size * size - (size % 2)
+        self.lengths = [length for length in range(max(5, min_length), min(max_length, self.capacity - 1) + 1) if length % 2 == 1]
+        if not self.lengths:
+            raise ValueError(f"No closed track of length {min_length}-{max_length} fits a {size}x{size} grid")
+
+    def generate_track(self):
+        ''' Returns a random track as a preset (see Grid.load_preset), with a chain of min_length..max_length cells after the start '''
+        target = self.random.choice(self.lengths) + 1
+        while True:
+            if target <= self.capacity // 2:
+                found = self.grow(target)
+            else:
+                found = self.shrink(target)
+            if found:
+                preset = self.to_preset()
+                if preset is not None:
+                    return preset
+            # Stuck, or only corners to put the start on: start over
+
+    # ----------------------------------------- Loop moves -----------------------------------------
+    def reset(self):
+        self.next = [-1] * (self.size * self.size)
+        self.prev = [-1] * (self.size * self.size)
+        self.cells = [] # cells of the loop in no particular order, for picking one at random
+        self.slot = {}  # cell -> position in self.cells
+
+    def link(self, cells):
+        ''' Makes the loop visit `cells` in order '''
+        for a, b in zip(cells, cells[1:] + cells[:1]):
+            self.next[a] = b
+            self.prev[b] = a
+        for cell in cells:
+            self.slot[cell] = len(self.cells)
+            self.cells.append(cell)
+
+    def add(self, cell):
+        self.slot[cell] = len(self.cells)
+        self.cells.append(cell)
+
+    def remove(self, cell):
+        last = self.cells.pop()
+        if last != cell:
+            self.cells[self.slot[cell]] = last
+            self.slot[last] = self.slot[cell]
+        del self.slot[cell]
+        self.next[cell] = self.prev[cell] = -1
+
+    def offset(self, cell, dx, dy):
+        ''' Index of the cell (dx,dy) away, or -1 if that is off the grid '''
+        x = cell % self.size + dx
+        y = cell // self.size + dy
+        if x < 0 or x >= self.size or y < 0 or y >= self.size:
+            return -1
+        return y * self.size + x
+
+    def is_empty(self, cell):
+        return cell >= 0 and self.next[cell] == -1
+
+    def bump(self, a):
+        b = self.next[a]
+        step = b - a
+        sides = [(1, 0), (-1, 0)] if step == self.size or step == -self.size else [(0, 1), (0, -1)]
+        if self.random.random() < 0.5:
+            sides.reverse()
+        for dx, dy in sides:
+            p = self.offset(a, dx, dy)
+            q = self.offset(b, dx, dy)
+            if self.is_empty(p) and self.is_empty(q):
+                self.next[a], self.next[p], self.next[q] = p, q, b
+                self.prev[p], self.prev[q], self.prev[b] = a, p, q
+                self.add(p)
+                self.add(q)
+                return True
+        return False
+
+    def unbump(self, a):
+        p = self.next[a]
+        q = self.next[p]
+        b = self.next[q]
+        if p - a != q - b or abs(b - a) not in (1, self.size) or abs(p - a) not in (1, self.size):
+            return False
+        if abs(b - a) == 1 and b // self.size != a // self.size:
+            return False # a and b are at opposite ends of two rows
+        self.remove(p)
+        self.remove(q)
+        self.next[a] = b
+        self.prev[b] = a
+        return True
+
+    def flip(self, b):
+        a = self.prev[b]
+        c = self.next[b]
+        ax, ay = a % self.size, a // self.size
+        bx, by = b % self.size, b // self.size
+        cx, cy = c % self.size, c // self.size
+        if ax == cx or ay == cy:
+            return False # straight, nothing to flip
+        d = self.offset(a, cx - bx, cy - by)
+        if not self.is_empty(d):
+            return False
+        self.remove(b)
+        self.next[a], self.next[d] = d, c
+        self.prev[d], self.prev[c] = a, d
+        self.add(d)
+        return True
+
+    def random_cell(self):
+        return self.cells[self.random.randrange(len(self.cells))]
+
+    # ----------------------------------------- Strategies -----------------------------------------
+    def grow(self, target):
+        ''' Grows a 2x2 square by bumps until it has `target` cells '''
+        self.reset()
+        x = self.random.randint(0, self.size - 2)
+        y = self.random.randint(0, self.size - 2)
+        a = y * self.size + x
+        self.link([a, a + 1, a + 1 + self.size, a + self.size])
+
+        for _ in range(self.MOVES_PER_CELL * target):
+            if len(self.cells) == target:
+                return True
+            cell = self.random_cell()
+            if not self.bump(cell):
+                self.flip(cell)
+        return len(self.cells) == target
+
+    def shrink(self, target):
+        ''' Starts from a randomly turned cycle through the whole grid and unbumps it down to `target` cells '''
+        self.reset()
+        n = self.size - 1
+        transform = self.random.choice((
+            lambda x, y: (x, y),         lambda x, y: (n - y, x),
+            lambda x, y: (n - x, n - y), lambda x, y: (y, n - x),
+            lambda x, y: (n - x, y),     lambda x, y: (x, n - y),
+            lambda x, y: (y, x),         lambda x, y: (n - y, n - x),
+        ))
+        cells = []
+        for x, y in self.serpentine(self.size):
+            x, y = transform(x, y)
+            cells.append(y * self.size + x)
+        self.link(cells)
+
+        for _ in range(self.MOVES_PER_CELL * self.capacity):
+            if len(self.cells) == target:
+                break
+            cell = self.random_cell()
+            if not self.unbump(cell):
+                self.flip(cell)
+        if len(self.cells) != target:
+            return False
+
+        # Flips only, so a full-length loop does not stay a plain serpentine
+        for _ in range(target):
+            self.flip(self.random_cell())
+        return True
+
+    @staticmethod
+    def serpentine(size):
+        '''
+        (x,y) of a cycle through every cell of a size x size grid, or all but the top left corner if the size is odd.
+        Snakes over columns 1.. row by row and returns down column 0. For odd sizes the last snaking row also
+        zigzags through the top row.
+        '''
+        rows = size - (size % 2)
+        cells = []
+        for y in range(rows - 1):
+            columns = range(1, size) if y % 2 == 0 else range(size - 1, 0, -1)
+            cells.extend((x, y) for x in columns)
+        y = rows - 1
+        if size % 2 == 0:
+            cells.extend((x, y) for x in range(size - 1, 0, -1))
+        else:
+            for x in range(size - 1, 0, -2):
+                cells.extend(((x, y), (x, y + 1), (x - 1, y + 1), (x - 1, y)))
+        cells.extend((0, y) for y in range(rows - 1, -1, -1))
+        return cells
+
+    # ----------------------------------------- Output -----------------------------------------
+    def to_preset(self):
+        '''
+        Picks a random straight away from the grid's corners as the start and turns the loop into a preset.
+        The loop is driven in whichever direction makes the start face north (v1) or east (h1).
+        Returns None if the loop has no straight to start on.
+        '''
+        straights = []
+        for cell in self.cells:
+            a, b = self.prev[cell], self.next[cell]
+            if b - cell == cell - a:
+                straights.append(cell)
+        if not straights:
+            return None
+        start = self.random.choice(straights)
+
+        following = self.next
+        if self.next[start] - start in (-1, -self.size): # heading west or south, drive the other way round
+            following = self.prev
+
+        positions = [start]
+        cell = following[start]
+        while cell != start:
+            positions.append(cell)
+            cell = following[cell]
+
+        layout = []
+        directions = []
+        for n, cell in enumerate(positions):
+            after = positions[(n + 1) % len(positions)]
+            directions.append(self.direction_code(cell, after))
+        for n, direction in enumerate(directions):
+            incoming = directions[n - 1]
+            if n == 0:
+                layout.append("v1" if direction == 0 else "h1")
+            elif incoming == direction:
+                layout.append(("v0" if direction % 2 == 0 else "h0") + self.random_powerup())
+            else:
+                layout.append(self.TURN_TYPES[(incoming, direction)])
+
+        return {
+            "start": Coordinate(start % self.size, start // self.size),
+            "direction": Coordinate(*self.DIRECTIONS[directions[0]]),
+            "layout": layout
+        }
+
+    def direction_code(self, cell, after):
+        step = after - cell
+        if step == self.size:
+            return 0
+        if step == 1:
+            return 1
+        if step == -self.size:
+            return 2
+        return 3
+
+    def random_powerup(self):
+        ''' Same odds as Grid.assign_random_powerup '''
+        num = self.random.randint(0, 10)
+        if num < 3:
+            return "b"
+        elif num == 3:
+            return "s"
+        elif num == 9:
+            return "d"
+        return ""
@@ -12,6 +12,7 @@ class MeshData:
 class MeshLoader:
     def __init__(self, mesh_directory="meshes"):
         self.mesh_directory = mesh_directory
+        self.loaded_meshes = {}  # name -> MeshData, filled by preload_meshes()
         self.ensure_directory_exists()
     
     def ensure_directory_exists(self):
@@ -34,6 +35,9 @@ class MeshLoader:
     
     def load_mesh(self, name: str) -> MeshData:
         """Load mesh data from a JSON file"""
+        if name in self.loaded_meshes:
+            return self.loaded_meshes[name]
+
         filepath = os.path.join(self.mesh_directory, f"{name}.json")
         
         if not os.path.exists(filepath):
@@ -59,6 +63,13 @@ class MeshLoader:
         
         return MeshData(positions, normals, indices)
     
+    def preload_meshes(self):
+        """Load every mesh in the mesh directory into memory, so creating objects later does not touch the disk"""
+        for filename in os.listdir(self.mesh_directory):
+            name, extension = os.path.splitext(filename)
+            if extension == ".json":
+                self.loaded_meshes[name] = self.load_mesh(name)
+
     def mesh_exists(self, name: str) -> bool:
         """Check if a mesh file exists"""
         filepath = os.path.join(self.mesh_directory, f"{name}.json")
@@ -1,6 +1,6 @@
 import math
 
-from Base3DObjects import Coordinate
+from Geometry import Coordinate
 
 class Physics3D:
     GRAVITY = -9.81
@@ -10,6 +10,9 @@ class Physics3D:
         self.vehicle = vehicle
 
         self.curr_tile = (self.track.Grid.start.x, self.track.Grid.start.y)
+        self.curr_row = self.tile_row(*self.curr_tile) # of the track's per-tile tables, None off the road
+        # where the car was after the previous step in grid axes (car's z, x), the sweep starts here
+        self.last_x, self.last_y = self.vehicle.position.z, self.vehicle.position.x
 
     def update_current_tile(self):
         # I know this is confusing, but the track's grid is (x,y) while the car's position is (x,y,z), so (z,x) == (x,y)
@@ -19,6 +22,7 @@ class Physics3D:
 
         if (tile_x, tile_y) != self.curr_tile:
             self.curr_tile = (tile_x, tile_y)
+            self.curr_row = self.tile_row(tile_x, tile_y)
 
     def update_active_tiles(self):
         """ Not currently used, but could be useful if it is neccesary to track which tiles are near the car."""
@@ -67,67 +71,235 @@ class Physics3D:
         self.vehicle.position.x += nx * 2
         self.vehicle.position.z += nz * 2
 
+    def snapshot(self):
+        ''' Where the next sweep starts, as numbers (see Simulation.snapshot) '''
+        return [self.last_x, self.last_y, *self.curr_tile]
+
+    def restore(self, values):
+        ''' Takes back a snapshot() from the iterator values '''
+        self.last_x, self.last_y = next(values), next(values)
+        self.curr_tile = (int(next(values)), int(next(values)))
+        self.curr_row = self.tile_row(*self.curr_tile)
+
+    def sync_position(self):
+        """ Call after placing the car somewhere without driving it there, so the next sweep does not start from the old spot """
+        self.last_x, self.last_y = self.vehicle.position.z, self.vehicle.position.x
+        self.update_current_tile()
+
     def enforce_track_bounds(self):
+        """
+        Keeps the car's hitbox off the walls and the inner corners of turns, over the move from where it was after the
+        previous step (last_x, last_y) to where it is now. Nearly every step stays in one tile and is settled by the
+        track's distance field where the car ended up: if everything is further away than the car moved, nothing was
+        hit on the way either. Otherwise that tile's walls are checked along the move, and a move into another tile is
+        swept tile by tile, so a wall is never skipped however far the car moved (see sweep). At the first wall hit
+        the car is put back where it touched it and bounced. Inner corners, which no wall covers, are taken from the
+        distance field, whose normal is only worked out then. Returns whether the car hit anything.
+        """
+        vehicle, track = self.vehicle, self.track
+        position, hitbox, tile_size = vehicle.position, vehicle.hitbox_size, track.tile_size
+        x0, y0 = self.last_x, self.last_y
+        x1, y1 = position.z, position.x # Note the swap: car's z is track's x
+        tile_x, tile_y = x1 // tile_size, y1 // tile_size # whole floats, equal to the ints of curr_tile
+        last_tile_x, last_tile_y = self.curr_tile # always the tile of (x0, y0)
+        if tile_x == last_tile_x and tile_y == last_tile_y:
+            row = self.curr_row
+            if row is None:
+                self.last_x, self.last_y = x1, y1 # off the road, nothing to touch
+                return False
+            local_x, local_y = x1 - tile_x * tile_size, y1 - tile_y * tile_size
+            gap = track.tile_sdf.distance(track.tile_types[row], local_x, local_y) - hitbox
+            dx, dy = x1 - x0, y1 - y0
+            if gap >= 0.0 and gap * gap >= dx * dx + dy * dy: # further from everything than the car moved
+                self.last_x, self.last_y = x1, y1 # same tile, curr_tile stays
+                return False
+            # The tile's walls where the car ended up, the time of impact only for one it got past
+            hit = None
+            for nx, ny, d in track.collision_table[row]:
+                c1 = nx * x1 + ny * y1 - d - hitbox
+                if c1 < 0:
+                    c0 = nx * x0 + ny * y0 - d - hitbox
+                    time = c0 / (c0 - c1) if c0 >= 0 else 0.0
+                    if hit is None or time < hit[0]:
+                        hit = (time, nx, ny)
+            if hit is None:
+                if gap >= 0.0:
+                    self.last_x, self.last_y = x1, y1 # close, but nothing touched
+                    return False
+                corner = track.tile_sdf.lookup(track.tile_types[row], local_x, local_y)
+        else:
+            hit = self.sweep(x0, y0, x1, y1)
+            corner = self.nearest_obstacle(x1, y1, hitbox) if hit is None else None
+
+        if hit is not None:
+            time_of_impact, nx, ny = hit
+            position.z = x0 + (x1 - x0) * time_of_impact
+            position.x = y0 + (y1 - y0) * time_of_impact
+            self.collide(nx, ny)
+        elif corner is not None and corner[0] < hitbox:
+            self.collide(corner[1], corner[2])
+        else:
+            self.last_x, self.last_y = x1, y1
+            self.update_current_tile()
+            return False
+        self.last_x, self.last_y = position.z, position.x
         self.update_current_tile()
+        return True
 
-        self.enforce_tile_bounds(self.track.get_cell(Coordinate(self.curr_tile[0], self.curr_tile[1])))
+    def nearest_obstacle(self, x, y, radius):
+        """
+        (distance, normal x, normal y) of the nearest wall or inner corner of the tile at (x,y) (grid axes, world units)
+        from Track.tile_sdf if it is closer than radius, else None. Off the track there is nothing to touch, but the
+        car may have crossed a wall to get there, so that gives an infinite distance rather than None.
+        """
+        tile_size = self.track.tile_size
+        tile_x, tile_y = int(x // tile_size), int(y // tile_size)
+        row = self.tile_row(tile_x, tile_y)
+        if row is None:
+            return (math.inf, 0.0, 0.0)
+        return self.track.tile_sdf.contact(self.track.tile_types[row], x - tile_x * tile_size, y - tile_y * tile_size, radius)
 
-    def enforce_tile_bounds(self, cell):
-        if cell.type == "XX":
-            return  # No walls on this tile
+    def sweep(self, x0, y0, x1, y1):
+        """
+        First wall the hitbox touches moving from (x0,y0) to (x1,y1), in world units along the grid axes.
+        Returns (time of impact 0..1, wall normal x, wall normal y) or None. Walls come from Track.collision_table.
+        A move within one tile, nearly every step, only checks that tile's walls; a longer one goes one tile at a
+        time in the order the move crosses them (tiles_crossed), and stops at tiles without road.
+        """
+        tile_size = self.track.tile_size
+        tile_x, tile_y = int(x0 // tile_size), int(y0 // tile_size)
+        if int(x1 // tile_size) == tile_x and int(y1 // tile_size) == tile_y:
+            walls = self.tile_walls(tile_x, tile_y)
+            return None if walls is None else self.first_wall(walls, x0, y0, x1, y1, 0.0, 1.0)
 
-        tile_min_x = cell.x * self.track.tile_size
-        tile_min_y = cell.y * self.track.tile_size
-        tile_max_x = (cell.x + 1) * self.track.tile_size
-        tile_max_y = (cell.y + 1) * self.track.tile_size
+        for tile_x, tile_y, t_enter, t_exit in self.tiles_crossed(x0, y0, x1, y1):
+            walls = self.tile_walls(tile_x, tile_y)
+            if walls is None:
+                return None
+            hit = self.first_wall(walls, x0, y0, x1, y1, t_enter, t_exit)
+            if hit is not None:
+                return hit
+        return None
 
-        car_x, car_y = self.vehicle.position.z, self.vehicle.position.x # Note the swap: car's z is track's x
+    def tile_row(self, tile_x, tile_y):
+        """ Row of the tile in the track's per-tile tables (Track.tile_rows), None for tiles without road and off the grid """
+        grid_size = self.track.grid_size
+        if tile_x < 0 or tile_x >= grid_size or tile_y < 0 or tile_y >= grid_size:
+            return None
+        return self.track.tile_rows.get(tile_y * grid_size + tile_x)
+
+    def tile_walls(self, tile_x, tile_y):
+        """ The walls of the tile from Track.collision_table, None for tiles without road and off the grid """
+        row = self.tile_row(tile_x, tile_y)
+        return None if row is None else self.track.collision_table[row]
+
+    def first_wall(self, walls, x0, y0, x1, y1, t_enter, t_exit):
+        """ sweep for one tile's walls, for the part of the move from t_enter to t_exit that crosses the tile """
         hitbox = self.vehicle.hitbox_size
+        hit = None
+        for nx, ny, d in walls:
+            # clearance between hitbox and wall, linear along the move
+            c0 = nx * x0 + ny * y0 - d - hitbox
+            c1 = nx * x1 + ny * y1 - d - hitbox
+            if c0 + (c1 - c0) * t_exit >= 0:
+                continue # still clear of this wall when leaving the tile
+            if c0 + (c1 - c0) * t_enter < 0:
+                time = t_enter # already touching it when entering the tile
+            else:
+                time = c0 / (c0 - c1)
+            if hit is None or time < hit[0]:
+                hit = (time, nx, ny)
+        return hit
 
-        if cell.type in ("h0", "h1"):  # Horizontal road
-            if car_y - hitbox < tile_min_y:
-                self.collide(0, 1)  # Collide with bottom wall
-                #print("Collide with bottom wall")
-            elif car_y + hitbox > tile_max_y:
-                self.collide(0, -1) # Collide with top wall
-                #print("Collide with top wall")
-
-        elif cell.type in ("v0", "v1"):  # Vertical road
-            if car_x - hitbox < tile_min_x:
-                self.collide(1, 0)  # Collide with left wall
-                #print("Collide with left wall")
-            elif car_x + hitbox > tile_max_x:
-                self.collide(-1, 0) # Collide with right wall
-                #print("Collide with right wall")
-        
-        elif cell.type == "d0":  # 90 degree turn (bottom to right) (45 degree clockwise)
-            if car_x - hitbox < tile_min_x:
-                self.collide(1, 0)  # Collide with left wall
-                #print("Collide with left wall")
-            elif car_y + hitbox > tile_max_y:
-                self.collide(0, -1) # Collide with top wall
-                #print("Collide with top wall")
-
-        elif cell.type == "d1":  # 90 degree turn (left to bottom) (135 degree clockwise)
-            if car_x + hitbox > tile_max_x:
-                self.collide(-1, 0) # Collide with right wall
-                #print("Collide with right wall")
-            elif car_y + hitbox > tile_max_y:
-                self.collide(0, -1) # Collide with top wall
-                #print("Collide with top wall")
-
-        elif cell.type == "d2":  # 90 degree turn (top to left) (225 degree clockwise)
-            if car_x + hitbox > tile_max_x:
-                self.collide(-1, 0) # Collide with right wall
-                #print("Collide with right wall")
-            elif car_y - hitbox < tile_min_y:
-                self.collide(0, 1)  # Collide with bottom wall
-                #print("Collide with bottom wall")
-
-        elif cell.type == "d3":  # 90 degree turn (right to top) (315 degree clockwise)
-            if car_x - hitbox < tile_min_x:
-                self.collide(1, 0)  # Collide with left wall
-                #print("Collide with left wall")
-            elif car_y - hitbox < tile_min_y:
-                self.collide(0, 1)  # Collide with bottom wall
-                #print("Collide with bottom wall")
+    def raycast(self, x, y, dx, dy, max_distance):
+        """
+        Distance from (x,y) along the unit direction (dx,dy), in world units along the grid axes, to the first wall in
+        Track.collision_table or to where the ray leaves the road, at most max_distance. Like sweep, but for a point
+        instead of the hitbox; inner corners of turns have no wall, so rays across them go on to the next tile.
+        """
+        x1, y1 = x + dx * max_distance, y + dy * max_distance
+        for tile_x, tile_y, t_enter, t_exit in self.tiles_crossed(x, y, x1, y1):
+            walls = self.tile_walls(tile_x, tile_y)
+            if walls is None:
+                return t_enter * max_distance
+
+            first = math.inf
+            for nx, ny, d in walls:
+                closing = nx * dx + ny * dy
+                if closing >= 0:
+                    continue # moving away from this wall or along it
+                time = max(t_enter, (d - nx * x - ny * y) / (closing * max_distance))
+                first = min(first, time)
+            if first <= t_exit: # walls lie on the tile's edge, where the ray leaves it
+                return first * max_distance
+        return max_distance
+
+    def tiles_crossed(self, x0, y0, x1, y1):
+        """ Grid DDA: yields (tile_x, tile_y, t_enter, t_exit) for every tile the segment (x0,y0)-(x1,y1) passes, in order """
+        tile_size = self.track.tile_size
+        tile_x, tile_y = int(x0 // tile_size), int(y0 // tile_size)
+        dx, dy = x1 - x0, y1 - y0
+
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        # t at which the segment crosses the next tile boundary along each axis, and the t between two boundaries
+        t_max_x = ((tile_x + (dx > 0)) * tile_size - x0) / dx if dx else math.inf
+        t_max_y = ((tile_y + (dy > 0)) * tile_size - y0) / dy if dy else math.inf
+        t_delta_x = tile_size / abs(dx) if dx else math.inf
+        t_delta_y = tile_size / abs(dy) if dy else math.inf
+
+        t = 0.0
+        while True:
+            t_next = min(t_max_x, t_max_y, 1.0)
+            yield tile_x, tile_y, t, t_next
+            if t_next >= 1.0:
+                return
+            t = t_next
+            if t_max_x < t_max_y:
+                tile_x += step_x
+                t_max_x += t_delta_x
+            else:
+                tile_y += step_y
+                t_max_y += t_delta_y
+
+
+def check_raycast(tracks=(0, 1, 2), ray_range=96.0):
+    '''
+    Regression check for Physics3D.raycast: from the centre of every track tile, a ray straight at each of its walls
+    must stop at the wall, half a tile away, also where the road goes on behind it (another part of the track
+    running alongside). Raises AssertionError otherwise.
+    '''
+    import contextlib
+    import io
+    from TrackLayout import TrackLayout
+    from VehicleState import VehicleState
+
+    print(f"{'track':>5} | {'rays':>5} {'road behind':>11} | {'wrong':>5}")
+    failures = []
+    for track_number in tracks:
+        track_settings = {"track_id": track_number, "grid_size": 8, "tile_size": 32.0, "road_width": 16.0,
+                          "min_length": 12, "max_length": 24, "track_algorithm": "dfs", "seed": 1}
+        with contextlib.redirect_stdout(io.StringIO()):
+            track = TrackLayout(track_settings)
+        physics = Physics3D(track, VehicleState()) # raycast only reads the track
+        tile_size, grid_size = track.tile_size, track.grid_size
+        rays = behind = wrong = 0
+        for tile_id, row in track.tile_rows.items():
+            tile_x, tile_y = tile_id % grid_size, tile_id // grid_size
+            for nx, ny, d in track.collision_table[row]:
+                # normals point into the tile, the ray goes the other way
+                beyond_x, beyond_y = tile_x - int(nx), tile_y - int(ny)
+                if 0 <= beyond_x < grid_size and 0 <= beyond_y < grid_size and beyond_y * grid_size + beyond_x in track.tile_rows:
+                    behind += 1
+                distance = physics.raycast((tile_x + 0.5) * tile_size, (tile_y + 0.5) * tile_size, -nx, -ny, ray_range)
+                rays += 1
+                if abs(distance - tile_size / 2) > 1e-9:
+                    wrong += 1
+                    failures.append(f"track {track_number} tile ({tile_x}, {tile_y}) wall ({nx}, {ny}): {distance}")
+        print(f"{track_number:>5} | {rays:>5} {behind:>11} | {wrong:>5}")
+    if failures:
+        raise AssertionError("Rays through walls: " + "; ".join(failures[:5]))
+
+
+if __name__ == "__main__":
+    check_raycast()
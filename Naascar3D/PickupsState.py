@@ -0,0 +1,117 @@
+from dataclasses import dataclass
+from Geometry import Point
+from SpatialHash import SpatialHash
+
+@dataclass
+class PickupEntity:
+    type: str
+    position: Point
+    scale: float = 2.0
+    color: tuple = (1.0, 0.84, 0.0)
+    timeout: float = 0.0
+    animated_until: float = 0.0 # PickupsState.time its animation has been advanced to
+    object: object = None       # the Pickup mesh, only when drawn (see Pickups)
+
+class PickupsState:
+    '''
+    The pickups on the track, collecting and respawning them. No OpenGL, so it can be stepped headless
+    (see Simulation.py); Pickups adds a mesh per pickup and drawing.
+    '''
+    RESPAWN_TIME = 10.0
+
+    def __init__(self, track, vehicle):
+        self.track = track
+        self.vehicle = vehicle
+
+        self.time = 0.0
+        self.pickups = []
+        self.active = SpatialHash(track.tile_size) # pickups that can be collected, by tile
+        self.respawning = []                       # collected ones counting down their timeout
+        self.init_pickups()
+
+    def update(self, delta_time):
+        '''
+        Only the pickups on the car's tile and the ones next to it are tested, and only collected ones count down,
+        so the cost does not grow with the number of pickups. The spin and bob are advanced when drawing.
+        '''
+        self.time += delta_time
+        respawning = self.respawning
+        self.respawning = []
+        for p in self.active.near(self.vehicle.position):
+            if self.check_collision(p):
+                print(f"Pickup collected: {p.type}")
+                self.apply_pickup_effect(p)
+                p.timeout = self.RESPAWN_TIME
+                self.active.remove(p)
+                self.respawning.append(p)
+
+        for p in respawning:
+            p.timeout -= delta_time
+            if p.timeout < 0:
+                p.timeout = 0.0
+            if p.timeout == 0.0:
+                p.animated_until = self.time # the animation stays paused while it was gone
+                self.active.insert(p, p.position)
+            else:
+                self.respawning.append(p)
+
+    def snapshot(self):
+        '''
+        Timeouts and animation times as numbers (see Simulation.snapshot), and the order the pickups are kept in
+        the spatial hash and the respawn list, which decides the order two pickups collected together take effect
+        '''
+        index = {id(p): i for i, p in enumerate(self.pickups)}
+        active = [index[id(p)] for bucket in self.active.buckets.values() for p in bucket]
+        respawning = [index[id(p)] for p in self.respawning]
+        return [self.time, len(self.pickups), *(value for p in self.pickups for value in (p.timeout, p.animated_until)),
+                len(active), *active, len(respawning), *respawning]
+
+    def restore(self, values):
+        ''' Takes back a snapshot() from the iterator values, for the same track's pickups '''
+        self.time = next(values)
+        if int(next(values)) != len(self.pickups):
+            raise ValueError("Snapshot is of a different track's pickups")
+        for p in self.pickups:
+            p.timeout, p.animated_until = next(values), next(values)
+        self.active = SpatialHash(self.track.tile_size)
+        for _ in range(int(next(values))):
+            p = self.pickups[int(next(values))]
+            self.active.insert(p, p.position)
+        self.respawning = [self.pickups[int(next(values))] for _ in range(int(next(values)))]
+
+    def init_pickups(self):
+        for cell in self.track.Grid.chain(): # powerups are only ever on track cells
+            cell_pickups = cell.powerup
+            if cell_pickups:
+                gx, gy = cell.x, cell.y
+                # grid (gx,gy) -> world (z = gx, x = gy)
+                world_x = gy * self.track.tile_size + self.track.half_tile
+                world_z = gx * self.track.tile_size + self.track.half_tile
+                base_y = 1.5
+                pickup_pos = Point(world_x, base_y, world_z)
+
+                if 'b' in cell_pickups:
+                    self.add_pickup(PickupEntity(type='speed_boost', position=pickup_pos, color=(0.0, 1.0, 0.0)))
+                if 's' in cell_pickups:
+                    self.add_pickup(PickupEntity(type='slow_down', position=pickup_pos, color=(1.0, 1.0, 0.0)))
+                if 'd' in cell_pickups:
+                    self.add_pickup(PickupEntity(type='disable', position=pickup_pos, color=(1.0, 0.0, 0.0)))
+
+    def add_pickup(self, p):
+        self.pickups.append(p)
+        self.active.insert(p, p.position)
+
+    def check_collision(self, p):
+        # squared distances, no sqrt
+        position = self.vehicle.position
+        dx, dy, dz = p.position.x - position.x, p.position.y - position.y, p.position.z - position.z
+        reach = (self.vehicle.hitbox_size + p.scale) / 2.0
+        return dx*dx + dy*dy + dz*dz < reach * reach
+    
+    def apply_pickup_effect(self, p):
+        if p.type == 'speed_boost':
+            self.vehicle.boost()
+        elif p.type == 'slow_down':
+            self.vehicle.slow()
+        elif p.type == 'disable':
+            self.vehicle.disable()
@@ -0,0 +1,242 @@
+import contextlib
+import io
+import math
+import multiprocessing
+
+import numpy as np
+
+from Simulation import Simulation
+from TrackLayout import TrackLayout
+from VehicleState import VehicleState
+
+# Every combination of steering (none, left, right) and pedals (none, throttle, brake), as (left, right, up, down)
+ACTIONS = tuple((left, right, up, down) for left, right in ((False, False), (True, False), (False, True))
+                                        for up, down in ((False, False), (True, False), (False, True)))
+
+
+def progress_reward(env):
+    ''' Tiles driven along the track since the last step (negative when driving back), minus a little for hitting walls '''
+    return env.progress_delta - (env.WALL_PENALTY if env.hit_wall else 0.0)
+
+
+class RaceEnv:
+    '''
+    Reinforcement learning environment around a headless Simulation, with the reset()/step(action) interface of
+    Gym (Gymnasium): reset() returns (observation, info) and step() (observation, reward, terminated, truncated,
+    info). Needs no window or OpenGL.
+
+    An action is an index into ACTIONS or a (left, right, up, down) tuple of keys, held for action_repeat steps
+    of the simulation. The observation is a float32 array: the car's speed over MAX_SPEED, the sine and cosine of
+    its heading relative to the way the track runs there, then the distance to the walls along each of ray_angles
+    (degrees from straight ahead, negative to the left) over ray_range. The reward is env_settings["reward"](env),
+    called after every step; see progress_reward for the default. An episode ends when all laps are done
+    (terminated) or after max_steps actions (truncated).
+    '''
+    TICK_RATE = 60
+    ACTION_REPEAT = 4
+    MAX_STEPS = 2000
+    TOTAL_LAPS = 1
+    CAR_COLLISIONS = False # the ghost only gets in the way of learning to drive
+    RAY_ANGLES = (-90, -45, -20, 0, 20, 45, 90)
+    RAY_RANGE = 96.0
+    WALL_PENALTY = 0.1
+
+    def __init__(self, track_settings, preset=None, env_settings={}):
+        self.track_settings = dict(track_settings)
+        self.preset = preset
+        self.delta_time = 1.0 / env_settings.get("tick_rate", self.TICK_RATE)
+        self.action_repeat = env_settings.get("action_repeat", self.ACTION_REPEAT)
+        self.max_steps = env_settings.get("max_steps", self.MAX_STEPS)
+        self.total_laps = env_settings.get("total_laps", self.TOTAL_LAPS)
+        self.car_collisions = env_settings.get("car_collisions", self.CAR_COLLISIONS)
+        self.ray_range = env_settings.get("ray_range", self.RAY_RANGE)
+        self.reward = env_settings.get("reward", progress_reward)
+        angles = [math.radians(a) for a in env_settings.get("ray_angles", self.RAY_ANGLES)]
+        self.ray_rotations = [(math.cos(a), math.sin(a)) for a in angles]
+
+        self.action_count = len(ACTIONS)
+        self.observation_size = 3 + len(angles)
+        self.track = None
+        self.simulation = None
+
+    def load_track(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.track = TrackLayout(self.track_settings, self.preset)
+
+    def reset(self, seed=None, options=None):
+        '''
+        Puts the car back on the start line. With a seed, a generated track (track_id 0) is swapped for the one
+        with that seed; otherwise the track stays the same.
+        '''
+        if seed is not None and self.track_settings["track_id"] == 0 and seed != self.track_settings.get("seed"):
+            self.track_settings["seed"] = seed
+            self.track = None
+        if self.track is None:
+            self.load_track()
+        # Without car collisions the ghost cannot get in the way, so it need not wait for the racing line
+        self.simulation = Simulation.on_track(self.track, self.total_laps, self.car_collisions, ghost_racing_line=self.car_collisions)
+        self.steps = 0
+        self.progress = self.track_progress()
+        self.progress_delta = 0.0
+        self.hit_wall = False
+        return self.observation(), self.info()
+
+    def step(self, action):
+        keys = ACTIONS[action] if isinstance(action, (int, np.integer)) else tuple(bool(k) for k in action)
+        simulation = self.simulation
+        hit_wall = False
+        with contextlib.redirect_stdout(io.StringIO()): # lap and pickup messages
+            for _ in range(self.action_repeat):
+                simulation.step(self.delta_time, keys)
+                hit_wall = hit_wall or simulation.hit_wall
+                if simulation.finished():
+                    break
+        self.steps += 1
+        self.hit_wall = hit_wall
+
+        progress = self.track_progress()
+        self.progress, self.progress_delta = progress, progress - self.progress
+
+        reward = self.reward(self)
+        terminated = simulation.finished()
+        truncated = not terminated and self.steps >= self.max_steps
+        return self.observation(), reward, terminated, truncated, self.info()
+
+    def track_progress(self):
+        ''' Tiles (tile lengths) along the track from the start line to the car, counting every lap (see LapCounter.race_distance) '''
+        return self.simulation.lap_counter.race_distance / self.track.tile_size
+
+    def heading(self):
+        ''' (sin, cos) of the angle from the way the track runs where the car is to the car's direction, sin > 0 to the right '''
+        along_x, along_z = self.track.progress_index.direction(self.simulation.lap_counter.lap_distance)
+        direction = self.simulation.vehicle.direction
+        return along_x * direction.z - along_z * direction.x, along_x * direction.x + along_z * direction.z
+
+    def observation(self):
+        vehicle = self.simulation.vehicle
+        physics = self.simulation.physics
+        observation = np.empty(self.observation_size, dtype=np.float32)
+        observation[0] = vehicle.speed / VehicleState.MAX_SPEED
+        observation[1], observation[2] = self.heading()
+        dx, dz = vehicle.direction.x, vehicle.direction.z
+        for i, (c, s) in enumerate(self.ray_rotations):
+            ray_x, ray_z = c * dx - s * dz, s * dx + c * dz
+            # Note the swap: car's z is track's x
+            observation[3 + i] = physics.raycast(vehicle.position.z, vehicle.position.x, ray_z, ray_x, self.ray_range) / self.ray_range
+        return observation
+
+    def info(self):
+        return {
+            "lap": self.simulation.lap_counter.lap_counter,
+            "progress": self.progress,
+            "wrong_way": self.simulation.lap_counter.wrong_way,
+            "hit_wall": self.hit_wall,
+            "time": self.simulation.time
+        }
+
+    def close(self):
+        pass
+
+
+# ------------------------------------------ Vectorized ------------------------------------------
+def _reset_envs(envs, seeds):
+    return [env.reset(seed=seed) for env, seed in zip(envs, seeds)]
+
+def _step_envs(envs, actions):
+    ''' Steps each env with its action, resetting the ones whose episode ended '''
+    results = []
+    for env, action in zip(envs, actions):
+        observation, reward, terminated, truncated, info = env.step(action)
+        if terminated or truncated:
+            info["final_observation"] = observation
+            observation, _ = env.reset()
+        results.append((observation, reward, terminated, truncated, info))
+    return results
+
+def _worker(connection, track_settings, preset, env_settings):
+    ''' Runs a list of RaceEnvs in a subprocess, stepping all of them for each message so one round trip covers many steps '''
+    envs = [RaceEnv(settings, preset, env_settings) for settings in track_settings]
+    try:
+        while True:
+            command, data = connection.recv()
+            if command == "step":
+                connection.send(_step_envs(envs, data))
+            elif command == "reset":
+                connection.send(_reset_envs(envs, data))
+            elif command == "close":
+                break
+    finally:
+        connection.close()
+
+class VectorRaceEnv:
+    '''
+    count RaceEnvs stepped together, like Gym's vector environments: observations come as one (count, size)
+    array and rewards, terminated and truncated as arrays; infos is a list of dicts. An environment whose episode
+    ends is reset right away, with its last observation in info["final_observation"].
+
+    With workers = 0 the environments run one after another in this process. Otherwise they are split over that
+    many subprocesses, which step their share in parallel; env_settings is sent to them, so a custom reward must
+    be a function defined at module level. track_settings is one dict for all environments or a list of count.
+    '''
+    def __init__(self, track_settings, count, preset=None, env_settings={}, workers=0):
+        if isinstance(track_settings, dict):
+            track_settings = [dict(track_settings) for _ in range(count)]
+        self.count = count
+        self.workers = workers
+        self.action_count = len(ACTIONS)
+        self.observation_size = RaceEnv(track_settings[0], preset, env_settings).observation_size
+
+        if workers == 0:
+            self.envs = [RaceEnv(settings, preset, env_settings) for settings in track_settings]
+            return
+        self.envs = None
+        self.shares = [len(part) for part in np.array_split(np.arange(count), workers)]
+        self.connections = []
+        self.processes = []
+        first = 0
+        for share in self.shares:
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker, args=(child, track_settings[first:first + share], preset, env_settings), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+            first += share
+
+    def _scatter(self, command, items):
+        ''' Sends each worker its share of items and gathers the results in order '''
+        first = 0
+        for connection, share in zip(self.connections, self.shares):
+            connection.send((command, items[first:first + share]))
+            first += share
+        return [result for connection in self.connections for result in connection.recv()]
+
+    def reset(self, seed=None, options=None):
+        ''' Resets every environment; with a seed, environment i gets seed + i (see RaceEnv.reset) '''
+        seeds = [None if seed is None else seed + i for i in range(self.count)]
+        if self.envs is not None:
+            results = _reset_envs(self.envs, seeds)
+        else:
+            results = self._scatter("reset", seeds)
+        observations, infos = zip(*results)
+        return np.stack(observations), list(infos)
+
+    def step(self, actions):
+        actions = list(actions)
+        if self.envs is not None:
+            results = _step_envs(self.envs, actions)
+        else:
+            results = self._scatter("step", actions)
+        observations, rewards, terminated, truncated, infos = zip(*results)
+        return np.stack(observations), np.array(rewards), np.array(terminated), np.array(truncated), list(infos)
+
+    def close(self):
+        if self.envs is not None:
+            return
+        for connection in self.connections:
+            connection.send(("close", None))
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
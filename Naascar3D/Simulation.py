@@ -0,0 +1,213 @@
+import argparse
+import contextlib
+import io
+import random
+import struct
+import time
+
+from AIDrivers import AIDrivers
+from CarCollisions import collide_cars, overlapping
+from Geometry import Coordinate, Vector
+from GhostState import GhostState
+from LapCounter import LapCounter
+from Physics3D import Physics3D
+from PickupsState import PickupsState
+from TrackLayout import TrackLayout
+from VehicleState import VehicleState
+
+
+class Simulation:
+    '''
+    One race without any rendering: the track, the player's car, the ghost, physics, pickups and the lap counter,
+    stepped by step(delta_time, keys). GameManager drives one with its drawn subclasses (Track, Vehicle, ...) and
+    the keyboard; headless() builds one from the plain state classes, which need no OpenGL and no window.
+    '''
+    def __init__(self, track, vehicle, ghost, pickups, lap_counter, car_collisions=True, tick_rate=60, max_steps_per_frame=5):
+        self.track = track
+        self.vehicle = vehicle
+        self.ghost = ghost
+        self.physics = Physics3D(track, vehicle)
+        self.pickups = pickups
+        self.lap_counter = lap_counter
+        self.car_collisions = car_collisions
+        self.ghost_clear = False # both cars start on the same spot, the ghost only collides once they have come apart
+        self.hit_wall = False # whether the car hit a wall in the last step
+        self.time = 0.0
+        self.lap_recorder = None # a GhostLap.LapRecorder to keep the best lap, if set
+
+        # Fixed step simulation: frame time is collected in the accumulator and simulated in steps of tick_length
+        self.tick_length = 1.0 / tick_rate
+        self.max_steps_per_frame = max_steps_per_frame
+        self.accumulator = 0.0
+
+    @staticmethod
+    def start_settings(track, speed, hitbox_size=2.0):
+        ''' Settings for a car on the start line, facing the way the track goes '''
+        direction = track.Grid.start.direction
+        return {
+            "position": track.start_coordinates().copy(),
+            "direction": Vector(direction.y, 0, direction.x),
+            "hitbox_size": hitbox_size,
+            "speed": speed
+        }
+
+    @classmethod
+    def headless(cls, track_settings, preset=None, total_laps=3, car_collisions=True, tick_rate=60, max_steps_per_frame=5):
+        ''' A race built from the state classes only: TrackLayout, VehicleState, GhostState and PickupsState '''
+        return cls.on_track(TrackLayout(track_settings, preset), total_laps, car_collisions, tick_rate, max_steps_per_frame)
+
+    @classmethod
+    def on_track(cls, track, total_laps=3, car_collisions=True, tick_rate=60, max_steps_per_frame=5, ghost_racing_line=True):
+        '''
+        A new headless race on a track that is already built, to restart without loading the track again. With
+        ghost_racing_line False the ghost keeps to the centre line, so the track's racing line is never built.
+        '''
+        vehicle = VehicleState(cls.start_settings(track, speed=0))
+        ghost = GhostState(track, dict(cls.start_settings(track, speed=20), racing_line=ghost_racing_line))
+        pickups = PickupsState(track, vehicle)
+        lap_counter = LapCounter(track, vehicle, total_laps=total_laps)
+        return cls(track, vehicle, ghost, pickups, lap_counter, car_collisions, tick_rate, max_steps_per_frame)
+
+    def step(self, delta_time, keys):
+        ''' One fixed step, keys = (left, right, up, down) '''
+        self.vehicle.save_state()
+        self.ghost.save_state()
+        self.vehicle.update(delta_time, keys)
+        self.ghost.update(delta_time)
+        self.hit_wall = self.physics.enforce_track_bounds()
+        if self.car_collisions:
+            if self.ghost_clear:
+                collide_cars(self.vehicle, self.ghost, other_fixed=True) # the ghost keeps to its path
+            else:
+                self.ghost_clear = not overlapping(self.vehicle, self.ghost)
+        self.pickups.update(delta_time)
+        self.time += delta_time
+        self.lap_counter.update(self.time)
+        if self.lap_recorder is not None:
+            self.lap_recorder.update(self.time)
+
+    def advance(self, frame_time, keys):
+        '''
+        Runs the fixed steps that frame_time, plus what was left over from earlier frames, covers. After a hitch
+        longer than max_steps_per_frame steps the rest is dropped, so the game slows down instead of jumping ahead.
+        Returns how far the state is between the last two steps (alpha, for drawing).
+        '''
+        self.accumulator += frame_time
+        steps = 0
+        while self.accumulator >= self.tick_length and steps < self.max_steps_per_frame:
+            self.step(self.tick_length, keys)
+            self.accumulator -= self.tick_length
+            steps += 1
+        if steps == self.max_steps_per_frame:
+            self.accumulator = min(self.accumulator, self.tick_length) # drop the rest of the hitch
+        return self.accumulator / self.tick_length
+
+    def snapshot(self):
+        '''
+        The whole race state as bytes: restore() on a Simulation of the same track continues exactly as this one
+        would. Everything is stored as doubles, which keep the ints and bools of the state exact too.
+        '''
+        values = [self.time, self.accumulator, self.ghost_clear, self.hit_wall]
+        for part in (self.vehicle, self.physics, self.ghost, self.lap_counter, self.pickups):
+            values += part.snapshot()
+        return struct.pack(f"<{len(values)}d", *values)
+
+    def restore(self, snapshot):
+        values = iter(struct.unpack(f"<{len(snapshot) // 8}d", snapshot))
+        self.time, self.accumulator = next(values), next(values)
+        self.ghost_clear, self.hit_wall = bool(next(values)), bool(next(values))
+        for part in (self.vehicle, self.physics, self.ghost, self.lap_counter, self.pickups):
+            part.restore(values)
+
+    def finished(self):
+        return self.lap_counter.lap_counter >= self.lap_counter.total_laps
+
+
+# ------------------------------------------ Scripted drivers ------------------------------------------
+# Each takes the simulation and returns the keys (left, right, up, down) for the next step
+
+def idle_driver(simulation):
+    return (False, False, False, False)
+
+def throttle_driver(simulation):
+    return (False, False, True, False)
+
+class RandomDriver:
+    ''' Holds random keys (mostly throttle) for hold_steps steps at a time, the same for the same seed '''
+    def __init__(self, seed=0, hold_steps=30):
+        self.random = random.Random(seed)
+        self.hold_steps = hold_steps
+        self.steps = 0
+        self.keys = (False, False, True, False)
+
+    def __call__(self, simulation):
+        if self.steps % self.hold_steps == 0:
+            steer = self.random.random()
+            self.keys = (steer < 0.3, steer > 0.7, self.random.random() < 0.8, self.random.random() < 0.1)
+        self.steps += 1
+        return self.keys
+
+def follow_driver(simulation):
+    ''' Full throttle, steering for the exit of the tile the car is on '''
+    vehicle, track = simulation.vehicle, simulation.track
+    cell = track.get_cell(Coordinate(int(vehicle.position.z // track.tile_size), int(vehicle.position.x // track.tile_size)))
+    if cell is None or cell.next is None:
+        return (False, False, True, False)
+    target = cell.real_exit
+    to_x, to_z = target.x - vehicle.position.x, target.z - vehicle.position.z
+    side = vehicle.direction.x * to_z - vehicle.direction.z * to_x # > 0: target is to the right (turn_right turns that way)
+    return (side < -0.5, side > 0.5, True, False)
+
+class AIDriver:
+    ''' The pure pursuit AIDrivers steering for the racing line and keeping to its speed plan, the same every time '''
+    def __init__(self):
+        self.drivers = None
+
+    def __call__(self, simulation):
+        if self.drivers is None:
+            self.drivers = AIDrivers(simulation.track)
+        return self.drivers.drive([simulation.vehicle])[0]
+
+DRIVERS = {"idle": lambda seed: idle_driver, "throttle": lambda seed: throttle_driver, "random": RandomDriver, "follow": lambda seed: follow_driver, "ai": lambda seed: AIDriver()}
+
+
+def run(simulation, driver, seconds, delta_time, stop_when_finished=False):
+    '''
+    Steps the simulation for `seconds` of simulated time as fast as it goes. Returns (simulated seconds, wall seconds).
+    Prints (lap messages, pickups) are swallowed so they do not slow the run down.
+    '''
+    steps = round(seconds / delta_time)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(steps):
+            simulation.step(delta_time, driver(simulation))
+            if stop_when_finished and simulation.finished():
+                break
+    return simulation.time, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a race without a window or OpenGL and report how much faster than real time it runs")
+    parser.add_argument("--seconds", type=float, default=120.0, help="simulated seconds")
+    parser.add_argument("--tick-rate", type=int, default=60, help="fixed steps per simulated second")
+    parser.add_argument("--driver", choices=sorted(DRIVERS), default="follow")
+    parser.add_argument("--seed", type=int, default=1, help="track seed (track number 0) and random driver seed")
+    parser.add_argument("--track-number", type=int, default=0)
+    parser.add_argument("--grid-size", type=int, default=8)
+    parser.add_argument("--min-length", type=int, default=12)
+    parser.add_argument("--max-length", type=int, default=24)
+    parser.add_argument("--track-algorithm", choices=("dfs", "grow"), default="dfs")
+    parser.add_argument("--no-car-collisions", action="store_true")
+    parser.add_argument("--until-finished", action="store_true", help="stop once all laps are done")
+    args = parser.parse_args()
+
+    track_settings = {
+        "track_id": args.track_number, "grid_size": args.grid_size, "tile_size": 32.0, "road_width": 16.0,
+        "min_length": args.min_length, "max_length": args.max_length, "track_algorithm": args.track_algorithm, "seed": args.seed
+    }
+    simulation = Simulation.headless(track_settings, car_collisions=not args.no_car_collisions)
+    simulated, wall = run(simulation, DRIVERS[args.driver](args.seed), args.seconds, 1.0 / args.tick_rate, args.until_finished)
+    steps = round(simulated * args.tick_rate)
+    print(f"Simulated {simulated:.1f}s in {wall:.2f}s: {simulated / wall:.0f} simulated seconds per second ({steps / wall:.0f} steps/s)")
+    print(f"Laps {simulation.lap_counter.lap_counter}/{simulation.lap_counter.total_laps}, "
+          f"{sum(p.timeout > 0.0 for p in simulation.pickups.pickups)} of {len(simulation.pickups.pickups)} pickups respawning at the end")
@@ -0,0 +1,53 @@
+class SpatialHash:
+    '''
+    World entities (pickups, later props and other cars) bucketed by the track tile they are on, so a query only
+    looks at the entities on the tile of a position and the 8 around it instead of all of them.
+
+    Positions are world Points like everywhere else: the tile is (z // tile_size, x // tile_size) in grid (x,y).
+    near() finds everything that can touch a position as long as reach (the two hitboxes together) is at most a tile.
+    '''
+    def __init__(self, tile_size):
+        self.tile_size = tile_size
+        self.buckets = {} # (tile_x, tile_y) -> [entity, ...] in the order they were inserted
+        self.keys = {}    # id(entity) -> its bucket's key
+
+    def __len__(self):
+        return len(self.keys)
+
+    def key(self, position):
+        # Note the swap: car's z is track's x
+        return (int(position.z // self.tile_size), int(position.x // self.tile_size))
+
+    def insert(self, entity, position):
+        key = self.key(position)
+        self.buckets.setdefault(key, []).append(entity)
+        self.keys[id(entity)] = key
+
+    def remove(self, entity):
+        key = self.keys.pop(id(entity))
+        bucket = self.buckets[key]
+        for i, other in enumerate(bucket):
+            if other is entity: # by identity, entities may compare equal (dataclasses at the same spot)
+                del bucket[i]
+                break
+        if not bucket:
+            del self.buckets[key]
+
+    def move(self, entity, position):
+        ''' For entities that move: rebuckets it if it changed tiles '''
+        key = self.key(position)
+        if self.keys[id(entity)] != key:
+            self.remove(entity)
+            self.insert(entity, position)
+
+    def near(self, position):
+        ''' Entities on the tile of position and its neighbours '''
+        tile_x, tile_y = self.key(position)
+        buckets = self.buckets
+        found = []
+        for x in (tile_x - 1, tile_x, tile_x + 1):
+            for y in (tile_y - 1, tile_y, tile_y + 1):
+                bucket = buckets.get((x, y))
+                if bucket:
+                    found.extend(bucket)
+        return found
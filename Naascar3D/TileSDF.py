@@ -0,0 +1,179 @@
+import math
+import random
+
+import numpy as np
+
+class TileSDF:
+    '''
+    Precomputed signed distance from any point of a tile to the nearest obstacle, per tile type, sampled on a
+    small grid and read back with one bilinear lookup that also gives the direction away from the obstacle.
+
+    The obstacles of a tile are its walls (Track.TILE_WALLS, lines along the tile edges, same as the drawn walls)
+    and, for turns, the inner corner: the post where the walls of the two neighbouring tiles meet, which a car
+    cutting the turn hits although neither outer wall is near. Inside the road the distance is positive.
+    Coordinates are local to the tile, in world units along the grid axes, (0,0) at the tile's min corner.
+    '''
+    RESOLUTION = 33 # samples per tile side, 1 world unit apart for the default 32 unit tiles
+
+    def __init__(self, tile_size, tile_walls, resolution=RESOLUTION):
+        self.tile_size = tile_size
+        self.resolution = resolution
+        self.spacing = tile_size / (resolution - 1)
+        self.inverse_spacing = (resolution - 1) / tile_size
+        self.last_square = resolution - 2 # index of the last square between samples along a side
+        self.tile_walls = tile_walls
+
+        # type code -> flat list of (distance, normal x, normal y), row-major from the min corner
+        self.samples = {}
+        # type code -> per square between samples, the bilinear distance as a + b*tx + (c + d*tx)*ty, for contact()
+        self.distance_coefficients = {}
+        axis = np.linspace(0.0, tile_size, resolution)
+        xs, ys = np.meshgrid(axis, axis)
+        for tile_type in tile_walls:
+            distance, normal_x, normal_y = self.distance_field(tile_type, xs, ys)
+            self.samples[tile_type] = list(zip(distance.ravel().tolist(), normal_x.ravel().tolist(), normal_y.ravel().tolist()))
+            d00, d10 = distance[:-1, :-1], distance[:-1, 1:]
+            d01, d11 = distance[1:, :-1], distance[1:, 1:]
+            coefficients = (d00, d10 - d00, d01 - d00, d11 - d10 - d01 + d00)
+            self.distance_coefficients[tile_type] = list(zip(*(c.ravel().tolist() for c in coefficients)))
+
+    def walls_and_corner(self, tile_type):
+        ''' [(nx, ny, d)] walls in local coordinates, and the inner corner (x, y) for turns (None for straights) '''
+        walls = []
+        for nx, ny in self.tile_walls[tile_type]:
+            # the wall lies on the side of the tile the normal points away from
+            walls.append((nx, ny, 0.0 if nx + ny > 0 else -self.tile_size))
+        (ax, ay), (bx, by) = self.tile_walls[tile_type]
+        if ax == -bx and ay == -by:
+            return walls, None # straight, the two walls face each other
+        # the inner corner is on the far side from both walls
+        corner_x = self.tile_size if ax + bx > 0 else 0.0
+        corner_y = self.tile_size if ay + by > 0 else 0.0
+        return walls, (corner_x, corner_y)
+
+    def distance_field(self, tile_type, xs, ys):
+        ''' Exact signed distance and unit normal at the points (xs, ys), NumPy arrays or floats '''
+        walls, corner = self.walls_and_corner(tile_type)
+        distance = None
+        for nx, ny, d in walls:
+            wall_distance = nx * xs + ny * ys - d
+            if distance is None:
+                distance = wall_distance
+                normal_x = np.full_like(np.asarray(xs, dtype=float), nx)
+                normal_y = np.full_like(np.asarray(xs, dtype=float), ny)
+            else:
+                closer = wall_distance < distance
+                distance = np.where(closer, wall_distance, distance)
+                normal_x = np.where(closer, nx, normal_x)
+                normal_y = np.where(closer, ny, normal_y)
+
+        if corner is not None:
+            dx, dy = xs - corner[0], ys - corner[1]
+            corner_distance = np.hypot(dx, dy)
+            closer = corner_distance < distance
+            length = np.where(corner_distance > 0.0, corner_distance, 1.0)
+            distance = np.where(closer, corner_distance, distance)
+            # right on the post there is no direction away from it, push out diagonally
+            away_x = np.where(corner_distance > 0.0, dx / length, -math.copysign(math.sqrt(0.5), corner[0] - self.tile_size / 2))
+            away_y = np.where(corner_distance > 0.0, dy / length, -math.copysign(math.sqrt(0.5), corner[1] - self.tile_size / 2))
+            normal_x = np.where(closer, away_x, normal_x)
+            normal_y = np.where(closer, away_y, normal_y)
+        return distance, normal_x, normal_y
+
+    def lookup(self, tile_type, x, y):
+        ''' Bilinear (distance, normal x, normal y) at local (x, y), the normal is not normalised '''
+        samples = self.samples[tile_type]
+        resolution = self.resolution
+        fx = x / self.spacing
+        fy = y / self.spacing
+        i = min(max(int(fx), 0), resolution - 2)
+        j = min(max(int(fy), 0), resolution - 2)
+        tx = fx - i
+        ty = fy - j
+
+        n = j * resolution + i
+        d00, x00, y00 = samples[n]
+        d10, x10, y10 = samples[n + 1]
+        d01, x01, y01 = samples[n + resolution]
+        d11, x11, y11 = samples[n + resolution + 1]
+        w00 = (1.0 - tx) * (1.0 - ty)
+        w10 = tx * (1.0 - ty)
+        w01 = (1.0 - tx) * ty
+        w11 = tx * ty
+        return (d00 * w00 + d10 * w10 + d01 * w01 + d11 * w11,
+                x00 * w00 + x10 * w10 + x01 * w01 + x11 * w11,
+                y00 * w00 + y10 * w10 + y01 * w01 + y11 * w11)
+
+    def distance(self, tile_type, x, y):
+        ''' Only the bilinear distance at local (x, y), from four coefficients: much cheaper than lookup(), which also blends the normals '''
+        last = self.last_square
+        inverse_spacing = self.inverse_spacing
+        fx = x * inverse_spacing
+        fy = y * inverse_spacing
+        i = int(fx)
+        j = int(fy)
+        if i > last: i = last
+        if j > last: j = last
+        tx = fx - i
+        ty = fy - j
+        a, b, c, d = self.distance_coefficients[tile_type][j * (last + 1) + i]
+        return a + b * tx + (c + d * tx) * ty
+
+    def contact(self, tile_type, x, y, radius):
+        '''
+        The lookup for collisions: None while the distance at local (x, y) is at least radius, which is nearly
+        always, else (distance, normal x, normal y). The normal is only interpolated when there is contact.
+        '''
+        if self.distance(tile_type, x, y) >= radius:
+            return None
+        return self.lookup(tile_type, x, y)
+
+
+def check(tile_size=32.0, points=20000, hitbox=2.0, seed=0, max_error=0.6):
+    '''
+    Correctness harness: compares bilinear lookups with the exact distance field at random points of every tile
+    type, and checks that the lookup decides "touching" (distance < hitbox) the same way wherever the exact
+    distance is more than 0.25 from the hitbox. Normal errors are in degrees, for points close enough to touch;
+    the large ones are on the ridge in the outer corner of turns, where the lookup blends the two wall normals.
+    Fails if any touching decision differs or a distance is off by more than max_error (world units; blending
+    across the kinks of turns costs about half a sample spacing, 0.52 at the default resolution).
+    '''
+    from BitGrid import BitGrid
+    from TrackLayout import TrackLayout
+
+    sdf = TileSDF(tile_size, TrackLayout.TILE_WALLS)
+    rng = random.Random(seed)
+    print(f"{'type':>5} | {'max error':>9} {'mean error':>10} | {'normal p99 / max':>16} | {'contact mismatches':>18}")
+    worst = 0.0
+    failures = []
+    for tile_type in sdf.samples:
+        errors = []
+        angle_errors = []
+        mismatches = 0
+        for _ in range(points):
+            x, y = rng.uniform(0, tile_size), rng.uniform(0, tile_size)
+            distance, nx, ny = sdf.lookup(tile_type, x, y)
+            exact, ex, ey = (float(v) for v in sdf.distance_field(tile_type, x, y))
+            errors.append(abs(distance - exact))
+            if exact < hitbox * 2:
+                angle_errors.append(math.degrees(math.acos(max(-1.0, min(1.0, (nx * ex + ny * ey) / math.hypot(nx, ny))))))
+            if abs(exact - hitbox) > 0.25 and (distance < hitbox) != (exact < hitbox):
+                mismatches += 1
+            touching = sdf.contact(tile_type, x, y, hitbox)
+            if (touching is None) != (distance >= hitbox) or (touching is not None and abs(touching[0] - distance) > 1e-9):
+                raise AssertionError(f"contact() and lookup() disagree at ({x}, {y}) on {BitGrid.TYPES[tile_type]}")
+        worst = max(worst, max(errors))
+        angle_errors.sort()
+        angle = f"{angle_errors[len(angle_errors) * 99 // 100]:5.1f} /{angle_errors[-1]:5.1f}"
+        print(f"{BitGrid.TYPES[tile_type]:>5} | {max(errors):9.4f} {sum(errors) / len(errors):10.5f} | {angle:>16} | {mismatches:>18}")
+        if mismatches:
+            failures.append(f"{mismatches} contact mismatches on {BitGrid.TYPES[tile_type]}")
+        if max(errors) > max_error:
+            failures.append(f"distance off by {max(errors):.4f} on {BitGrid.TYPES[tile_type]}, more than {max_error}")
+    if failures:
+        raise AssertionError("; ".join(failures))
+    return worst
+
+
+if __name__ == "__main__":
+    check()
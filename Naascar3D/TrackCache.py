@@ -0,0 +1,54 @@
+import json
+import os
+from Geometry import Coordinate
+
+class TrackCache:
+    '''
+    Stores generated tracks on disk in the same compact form as the presets in Track.load_track,
+    keyed by everything that decides the generated layout: (seed, grid_size, min_length, max_length, algorithm)
+    '''
+    def __init__(self, track_directory="tracks"):
+        self.track_directory = track_directory
+        self.ensure_directory_exists()
+
+    def ensure_directory_exists(self):
+        if not os.path.exists(self.track_directory):
+            os.makedirs(self.track_directory)
+
+    def get_filepath(self, seed, grid_size, min_length, max_length, algorithm="dfs"):
+        suffix = "" if algorithm == "dfs" else f"_{algorithm}"
+        return os.path.join(self.track_directory, f"track_{seed}_{grid_size}x{grid_size}_{min_length}-{max_length}{suffix}.json")
+
+    def track_exists(self, seed, grid_size, min_length, max_length, algorithm="dfs"):
+        """Check if a generated track is cached"""
+        return os.path.exists(self.get_filepath(seed, grid_size, min_length, max_length, algorithm))
+
+    def save_track(self, seed, grid_size, min_length, max_length, preset, algorithm="dfs"):
+        """Save a track preset (see Grid.to_preset) to a JSON file"""
+        data = {
+            "start": [preset["start"].x, preset["start"].y],
+            "direction": [preset["direction"].x, preset["direction"].y],
+            "layout": preset["layout"]
+        }
+
+        filepath = self.get_filepath(seed, grid_size, min_length, max_length, algorithm)
+        with open(filepath, 'w') as f:
+            json.dump(data, f)
+
+        print(f"Saved track: {filepath}")
+
+    def load_track(self, seed, grid_size, min_length, max_length, algorithm="dfs"):
+        """Load a track preset from a JSON file, ready for Grid.load_preset"""
+        filepath = self.get_filepath(seed, grid_size, min_length, max_length, algorithm)
+
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"Track file not found: {filepath}")
+
+        with open(filepath, 'r') as f:
+            data = json.load(f)
+
+        return {
+            "start": Coordinate(*data["start"]),
+            "direction": Coordinate(*data["direction"]),
+            "layout": data["layout"]
+        }
@@ -0,0 +1,266 @@
+import argparse
+import os
+import sys
+import time
+from functools import lru_cache
+from operator import itemgetter
+
+from Geometry import Coordinate
+from Grid import Grid
+from TrackLibrary import TrackLibrary
+
+
+class TrackEnumerator:
+    '''
+    Lists every closed track on a size x size grid with min_length..max_length cells after the start, once per shape:
+    tracks that are rotations or mirror images of each other count as one, like in TrackLibrary.
+
+    The grid is swept cell by cell (row by row, west to east) with a frontier of "plugs": the track pieces that
+    cross from the cells already decided into the ones still to come. Each plug is labelled as the opening (1) or
+    closing (2) end of its piece of track, which is all that is needed to tell joining two pieces from closing the
+    loop. The number of ways to finish the grid from a given (cell, frontier, track length) is memoised, so counting
+    takes polynomial time and listing only ever walks into branches that lead to at least one track.
+
+    Cells are stored as bitmasks of the sides the track leaves through (N=1, E=2, S=4, W=8).
+    '''
+    N, E, S, W = 1, 2, 4, 8
+    SIDE_DIRECTIONS = {N: Coordinate(0,1), E: Coordinate(1,0), S: Coordinate(0,-1), W: Coordinate(-1,0)}
+
+    def __init__(self, size, min_length, max_length):
+        self.size = size
+        self.min_length = min_length
+        self.max_length = max_length
+        # Loop sizes in cells, start included. A loop always has an even number of cells, so only odd lengths count.
+        self.loop_sizes = frozenset(length + 1 for length in range(max(3, min_length), max_length + 1) if length % 2 == 1)
+        self.max_loop_size = max(self.loop_sizes, default=0)
+        self.symmetries = self.get_symmetries(size)
+        self.completions = lru_cache(maxsize=None)(self.completions)
+
+    # ------------------------------------------ Counting ------------------------------------------
+    def count(self):
+        ''' Number of closed loops in the length range, before symmetry reduction (and including loops without a straight) '''
+        return self.completions(0, (0,) * (self.size + 1), 0)
+
+    def completions(self, i, frontier, cells):
+        ''' Number of ways to finish the grid from cell i, memoised per instance in __init__ '''
+        total = 0
+        for code, next_frontier, next_cells, closed in self.transitions(i, frontier, cells):
+            if closed:
+                total += 1
+            else:
+                total += self.completions(i + 1, next_frontier, next_cells)
+        return total
+
+    def transitions(self, i, frontier, cells):
+        ''' Every way to fill cell i: (cell bitmask, frontier for cell i + 1, track cells so far, whether that closed the loop) '''
+        size = self.size
+        if i == size * size:
+            return
+        x, y = i % size, i // size
+        if x == 0:
+            frontier = (0,) + frontier[:size] # new row, the plug leaving the east edge was 0
+
+        left, down = frontier[x], frontier[x + 1]
+        can_go_up = y < size - 1
+        can_go_right = x < size - 1
+
+        if left == 0 and down == 0:
+            yield 0, frontier, cells, False
+            if can_go_up and can_go_right and cells + 1 < self.max_loop_size:
+                yield self.N | self.E, self.replace(frontier, x, 1, 2), cells + 1, False
+            return
+
+        if cells + 1 > self.max_loop_size:
+            return
+
+        if left == 0 or down == 0:
+            plug = left or down
+            side = self.W if left else self.S
+            if can_go_up:
+                yield side | self.N, self.replace(frontier, x, plug, 0), cells + 1, False
+            if can_go_right:
+                yield side | self.E, self.replace(frontier, x, 0, plug), cells + 1, False
+            return
+
+        code = self.W | self.S
+        if left == 1 and down == 2: # the two ends of the same piece meet: the loop is closed
+            if cells + 1 in self.loop_sizes and not any(frontier[:x]) and not any(frontier[x + 2:]):
+                yield code, None, cells + 1, True
+            return
+
+        frontier = list(frontier)
+        if left == 1 and down == 1:
+            frontier[self.find_closing(frontier, x + 1)] = 1
+        elif left == 2 and down == 2:
+            frontier[self.find_opening(frontier, x)] = 2
+        frontier[x] = frontier[x + 1] = 0
+        yield code, tuple(frontier), cells + 1, False
+
+    @staticmethod
+    def replace(frontier, x, up, right):
+        return frontier[:x] + (up, right) + frontier[x + 2:]
+
+    @staticmethod
+    def find_closing(frontier, j):
+        depth = 0
+        for k in range(j, len(frontier)):
+            if frontier[k] == 1:
+                depth += 1
+            elif frontier[k] == 2:
+                depth -= 1
+                if depth == 0:
+                    return k
+
+    @staticmethod
+    def find_opening(frontier, j):
+        depth = 0
+        for k in range(j, -1, -1):
+            if frontier[k] == 2:
+                depth += 1
+            elif frontier[k] == 1:
+                depth -= 1
+                if depth == 0:
+                    return k
+
+    # ------------------------------------------ Listing ------------------------------------------
+    def loops(self):
+        ''' Yields every loop in the length range as a bytes of cell bitmasks in row-major order '''
+        cells = bytearray(self.size * self.size)
+        stack = [(0, iter(self.transitions(0, (0,) * (self.size + 1), 0)))]
+        while stack:
+            i, options = stack[-1]
+            for code, next_frontier, next_cells, closed in options:
+                if closed:
+                    cells[i] = code
+                    cells[i + 1:] = bytes(len(cells) - i - 1)
+                    yield bytes(cells)
+                elif self.completions(i + 1, next_frontier, next_cells):
+                    cells[i] = code
+                    stack.append((i + 1, iter(self.transitions(i + 1, next_frontier, next_cells))))
+                    break
+            else:
+                stack.pop()
+
+    def distinct_loops(self):
+        '''
+        Yields one loop per shape: the one that is smallest among all its rotations and reflections. The symmetries
+        are checked on every listed loop, so this walks all count() loops, up to 8 per shape (about 25000 a second).
+        '''
+        for loop in self.loops():
+            if all(loop <= transform(loop) for transform in self.symmetries):
+                yield loop
+
+    def get_symmetries(self, size):
+        ''' Functions that rotate or mirror a loop (bytes of cell bitmasks), all 7 besides the identity '''
+        n = size - 1
+        moves = (
+            lambda x, y: (n - y, x),     lambda x, y: (n - x, n - y), lambda x, y: (y, n - x), # rotations
+            lambda x, y: (n - x, y),     lambda x, y: (x, n - y),
+            lambda x, y: (y, x),         lambda x, y: (n - y, n - x),                          # reflections
+        )
+        symmetries = []
+        for move in moves:
+            # where each side points after the move, e.g. north becomes west for a quarter turn counterclockwise
+            ox, oy = move(0, 0)
+            sides = []
+            for side in (self.N, self.E, self.S, self.W):
+                direction = self.SIDE_DIRECTIONS[side]
+                mx, my = move(direction.x, direction.y)
+                sides.append(self.side_of(Coordinate(mx - ox, my - oy)))
+
+            # cell i of the result is cell source[i] of the original, with its sides turned the same way
+            source = [0] * (size * size)
+            for y in range(size):
+                for x in range(size):
+                    tx, ty = move(x, y)
+                    source[ty * size + tx] = y * size + x
+            table = bytes(sum(turned for side, turned in zip((self.N, self.E, self.S, self.W), sides) if code & side) for code in range(256))
+            symmetries.append(lambda loop, get=itemgetter(*source), table=table: bytes(get(loop)).translate(table))
+        return symmetries
+
+    def to_preset(self, loop):
+        '''
+        Turns a loop into a preset (see Grid.load_preset) with Grid.TRACK_TYPE_FOR_DIRECTIONAL_CHANGE. The start is
+        the first straight in row-major order, facing north or east. Returns None for loops that only have corners.
+        '''
+        size = self.size
+        for i, code in enumerate(loop):
+            if code == self.N | self.S or code == self.E | self.W:
+                break
+        else:
+            return None
+
+        start = Coordinate(i % size, i // size)
+        start_direction = self.SIDE_DIRECTIONS[self.N if code == self.N | self.S else self.E]
+        layout = ["v1" if start_direction.y else "h1"]
+        pos = start + start_direction
+        direction = start_direction
+        while pos != start:
+            code = loop[pos.y * size + pos.x]
+            back = self.side_of(Coordinate(-direction.x, -direction.y))
+            new_direction = self.SIDE_DIRECTIONS[code & ~back]
+            layout.append(Grid.TRACK_TYPE_FOR_DIRECTIONAL_CHANGE[(direction, new_direction)])
+            pos = pos + new_direction
+            direction = new_direction
+
+        return {"start": start, "direction": start_direction, "layout": layout}
+
+    def side_of(self, direction):
+        for side, side_direction in self.SIDE_DIRECTIONS.items():
+            if side_direction == direction:
+                return side
+
+
+def build_catalogue(filepath, grid_size, min_length, max_length, limit=None):
+    '''
+    Writes every distinct track of the length range into a track library file (see TrackLibrary), ordered by
+    length and then by shape, so entry IDs stay the same between builds. Load one with track number 4 and
+    "library" set to this file. Listing walks every loop before symmetry reduction, so a range with more than
+    8 * limit loops, which is sure to have more than limit shapes, is refused before listing starts.
+    '''
+    enumerator = TrackEnumerator(grid_size, min_length, max_length)
+    start = time.perf_counter()
+    total = enumerator.count()
+    print(f"{total} closed loops of length {min_length}-{max_length} on a {grid_size}x{grid_size} grid ({time.perf_counter() - start:.2f}s to count)")
+    if limit is not None and total > 8 * limit:
+        raise ValueError(f"{total} loops are at least {total // 8} distinct shapes, more than the limit of {limit}: "
+                         f"narrow the length range, raise the limit or only count them (--count-only)")
+
+    tracks = []
+    without_straight = 0
+    for loop in enumerator.distinct_loops():
+        preset = enumerator.to_preset(loop)
+        if preset is None:
+            without_straight += 1
+            continue
+        tracks.append((len(preset["layout"]), loop, preset))
+        if limit is not None and len(tracks) > limit:
+            raise ValueError(f"More than {limit} distinct tracks, narrow the length range or raise the limit")
+    tracks.sort(key=lambda track: track[:2])
+    elapsed = time.perf_counter() - start
+
+    TrackLibrary.write(filepath, grid_size, [TrackLibrary.encode_track(preset, grid_size) for _, _, preset in tracks])
+    print(f"{len(tracks)} distinct tracks in {elapsed:.2f}s ({without_straight} loops without a straight for the start left out)")
+    return len(tracks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write every distinct closed track of a grid size and length range to a track library file")
+    parser.add_argument("filepath", nargs="?", default=None, help="default: tracks/catalogue_<size>x<size>_<min>-<max>.ntl")
+    parser.add_argument("--grid-size", type=int, default=6)
+    parser.add_argument("--min-length", type=int, default=3)
+    parser.add_argument("--max-length", type=int, default=35)
+    parser.add_argument("--limit", type=int, default=1000000, help="give up past this many distinct tracks")
+    parser.add_argument("--count-only", action="store_true", help="only count the loops, without symmetry reduction")
+    args = parser.parse_args()
+
+    if args.count_only:
+        enumerator = TrackEnumerator(args.grid_size, args.min_length, args.max_length)
+        print(enumerator.count())
+        sys.exit()
+
+    filepath = args.filepath or f"tracks/catalogue_{args.grid_size}x{args.grid_size}_{args.min_length}-{args.max_length}.ntl"
+    directory = os.path.dirname(filepath)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    build_catalogue(filepath, args.grid_size, args.min_length, args.max_length, args.limit)
@@ -0,0 +1,123 @@
+import contextlib
+import io
+import multiprocessing
+import queue
+import time
+
+from ArrayGrid import ArrayGrid
+from Grid import Grid
+from RacingLine import RacingLine
+from TrackCache import TrackCache
+from TrackLayout import TrackLayout
+
+
+def _grid(settings, **lengths):
+    grid_class = ArrayGrid if settings["grid_storage"] == "arrays" else Grid
+    return grid_class(dict({
+        "size": settings["grid_size"],
+        "min_length": settings["min_length"],
+        "max_length": settings["max_length"],
+        "backend": settings["grid_backend"],
+        "algorithm": settings["track_algorithm"],
+        "seed": settings["seed"]
+    }, **lengths))
+
+
+def _generate_track(settings, results, cache):
+    '''
+    Worker process. Sends the requested track, then its racing line (RacingLine.encode), so the race does not have to
+    optimise it. With cache both are also saved for the next launch.
+    '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        grid = _grid(settings)
+        grid.generate_random_track()
+        if cache:
+            TrackCache().save_track(grid.seed, grid.size, grid.min_length, grid.max_length, grid.to_preset(), grid.algorithm)
+    results.put(("track", grid.to_preset()))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        track = TrackLayout(dict(settings, track_id=0), grid.to_preset())
+        line = RacingLine.optimise(track)
+        if cache:
+            line.save(track)
+    results.put(("racing_line", line.encode()))
+
+
+def _generate_fallback(settings, results):
+    ''' Worker process. Sends a track shorter than the minimum length, which is found much sooner '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        fallback = _grid(settings, min_length=settings["min_length"] // 2, max_length=settings["min_length"] - 1)
+        try:
+            fallback.generate_random_track()
+        except ValueError:
+            return # range too short for a closed loop, the requested track is the only candidate
+    results.put(("fallback", fallback.to_preset()))
+
+
+class TrackGenerator:
+    '''
+    Generates a random track in a separate process, so the game can compile shaders, load meshes and draw a
+    loading screen meanwhile, then optimises its racing line (racing_line, encoded, see RacingLine.encode). If
+    the track is not ready within `time_budget` seconds the worker is stopped and result() returns the fallback
+    track found so far, or None if there is not even that; a racing line not ready by then is left to the race.
+    The fallback is searched for in a second process once FALLBACK_AT of the budget has passed (or the search has
+    given up), so it takes nothing from the requested track while that may still be found. With cache the track
+    and its line are saved for the next launch; only worth it for a seed that was chosen, a random one is never
+    asked for again.
+    '''
+    FALLBACK_AT = 0.8 # of the time budget
+
+    def __init__(self, settings, time_budget=10.0, cache=True):
+        self.settings = settings
+        self.time_budget = time_budget
+        self.results = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_generate_track, args=(settings, self.results, cache), daemon=True)
+        self.fallback_process = None
+        self.track = None
+        self.racing_line = None
+        self.fallback = None
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.process.start()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def poll(self):
+        ''' Collects whatever the worker has sent, returns True once waiting any longer is pointless '''
+        while True:
+            try:
+                kind, preset = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "track":
+                self.track = preset
+            elif kind == "racing_line":
+                self.racing_line = preset
+            else:
+                self.fallback = preset
+        if self.track is None and self.fallback_process is None and (self.elapsed() >= self.time_budget * self.FALLBACK_AT or not self.process.is_alive()):
+            self.fallback_process = multiprocessing.Process(target=_generate_fallback, args=(self.settings, self.results), daemon=True)
+            self.fallback_process.start()
+        stopped = not self.process.is_alive() and self.fallback_process is not None and not self.fallback_process.is_alive()
+        finished = self.track is not None and (self.racing_line is not None or not self.process.is_alive())
+        return finished or self.elapsed() >= self.time_budget or (stopped and self.results.empty())
+
+    def progress(self):
+        if self.track is not None:
+            return 1.0
+        return min(1.0, self.elapsed() / self.time_budget)
+
+    def result(self):
+        for process in (self.process, self.fallback_process):
+            if process is not None and process.is_alive():
+                process.terminate()
+        if self.track is not None:
+            return self.track
+
+        print(f"Track generation did not finish within {self.time_budget}s")
+        if self.fallback is not None:
+            print("Using the shorter fallback track")
+        return self.fallback
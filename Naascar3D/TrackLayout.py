@@ -0,0 +1,203 @@
+import hashlib
+
+from Geometry import Point, Coordinate
+from Grid import Grid
+from BitGrid import BitGrid
+from ArrayGrid import ArrayGrid
+from TrackCache import TrackCache
+from TrackLibrary import TrackLibrary
+from TileSDF import TileSDF
+from Centreline import Centreline
+from TrackProgress import TrackProgress
+from RacingLine import RacingLine
+from FlowField import FlowField
+
+class TrackLayout:
+    '''
+    Everything about a track the simulation needs: the grid, world coordinates of its cells and the collision tables.
+    No OpenGL, so races can be simulated headless (see Simulation.py). Track adds the meshes and drawing on top.
+    '''
+    TRACK_MAX_LENGTH = 16
+    TRACK_MIN_LENGTH = 6
+
+    # Walls of each tile type as normals pointing into the road, in grid (x,y), in the order Physics3D checks them
+    TILE_WALLS = {
+        BitGrid.H0: ((0, 1), (0, -1)),  BitGrid.H1: ((0, 1), (0, -1)),   # bottom, top
+        BitGrid.V0: ((1, 0), (-1, 0)),  BitGrid.V1: ((1, 0), (-1, 0)),   # left, right
+        BitGrid.D0: ((1, 0), (0, -1)),  # left, top
+        BitGrid.D1: ((-1, 0), (0, -1)), # right, top
+        BitGrid.D2: ((-1, 0), (0, 1)),  # right, bottom
+        BitGrid.D3: ((1, 0), (0, 1)),   # left, bottom
+    }
+
+    def __init__(self, settings = {"track_id": 0, "grid_size": 8, "tile_size": 32.0, "road_width": 16.0, "min_length": 16, "max_length": 24, "grid_backend": "bitboard", "track_algorithm": "dfs", "seed": None, "library": "tracks/library.ntl", "library_entry": 0, "grid_storage": "cells"}, preset = None):
+        self.grid_size = settings["grid_size"]
+        self.tile_size = settings["tile_size"]
+        self.half_tile = self.tile_size * 0.5
+        self.road_width = settings["road_width"]
+        self.sideline_width = (settings["tile_size"] - settings["road_width"]) * 0.5
+        self.tile_sdf = TileSDF(self.tile_size, self.TILE_WALLS) # distance to walls and inner corners, per tile type
+
+        # "arrays" only stores the track's own cells, use it for big grids (64x64 and up)
+        grid_class = ArrayGrid if settings.get("grid_storage", "cells") == "arrays" else Grid
+        self.Grid = grid_class(settings = {
+            "size": settings["grid_size"], 
+            "min_length": settings["min_length"], 
+            "max_length": settings["max_length"],
+            "backend": settings.get("grid_backend", "bitboard"),
+            "algorithm": settings.get("track_algorithm", "dfs"),
+            "seed": settings.get("seed")
+        })
+        self.track_cache = TrackCache()
+        self.cache_tracks = settings.get("seed") is not None # tracks of random seeds would only pile up in the cache
+        self.library_path = settings.get("library", "tracks/library.ntl")
+        self.library_entry = settings.get("library_entry", 0)
+        self.load_track(settings["track_id"], preset)
+    
+    def get_cell(self, pos):
+        return self.Grid.get_cell(pos)
+    
+    def get_cell_type(self, pos):
+        cell = self.get_cell(pos)
+        if cell: return cell.type
+        return None
+
+    def get_cell_powerup(self, pos):
+        cell = self.get_cell(pos)
+        if cell: return cell.powerup
+        return None
+        
+    def get_cell_direction(self, pos):
+        cell = self.get_cell(pos)
+        return cell.direction
+    
+    def get_start_postion(self):
+        return self.Grid.start.position
+    
+    def grid_pos_to_coords(self, pos):
+        ''' 
+        Translates the grid's (x,y) position (x and y are between 0 and self.grid_size) to the games real world (x,y) coordinates
+        returns the coordinates of the center of the cell
+        '''
+        x = pos.x * self.tile_size + self.tile_size/2
+        y = pos.y * self.tile_size + self.tile_size/2
+        return Point(y, 0, x) # (x, y, z)
+        
+    def start_coordinates(self):
+        return self.Grid.start.real_center
+
+    def track_hash(self):
+        ''' Hex digest of the layout and tile size, the same however the track was loaded (for files kept per track) '''
+        preset = self.Grid.to_preset()
+        key = (preset["start"].x, preset["start"].y, preset["direction"].x, preset["direction"].y, tuple(preset["layout"]), self.tile_size)
+        return hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+    
+    def set_cells_real_coords(self):
+        cell = self.Grid.start
+        pos = Coordinate(cell.x, cell.y)
+        cell.real_center = self.grid_pos_to_coords(pos)
+        cell.real_enter = self.grid_pos_to_coords(pos - cell.direction)
+        cell.real_exit = self.grid_pos_to_coords(pos + cell.direction)
+        
+        prev = cell
+        for _ in range(self.Grid.length):
+            cell = cell.next
+            pos = Coordinate(cell.x, cell.y)
+            cell.real_center = self.grid_pos_to_coords(pos)
+            cell.real_enter = self.grid_pos_to_coords(pos - prev.direction*0.5)
+            cell.real_exit = self.grid_pos_to_coords(pos + cell.direction*0.5)
+
+            prev = cell
+
+    # ------------------------------- MAP GENERATION -------------------------------
+    def load_track(self, track_number, preset = None):
+        if track_number == 0:
+            key = (self.Grid.seed, self.grid_size, self.Grid.min_length, self.Grid.max_length)
+            print(f"Track seed: {self.Grid.seed}")
+            if preset is not None: # Already generated in the background, see TrackGenerator
+                self.Grid.load_preset(preset)
+            elif self.track_cache.track_exists(*key, algorithm=self.Grid.algorithm):
+                self.Grid.load_preset(self.track_cache.load_track(*key, algorithm=self.Grid.algorithm))
+            else:
+                self.Grid.generate_random_track()
+                if self.cache_tracks:
+                    self.track_cache.save_track(*key, self.Grid.to_preset(), algorithm=self.Grid.algorithm)
+        
+        if track_number == 1:
+            self.Grid.load_preset({"start" : Coordinate(2,3), "direction" : Coordinate(0,1), "layout": [
+                "v1", "v0b", "d1", "d3", "v0", "d0", "h0d", "h0", "d1", "d3", "d2", "d0", "h0", 
+                "d1", "v0b", "v0", "v0", "v0", "v0", "v0s", "d2", "d3", "v0", "v0", "v0", "d1",
+                "d3", "d1", "d0", "v0", "v0", "d3", "d1", "d2", "h0", "h0", "h0", "d3", "d0", "d2"]})
+        
+        elif track_number == 2:
+            self.Grid.load_preset({"start" : Coordinate(1,0), "direction" : Coordinate(1, 0), "layout": [
+                "h1", "h0", "h0", "h0", "h0", "h0", "d2", "v0", "v0", "v0", "v0", "v0", "v0", "d1", 
+                "h0", "h0", "h0", "h0", "h0", "h0", "d0", "v0", "v0", "v0", "v0", "v0", "v0", "d3"]})
+        
+        elif track_number == 3:
+            self.Grid.load_preset({"start" : Coordinate(0,1), "direction" : Coordinate(0,1), "layout" : [
+                "v1", "d3", "h0", "d2", "v0", "d1", "h0", "d0"]})
+
+        elif track_number == 4: # Entry from a pre-built track library (see TrackLibrary.py)
+            library = TrackLibrary(self.library_path)
+            if library.grid_size != self.grid_size:
+                raise ValueError(f"Track library {self.library_path} is for a {library.grid_size}x{library.grid_size} grid, not {self.grid_size}x{self.grid_size}")
+            self.Grid.load_preset(library.load_track(self.library_entry))
+            library.close()
+        
+        self.set_cells_real_coords()
+        self.track_tiles = [(cell.x, cell.y, cell.type) for cell in self.Grid.chain()]
+        self.centreline = Centreline(self.Grid.chain(), self.tile_size)
+        self.progress_index = TrackProgress(self)
+        self._racing_line = None # optimised on first use, see racing_line
+        self.cache_racing_line = track_number != 0 or self.cache_tracks # fixed tracks and chosen seeds come back
+        self.flow_field = FlowField(self)
+        self.compile_collision_table()
+
+    @property
+    def racing_line(self):
+        '''
+        The track's RacingLine, from the racing_lines/ cache or optimised when first asked for (about half a second
+        on 8x8), so only races that use it pay for it. GameManager has TrackGenerator optimise new tracks' lines in
+        the background and sets it here.
+        '''
+        if self._racing_line is None:
+            self._racing_line = RacingLine.load_or_optimise(self, save=self.cache_racing_line)
+        return self._racing_line
+
+    @racing_line.setter
+    def racing_line(self, line):
+        self._racing_line = line
+
+    def compile_collision_table(self):
+        '''
+        Per-tile tables with one row per track tile, in the order of the track, so Physics3D does no type dispatch
+        per frame and memory grows with the track, not the grid. tile_rows maps tile ID (y * grid_size + x) to the
+        row; tiles without road have none.
+            collision_table[row]: walls of the tile as half-planes (nx, ny, d), the car is clear of a wall while
+                                  nx * x + ny * y - d >= its hitbox (x, y in world units along the grid axes)
+            tile_bounds[row]:     (min_x, min_y, max_x, max_y) of the tile in world units
+            tile_types[row]:      BitGrid type code of the tile, the key into tile_sdf
+        '''
+        self.tile_rows = {}
+        self.collision_table = []
+        self.tile_bounds = []
+        self.tile_types = []
+        for cell in self.Grid.chain():
+            min_x, min_y = cell.x * self.tile_size, cell.y * self.tile_size
+            max_x, max_y = min_x + self.tile_size, min_y + self.tile_size
+            walls = []
+            for nx, ny in self.TILE_WALLS[BitGrid.TYPE_CODES[cell.type]]:
+                # the wall lies on the side of the tile the normal points away from
+                d = nx * (min_x if nx > 0 else max_x) + ny * (min_y if ny > 0 else max_y)
+                walls.append((float(nx), float(ny), d))
+            self.tile_rows[cell.y * self.grid_size + cell.x] = len(self.collision_table)
+            self.collision_table.append(tuple(walls))
+            self.tile_bounds.append((min_x, min_y, max_x, max_y))
+            self.tile_types.append(BitGrid.TYPE_CODES[cell.type])
+
+    def draw_track_debug(self):
+        '''
+        Draws the track in text format with starting position marked as 'S'
+        '''
+        print(self.Grid)
@@ -0,0 +1,169 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+
+from Geometry import Coordinate
+from BitGrid import BitGrid
+from Grid import Grid
+
+class TrackLibrary:
+    '''
+    Read-only catalogue of tracks in one binary file. The file is memory-mapped and every record has the same
+    size, so loading entry N only reads that entry.
+
+    File layout (little endian):
+        header:  magic "NTRK", version (u8), grid size (u16), record size (u32), entry count (u32)
+        records: start x (u16), start y (u16), start direction (u8), cell count (u32), then one byte per cell
+                 in driving order: type code | powerup code << 4, zero padded up to the record size
+    Direction, type and powerup codes are the ones BitGrid uses.
+    '''
+    MAGIC = b"NTRK"
+    VERSION = 2 # 1 had a u8 grid size and u16 record size, too small for 256x256 grids
+    HEADER = struct.Struct("<4sBHII")
+    RECORD_HEADER = struct.Struct("<HHBI")
+
+    def __init__(self, filepath):
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"Track library not found: {filepath}")
+
+        self.filepath = filepath
+        with open(filepath, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.grid_size, self.record_size, self.count = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"Not a version {self.VERSION} track library: {filepath}")
+
+    def __len__(self):
+        return self.count
+
+    def load_track(self, n):
+        """Load entry n as a preset, ready for Grid.load_preset"""
+        if n < 0 or n >= self.count:
+            raise IndexError(f"Track library {self.filepath} has no entry {n} ({self.count} entries)")
+
+        offset = self.HEADER.size + n * self.record_size
+        x, y, direction, length = self.RECORD_HEADER.unpack_from(self.data, offset)
+        offset += self.RECORD_HEADER.size
+        layout = [BitGrid.TYPES[code & 0xF] + (BitGrid.POWERUPS[code >> 4] or "") for code in self.data[offset:offset + length]]
+
+        return {
+            "start": Coordinate(x, y),
+            "direction": Coordinate(*BitGrid.DIRECTIONS[direction]),
+            "layout": layout
+        }
+
+    def close(self):
+        self.data.close()
+
+    @classmethod
+    def get_record_size(cls, grid_size):
+        return cls.RECORD_HEADER.size + grid_size * grid_size
+
+    @classmethod
+    def encode_track(cls, preset, grid_size):
+        """Pack a preset (see Grid.to_preset) into one fixed-size record"""
+        layout = preset["layout"]
+        direction = BitGrid.DIRECTIONS.index((preset["direction"].x, preset["direction"].y))
+        record = bytearray(cls.get_record_size(grid_size))
+        cls.RECORD_HEADER.pack_into(record, 0, preset["start"].x, preset["start"].y, direction, len(layout))
+        for n, type in enumerate(layout):
+            powerup = type[2] if len(type) == 3 else None
+            record[cls.RECORD_HEADER.size + n] = BitGrid.TYPE_CODES[type[:2]] | BitGrid.POWERUP_CODES[powerup] << 4
+        return bytes(record)
+
+    @classmethod
+    def write(cls, filepath, grid_size, records):
+        """Write encoded records into a new library file"""
+        with open(filepath, 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, grid_size, cls.get_record_size(grid_size), len(records)))
+            for record in records:
+                f.write(record)
+
+        print(f"Saved track library: {filepath} ({len(records)} tracks)")
+
+    @staticmethod
+    def canonical_hash(grid_size, positions):
+        '''
+        Hash of the loop through `positions` ((x,y) in driving order) that is the same for all 8 rotations and
+        reflections of the grid. Only the shape counts: start, driving direction and powerups are ignored.
+        '''
+        n = grid_size - 1
+        symmetries = (
+            lambda x, y: (x, y),         lambda x, y: (n - y, x),
+            lambda x, y: (n - x, n - y), lambda x, y: (y, n - x),
+            lambda x, y: (n - x, y),     lambda x, y: (x, n - y),
+            lambda x, y: (y, x),         lambda x, y: (n - y, n - x),
+        )
+        canonical = None
+        for transform in symmetries:
+            indices = [y * grid_size + x for x, y in (transform(x, y) for x, y in positions)]
+            edges = sorted((min(a, b), max(a, b)) for a, b in zip(indices, indices[1:] + indices[:1]))
+            if canonical is None or edges < canonical:
+                canonical = edges
+        return hashlib.blake2b(repr(canonical).encode(), digest_size=8).digest()
+
+
+# ------------------------------------------ Library builder ------------------------------------------
+def _generate_track(job):
+    seed, grid_size, min_length, max_length = job
+    grid = Grid(settings = {"size": grid_size, "min_length": min_length, "max_length": max_length, "seed": seed})
+    with contextlib.redirect_stdout(io.StringIO()):
+        grid.generate_random_track()
+
+    key = TrackLibrary.canonical_hash(grid_size, [(cell.x, cell.y) for cell in grid.chain()])
+    return key, TrackLibrary.encode_track(grid.to_preset(), grid_size)
+
+def build_library(filepath, count, grid_size=8, min_length=12, max_length=24, first_seed=0, workers=None, max_attempts=None):
+    '''
+    Generates tracks from consecutive seeds on every core and writes the first `count` distinct ones to `filepath`.
+    Results are consumed in seed order, so the same arguments always build the same library.
+    '''
+    workers = workers or os.cpu_count()
+    max_attempts = max_attempts or count * 10
+    jobs = ((seed, grid_size, min_length, max_length) for seed in range(first_seed, first_seed + max_attempts))
+
+    seen = set()
+    records = []
+    generated = 0
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        for key, record in pool.imap(_generate_track, jobs, chunksize=32):
+            generated += 1
+            if key in seen:
+                continue
+            seen.add(key)
+            records.append(record)
+            if len(records) == count:
+                break
+    elapsed = time.perf_counter() - start
+
+    TrackLibrary.write(filepath, grid_size, records)
+    print(f"Generated {generated} tracks in {elapsed:.2f}s on {workers} cores, {generated - len(records)} duplicates dropped")
+    print(f"{generated / elapsed:.0f} tracks/s, {generated / elapsed / workers:.0f} tracks/s per core")
+    if len(records) < count:
+        print(f"Only found {len(records)} distinct tracks in {max_attempts} attempts")
+    return len(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a library of generated tracks")
+    parser.add_argument("filepath", nargs="?", default="tracks/library.ntl")
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--grid-size", type=int, default=8)
+    parser.add_argument("--min-length", type=int, default=12)
+    parser.add_argument("--max-length", type=int, default=24)
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    directory = os.path.dirname(args.filepath)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    build_library(args.filepath, args.count, args.grid_size, args.min_length, args.max_length, args.first_seed, args.workers)
@@ -0,0 +1,109 @@
+import math
+
+import numpy as np
+
+
+class TrackProgress:
+    '''
+    How far along the lap a point on the track is, from the tile it is on. Every track tile gets a row, in Cell.next
+    chain order from the start, found through tile_rows (tile ID y * grid_size + x -> row, -1 off the track, like
+    TrackLayout.tile_rows). The row holds its number in the chain, the distance along the centre line where it is
+    entered, its length there, and what tells how far through the tile a point is: the entry edge and the way the
+    road runs for a straight, the inner corner the road bends around and the angle it starts at for a turn.
+    distance(x, z) is then a few sums and at most one atan2, whatever the length of the track; distances() does the
+    same for arrays of cars.
+
+    Distances are measured from the finish line (the middle of the start tile) and run from 0 to length. Points are
+    world (x, z) like the cars': the car's x is the grid's y and z the grid's x.
+    '''
+    STRAIGHT, TURN = 0, 1
+
+    def __init__(self, track):
+        self.centreline = centreline = track.centreline
+        cells = track.Grid.chain()
+        self.length = centreline.length
+        self.tile_size = track.tile_size
+        self.grid_size = track.grid_size
+        self.finish = centreline.distance_at(track.Grid.start.real_center.x, track.Grid.start.real_center.z) # on the centre line
+
+        # tiles[row]: (number, entry distance, length, kind, ax, az, ux, uz, turn sign), row == number. For a
+        # straight (ax, az) is the middle of the entry edge and (ux, uz) the way along over the tile's span, so their
+        # dot product with a point is the fraction through the tile; for a turn they are the inner corner and the
+        # unit vector from it to the entry edge
+        self.tiles = []
+        self.tile_rows = np.full(self.grid_size * self.grid_size, -1, dtype=np.int32)
+        for number, cell in enumerate(cells):
+            centre_x, centre_z = cell.real_center.x, cell.real_center.z
+            before, after = cells[number - 1].real_center, cells[(number + 1) % len(cells)].real_center
+            enter_x, enter_z = (before.x + centre_x) * 0.5, (before.z + centre_z) * 0.5
+            exit_x, exit_z = (centre_x + after.x) * 0.5, (centre_z + after.z) * 0.5
+            entry = centreline.tile_distances[number] - self.finish
+            length = centreline.tile_distances[number + 1] - centreline.tile_distances[number]
+
+            if abs((exit_x - enter_x) * (centre_z - enter_z) - (exit_z - enter_z) * (centre_x - enter_x)) < 1e-9:
+                # straight: how far past the entry edge along the road
+                span = math.hypot(exit_x - enter_x, exit_z - enter_z)
+                tile = (number, entry, length, self.STRAIGHT, enter_x, enter_z, (exit_x - enter_x) / span / span, (exit_z - enter_z) / span / span, 0.0)
+            else:
+                # turn: how far round the inner corner from the entry edge
+                corner_x, corner_z = enter_x + exit_x - centre_x, enter_z + exit_z - centre_z
+                radius = math.hypot(enter_x - corner_x, enter_z - corner_z)
+                ux, uz = (enter_x - corner_x) / radius, (enter_z - corner_z) / radius
+                sign = 1.0 if ux * (exit_z - corner_z) - uz * (exit_x - corner_x) > 0 else -1.0
+                tile = (number, entry, length, self.TURN, corner_x, corner_z, ux, uz, sign)
+            self.tile_rows[cell.y * self.grid_size + cell.x] = len(self.tiles)
+            self.tiles.append(tile)
+
+        # The same as an array for distances()
+        self.table = np.array(self.tiles, dtype=np.float64).reshape(len(self.tiles), 9)
+
+    def tile_id(self, x, z):
+        ''' ID of the tile under world (x, z), or None outside the grid '''
+        grid_x, grid_y = int(z // self.tile_size), int(x // self.tile_size)
+        if not (0 <= grid_x < self.grid_size and 0 <= grid_y < self.grid_size):
+            return None
+        return grid_y * self.grid_size + grid_x
+
+    def tile_row(self, x, z):
+        ''' Row of tiles/table for the tile under world (x, z), or None off the track '''
+        tile_id = self.tile_id(x, z)
+        if tile_id is None:
+            return None
+        row = int(self.tile_rows[tile_id])
+        return row if row >= 0 else None
+
+    def distance(self, x, z):
+        ''' Distance along the lap from the finish line to world (x, z), or None off the track '''
+        row = self.tile_row(x, z)
+        if row is None:
+            return None
+        _, entry, length, kind, ax, az, ux, uz, sign = self.tiles[row]
+        dx, dz = x - ax, z - az
+        if kind == self.STRAIGHT:
+            fraction = dx * ux + dz * uz
+        else:
+            fraction = math.atan2(sign * (ux * dz - uz * dx), ux * dx + uz * dz) / (math.pi / 2)
+        return (entry + min(max(fraction, 0.0), 1.0) * length) % self.length
+
+    def distances(self, x, z):
+        ''' distance() for arrays of positions, NaN off the track '''
+        grid_x, grid_y = (np.asarray(z) // self.tile_size).astype(np.int64), (np.asarray(x) // self.tile_size).astype(np.int64)
+        inside = (grid_x >= 0) & (grid_x < self.grid_size) & (grid_y >= 0) & (grid_y < self.grid_size)
+        row = np.where(inside, self.tile_rows[np.where(inside, grid_y * self.grid_size + grid_x, 0)], -1)
+        rows = self.table[row]
+        _, entry, length, kind, ax, az, ux, uz, sign = rows.T
+        dx, dz = x - ax, z - az
+        along = dx * ux + dz * uz
+        fraction = np.where(kind == self.STRAIGHT, along, np.arctan2(sign * (ux * dz - uz * dx), along) / (np.pi / 2))
+        distances = (entry + np.clip(fraction, 0.0, 1.0) * length) % self.length
+        return np.where(row >= 0, distances, np.nan)
+
+    def tile_number(self, x, z):
+        ''' Number of the tile under world (x, z) in the Cell.next chain from the start, or None off the track '''
+        row = self.tile_row(x, z)
+        return self.tiles[row][0] if row is not None else None
+
+    def direction(self, distance):
+        ''' (x, z) of the way the track runs at distance from the finish line '''
+        _, _, tangent_x, tangent_z = self.centreline.at(self.finish + distance)
+        return tangent_x, tangent_z
@@ -17,6 +17,7 @@ class UI:
         self.disabled_indicator = Square(size = 50.0, color = (1.0, 0.0, 0.0))
         self.boosted_indicator = Square(size = 50.0, color = (0.0, 1.0, 0.0))
         self.lap_indicator = Hexagon(size = 30.0, color = (0.2, 0.5, 1.0))
+        self.wrong_way_indicator = Hexagon(size = 60.0, color = (1.0, 0.0, 0.0))
 
     def draw(self):
         # Switch to ortho for 2D UI
@@ -34,6 +35,7 @@ class UI:
 
         self.draw_pickups()
         self.draw_lap_counter()
+        self.draw_wrong_way()
 
         GL.glEnable(GL.GL_DEPTH_TEST)
 
@@ -45,6 +47,11 @@ class UI:
             self.set_shader_and_matrix(aspect_x - 30 - (n * 40), aspect_y - 30)
             self.lap_indicator.draw(self.Shader)
 
+    def draw_wrong_way(self):
+        if self.Lap_counter.wrong_way:
+            self.set_shader_and_matrix(self.view_settings["aspect_x"] / 2, self.view_settings["aspect_y"] - 80)
+            self.wrong_way_indicator.draw(self.Shader)
+
     def draw_pickups(self):
         aspect_y = self.view_settings["aspect_y"]
 
@@ -65,6 +72,49 @@ class UI:
         self.modelMatrix.add_translation(tx, ty, 0.0)
         self.Shader.set_model_matrix(self.modelMatrix.matrix)
 
+class LoadingScreen:
+    BAR_WIDTH = 400.0
+    BAR_HEIGHT = 20.0
+
+    def __init__(self, UI_Shader, view_settings = {"aspect_x": 800, "aspect_y": 600, "viewport": (0,0,800,600)}):
+        self.Shader = UI_Shader
+        self.view_settings = view_settings
+
+        self.modelMatrix = ModelMatrix()
+        self.projection_ui = ProjectionMatrix()
+        self.projection_ui.set_orthographic(0, view_settings["aspect_x"], 0, view_settings["aspect_y"], -1.0, 1.0)
+
+        self.bar_background = Square(size = 1.0, color = (0.2, 0.2, 0.2))
+        self.bar = Square(size = 1.0, color = (0.2, 0.5, 1.0))
+
+    def draw(self, progress):
+        """Draws one frame of the loading screen, with the bar filled to progress (0..1)"""
+        GL.glClearColor(0.05, 0.1, 0.2, 1.0)
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT|GL.GL_DEPTH_BUFFER_BIT)
+        GL.glViewport(*self.view_settings["viewport"])
+        GL.glDisable(GL.GL_DEPTH_TEST)
+
+        self.Shader.use()
+        self.Shader.set_projection_view_matrix(self.projection_ui.get_matrix())
+
+        center_x = self.view_settings["aspect_x"] / 2.0
+        center_y = self.view_settings["aspect_y"] / 2.0
+        self.set_shader_and_matrix(center_x, center_y, self.BAR_WIDTH, self.BAR_HEIGHT)
+        self.bar_background.draw(self.Shader)
+
+        fill = self.BAR_WIDTH * max(0.0, min(1.0, progress))
+        if fill > 0.0:
+            self.set_shader_and_matrix(center_x - (self.BAR_WIDTH - fill) / 2.0, center_y, fill, self.BAR_HEIGHT)
+            self.bar.draw(self.Shader)
+
+        GL.glEnable(GL.GL_DEPTH_TEST)
+
+    def set_shader_and_matrix(self, tx, ty, sx, sy):
+        self.modelMatrix.load_identity()
+        self.modelMatrix.add_translation(tx, ty, 0.0)
+        self.modelMatrix.add_scale(sx, sy, 1.0)
+        self.Shader.set_model_matrix(self.modelMatrix.matrix)
+
 # ----------------------------------------------------------------------------------------------------
 # ----------------------------------------2D UI Objects-----------------------------------------------
 # ----------------------------------------------------------------------------------------------------
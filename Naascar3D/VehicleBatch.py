@@ -0,0 +1,231 @@
+import numpy as np
+
+import CarCollisions
+from VehicleState import VehicleState
+
+class VehicleBatch:
+    '''
+    N cars in NumPy arrays (one array per attribute), stepped all at once with the same rules as VehicleState.update,
+    VehicleState.compute_steer_factor and Physics3D.enforce_track_bounds / collide. Meant for simulating hundreds or
+    thousands of AI cars; the player's car stays a Vehicle.
+
+    Positions and directions are in world coordinates like Vehicle's: the car's x is the grid's y and z the grid's x.
+    Directions stay in the ground plane, so only their x and z are stored. Walls are checked where each car ends
+    its step, without Physics3D's sweep or the inner corners of turns, so keep steps short enough that a car cannot
+    cross a tile in one. With car_collisions the cars also bounce off each other (see CarCollisions).
+    '''
+    def __init__(self, count, hitbox_size=2.0, car_collisions=False):
+        self.count = count
+        self.hitbox_size = hitbox_size
+        self.car_collisions = car_collisions
+
+        self.x = np.zeros(count)
+        self.y = np.zeros(count)
+        self.z = np.zeros(count)
+        self.dir_x = np.ones(count)
+        self.dir_z = np.zeros(count)
+        self.speed = np.zeros(count)
+        self.steering_angle = np.zeros(count) # VehicleState.steering_angle
+
+        self.disabled = np.zeros(count)
+        self.slowed = np.zeros(count)
+        self.boosted = np.zeros(count)
+
+        self.walls = None
+
+    def place(self, i, position, direction, speed=0.0):
+        ''' Puts car i at a Point facing a Vector, like the settings of a new Vehicle '''
+        self.x[i], self.y[i], self.z[i] = position.x, position.y, position.z
+        self.dir_x[i], self.dir_z[i] = direction.x, direction.z
+        self.speed[i] = speed
+
+    # -------------------------------------------- Effects --------------------------------------------
+    def disable(self, mask):
+        self.disabled[mask] = VehicleState.DISABLED_DURATION
+
+    def slow(self, mask):
+        self.speed[mask] *= 0.2
+        self.slowed[mask] = VehicleState.SLOWED_DURATION
+
+    def boost(self, mask):
+        self.speed[mask] = VehicleState.MAX_SPEED
+        self.boosted[mask] = VehicleState.BOOSTED_DURATION
+
+    # -------------------------------------------- Driving --------------------------------------------
+    def update(self, delta_time, left, right, up, down):
+        ''' VehicleState.update for every car, the inputs are boolean arrays (or single bools for all cars) '''
+        count = self.count
+        left, right, up, down = (np.broadcast_to(np.asarray(keys, dtype=bool), (count,)) for keys in (left, right, up, down))
+
+        acceleration = np.full(count, VehicleState.ACCELERATION)
+        boosted = self.boosted != 0
+        slowed = ~boosted & (self.slowed != 0)
+        acceleration[boosted] *= 3
+        acceleration[slowed] *= 0.2
+        self.boosted[boosted] = np.maximum(self.boosted[boosted] - delta_time, 0.0)
+        self.slowed[slowed] = np.maximum(self.slowed[slowed] - delta_time, 0.0)
+
+        enabled = self.disabled == 0
+
+        # Steering, VehicleState.turn_left / turn_right
+        factor = self.compute_steer_factor()
+        turning = enabled & (left | right) & (factor != 0.0)
+        sign = np.where(self.speed >= 0.0, 1.0, -1.0)
+        angle = np.where(left, -1.0, 1.0) * VehicleState.TURN_SPEED * delta_time * factor * sign
+        angle[~turning] = 0.0
+        c, s = np.cos(angle), np.sin(angle)
+        self.dir_x, self.dir_z = c * self.dir_x - s * self.dir_z, s * self.dir_x + c * self.dir_z
+        self.steering_angle = np.where(turning, np.where(left, 0.6, -0.6) * factor, np.where(enabled, 0.0, self.steering_angle))
+
+        # Throttle and brake
+        accelerating = enabled & up
+        braking = enabled & ~up & down
+        self.speed[accelerating] += acceleration[accelerating] * delta_time
+        braking_forward = braking & (self.speed > 0)
+        self.speed[braking_forward] -= acceleration[braking_forward] * 2 * delta_time
+        braking_back = braking & ~braking_forward
+        self.speed[braking_back] -= acceleration[braking_back] * delta_time
+        self.auto_decelerate(delta_time, ~(accelerating | braking))
+
+        self.disabled[~enabled] = np.maximum(self.disabled[~enabled] - delta_time, 0.0)
+
+        length = np.hypot(self.dir_x, self.dir_z)
+        self.dir_x /= length
+        self.dir_z /= length
+        self.move(delta_time)
+
+    def compute_steer_factor(self):
+        v = np.abs(self.speed)
+        ratio = np.minimum(v / VehicleState.MAX_SPEED, 1.0) ** VehicleState.STEER_RESPONSE_EXP
+        factor = VehicleState.STEER_MIN_FACTOR + ratio * (VehicleState.STEER_MAX_FACTOR - VehicleState.STEER_MIN_FACTOR)
+        return np.where(v <= VehicleState.STEER_MIN_SPEED, 0.0, factor)
+
+    def auto_decelerate(self, delta_time, mask):
+        forward = mask & (self.speed > 0)
+        self.speed[forward] = np.maximum(self.speed[forward] - VehicleState.ACCELERATION * delta_time * 2, 0.0)
+        backward = mask & (self.speed < 0)
+        self.speed[backward] = np.minimum(self.speed[backward] + VehicleState.ACCELERATION * delta_time, 0.0)
+
+    def move(self, delta_time):
+        np.clip(self.speed, VehicleState.MIN_SPEED, VehicleState.MAX_SPEED, out=self.speed)
+        self.x += self.dir_x * self.speed * delta_time
+        self.z += self.dir_z * self.speed * delta_time
+
+    # -------------------------------------------- Walls --------------------------------------------
+    def set_track(self, track):
+        '''
+        Copies Track.collision_table into one array of shape (tiles + 1, 2, 3): two (nx, ny, d) walls per track tile,
+        in Physics3D's order, by tile ID (tile_ids, sorted, to look them up with searchsorted), then a row without
+        walls for everywhere else. Missing walls get d = -inf, which never collides.
+        '''
+        self.grid_size = track.grid_size
+        self.tile_size = track.tile_size
+        self.tile_ids = np.array(sorted(track.tile_rows), dtype=np.int64)
+        self.walls = np.zeros((len(self.tile_ids) + 1, 2, 3))
+        self.walls[:, :, 2] = -np.inf
+        for i, tile_id in enumerate(self.tile_ids):
+            for n, wall in enumerate(track.collision_table[track.tile_rows[tile_id]]):
+                self.walls[i, n] = wall
+
+    def enforce_track_bounds(self):
+        ''' Physics3D's wall check at each car's current position, set_track() must have been called '''
+        grid_x, grid_y = self.z, self.x # Note the swap: car's z is track's x
+        tile_x = np.floor_divide(grid_x, self.tile_size).astype(np.int64)
+        tile_y = np.floor_divide(grid_y, self.tile_size).astype(np.int64)
+        on_grid = (tile_x >= 0) & (tile_x < self.grid_size) & (tile_y >= 0) & (tile_y < self.grid_size)
+        tile_id = tile_y * self.grid_size + tile_x
+        row = np.minimum(np.searchsorted(self.tile_ids, tile_id), len(self.tile_ids) - 1)
+        on_track = on_grid & (self.tile_ids[row] == tile_id)
+        walls = self.walls[np.where(on_track, row, len(self.tile_ids))]
+
+        # clearance from each wall, the first wall the hitbox overlaps is the one collided with
+        clearance = walls[:, :, 0] * grid_x[:, None] + walls[:, :, 1] * grid_y[:, None] - walls[:, :, 2]
+        hits = clearance < self.hitbox_size
+        first = np.where(hits[:, 0], 0, 1)
+        hit = hits[:, 0] | hits[:, 1]
+        wall = walls[np.arange(self.count), first]
+        self.collide(hit, wall[:, 0], wall[:, 1])
+        return hit
+
+    def collide(self, mask, grid_norm_x, grid_norm_y):
+        ''' Physics3D.collide for the cars in mask, with (unit) wall normals in grid (x,y) '''
+        nz, nx = grid_norm_x[mask], grid_norm_y[mask] # Note: car's (z,x) corresponds to track's (x,y)
+        dir_x, dir_z, speed = self.dir_x[mask], self.dir_z[mask], self.speed[mask]
+        dot = dir_x * nx + dir_z * nz
+
+        impact = np.abs(dot)
+        hard = (speed > 0.6 * VehicleState.MAX_SPEED) & (impact > 0.15)
+        loss_fraction = 0.12 + 0.18 * impact
+        speed = np.where(hard, np.maximum(VehicleState.MIN_SPEED, speed * (1.0 - loss_fraction)), speed)
+
+        dir_x = dir_x - 2 * dot * nx
+        dir_z = dir_z - 2 * dot * nz
+        length = np.hypot(dir_x, dir_z)
+        length[length == 0] = 1.0
+
+        self.dir_x[mask] = dir_x / length
+        self.dir_z[mask] = dir_z / length
+        self.speed[mask] = speed
+        self.x[mask] += nx * 2
+        self.z[mask] += nz * 2
+
+    # -------------------------------------------- Other cars --------------------------------------------
+    def collide_cars(self):
+        '''
+        CarCollisions.collide_cars for every overlapping pair found by CarCollisions.sweep_and_prune. A car touching
+        several others gets the sum of their impulses and the speed loss of its most head-on hit. Returns the pair count.
+        '''
+        i, j = CarCollisions.sweep_and_prune(self.x, self.z, self.hitbox_size)
+        pairs = len(i)
+        if pairs == 0:
+            return 0
+        dx, dz = self.x[i] - self.x[j], self.z[i] - self.z[j]
+        distance = np.hypot(dx, dz)
+        apart = distance > 0.0
+        safe = np.where(apart, distance, 1.0)
+        nx = np.where(apart, dx / safe, -self.dir_x[i]) # right on top of each other, back car i off
+        nz = np.where(apart, dz / safe, -self.dir_z[i])
+
+        push = (2.0 * self.hitbox_size - distance) * 0.5
+        np.add.at(self.x, i, nx * push)
+        np.add.at(self.z, i, nz * push)
+        np.subtract.at(self.x, j, nx * push)
+        np.subtract.at(self.z, j, nz * push)
+
+        vx, vz = self.dir_x * self.speed, self.dir_z * self.speed
+        approach = (vx[i] - vx[j]) * nx + (vz[i] - vz[j]) * nz
+        hit = approach < 0.0
+        if not hit.any():
+            return pairs
+        i, j, nx, nz = i[hit], j[hit], nx[hit], nz[hit]
+        impulse = (1.0 + CarCollisions.RESTITUTION) * approach[hit] * 0.5
+        dvx, dvz = np.zeros(self.count), np.zeros(self.count)
+        np.subtract.at(dvx, i, impulse * nx)
+        np.subtract.at(dvz, i, impulse * nz)
+        np.add.at(dvx, j, impulse * nx)
+        np.add.at(dvz, j, impulse * nz)
+        impact = np.zeros(self.count)
+        np.maximum.at(impact, i, np.abs(self.dir_x[i] * nx + self.dir_z[i] * nz))
+        np.maximum.at(impact, j, np.abs(self.dir_x[j] * nx + self.dir_z[j] * nz))
+
+        cars = np.union1d(i, j)
+        vx, vz = vx[cars] + dvx[cars], vz[cars] + dvz[cars]
+        speed = np.hypot(vx, vz)
+        speed = np.where(vx * self.dir_x[cars] + vz * self.dir_z[cars] < 0.0, -speed, speed) # pushed backwards: roll back
+        moving = speed != 0.0
+        safe = np.where(moving, speed, 1.0)
+        self.dir_x[cars] = np.where(moving, vx / safe, self.dir_x[cars])
+        self.dir_z[cars] = np.where(moving, vz / safe, self.dir_z[cars])
+
+        hard = (speed > CarCollisions.HARD_HIT_SPEED * VehicleState.MAX_SPEED) & (impact[cars] > CarCollisions.HARD_HIT_IMPACT)
+        loss_fraction = 0.12 + 0.18 * impact[cars]
+        self.speed[cars] = np.where(hard, np.maximum(VehicleState.MIN_SPEED, speed * (1.0 - loss_fraction)), speed)
+        return pairs
+
+    def step(self, delta_time, left, right, up, down):
+        ''' One simulation step for every car: drive, bounce off each other, then keep them on the track '''
+        self.update(delta_time, left, right, up, down)
+        if self.car_collisions:
+            self.collide_cars()
+        if self.walls is not None:
+            self.enforce_track_bounds()